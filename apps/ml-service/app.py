@@ -2,6 +2,9 @@
 """
 Face Recognition Service - MVC Architecture
 Main application entry point using Model-View-Controller pattern
+
+Runs Flask's single-process development server. For production use the
+pre-fork server: gunicorn -c gunicorn.conf.py wsgi:app
 """
 
 from views import create_app
@@ -13,12 +16,29 @@ def main():
     print("Starting Face Recognition Service")
     print("Available endpoints:")
     print("  GET  /health               - Health check")
+    print("  GET  /health/live          - Liveness probe")
+    print("  GET  /health/ready         - Readiness probe with model load progress")
     print("  POST /detect_faces         - Detect faces in image")
     print("  POST /recognize_faces      - Recognize faces in image")
-    print("  POST /dataset/add          - Add person to dataset")
+    print("  POST /recognize_faces/batch - Recognize faces in multiple images")
+    print("  POST /stream/recognize     - Tracked recognition over a video file or stream")
+    print("  GET  /attendance/<session> - Deduplicated presences of an attendance session")
+    print("  POST /attendance/flush     - Export presences changed since the last flush")
+    print("  POST /dataset/add          - Add person to dataset (background job)")
     print("  GET  /dataset/list         - List dataset contents")
-    print("  POST /dataset/recompute    - Recompute all embeddings")
+    print("  POST /dataset/recompute    - Recompute all embeddings (background job)")
+    print("  DELETE /dataset/<name>     - Delete a person (background job)")
+    print("  DELETE /dataset/<name>/images/<file> - Remove one image (background job)")
+    print("  PUT  /dataset/<name>/images/<file> - Replace one image (background job)")
+    print("  POST /dataset/<name>/rename - Rename a person (background job)")
+    print("  GET  /gallery/version      - Gallery version")
+    print("  GET  /gallery/snapshot     - Download the gallery snapshot")
+    print("  POST /gallery/snapshot     - Import a gallery snapshot")
+    print("  GET  /gallery/delta        - Gallery changes since ?since=<version>")
+    print("  POST /gallery/delta        - Apply a gallery delta")
+    print("  GET  /jobs/<id>            - Background job status")
     print("  GET  /metrics              - Prometheus metrics")
+    print("  Recognition and dataset routes take ?group=<id> to use a per-group gallery")
     print("-" * 50)
     
     # Run the application
@@ -0,0 +1 @@
+"""Offline benchmarks for the ml-service hot paths"""
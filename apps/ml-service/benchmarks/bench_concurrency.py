@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Inference load benchmark: throughput as pool sessions and ONNX threads scale.
+
+Requires the InsightFace model files to be present locally. Pass --image
+with a real photo to include recognition work; the default synthetic
+frame exercises detection only.
+
+Run from apps/ml-service:
+    python -m benchmarks.bench_concurrency --configs 1x4 2x2 4x1 --clients 8
+"""
+
+import argparse
+import threading
+import time
+from typing import Dict, List
+
+import cv2
+import numpy as np
+
+from config import get_config
+from models.session_pool import ModelSessionPool, create_face_analysis
+
+def load_image(path: str) -> np.ndarray:
+    if path:
+        image = cv2.imread(path)
+        if image is None:
+            raise SystemExit(f"Could not read image {path}")
+        return image
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 255, size=(720, 1280, 3), dtype=np.uint8)
+
+def run_load(pool: ModelSessionPool, image: np.ndarray, clients: int, duration: float) -> Dict:
+    """Hammer the pool from client threads and report throughput and latency"""
+    latencies: List[float] = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    
+    def client():
+        local = []
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            with pool.acquire() as model:
+                model.get(image)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+    
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    begin = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - begin
+    
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "throughput_rps": len(latencies) / elapsed,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent inference scaling")
+    parser.add_argument('--configs', nargs='+', default=['1x1', '1x4', '2x2', '4x1'],
+                        help="Pool size x intra-op threads combinations")
+    parser.add_argument('--clients', nargs='+', type=int, default=[1, 4, 8])
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds per measurement")
+    parser.add_argument('--image', default='', help="Image to run inference on")
+    parser.add_argument('--pin', action='store_true', help="Pin each session's threads to its own cores")
+    args = parser.parse_args()
+    
+    image = load_image(args.image)
+    base_config = get_config()
+    
+    print(f"{'sessions':>8}{'threads':>8}{'clients':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for combination in args.configs:
+        pool_size, intra_op_threads = (int(v) for v in combination.split('x'))
+        config = type('BenchConfig', (base_config,), {
+            'MODEL_POOL_SIZE': pool_size,
+            'ORT_INTRA_OP_THREADS': intra_op_threads,
+            'ORT_SESSION_PINNING': args.pin,
+        })
+        pool = ModelSessionPool(lambda slot: create_face_analysis(config, slot), pool_size)
+        with pool.acquire() as model:
+            model.get(image)  # warm up graph initialization
+        
+        for clients in args.clients:
+            stats = run_load(pool, image, clients, args.duration)
+            print(f"{pool_size:>8}{intra_op_threads:>8}{clients:>8}{stats['throughput_rps']:>10.1f}"
+                  f"{stats['p50_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+        del pool
+
+if __name__ == '__main__':
+    main()
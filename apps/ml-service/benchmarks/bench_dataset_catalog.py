@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Dataset listing benchmark: the per-call os.listdir walk /dataset/list used
+to do vs the catalog's parallel build, page reads and mtime refresh.
+
+A synthetic dataset of empty image files is written to a temporary
+directory, or pass --dataset to measure an existing folder (for example on
+network storage, where the parallel scan matters most). The page cache is
+warm after the first walk, so local numbers understate remote latency.
+
+Run from apps/ml-service:
+    python -m benchmarks.bench_dataset_catalog --people 10000 50000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+from models.dataset_catalog import DatasetCatalog
+
+def legacy_listing(dataset_folder: str) -> int:
+    """The walk get_dataset_info did on every call before the catalog"""
+    total = 0
+    for person_name in os.listdir(dataset_folder):
+        person_path = os.path.join(dataset_folder, person_name)
+        if os.path.isdir(person_path):
+            total += len([f for f in os.listdir(person_path) if f.lower().endswith(('.jpg', '.jpeg', '.png'))])
+    return total
+
+def write_dataset(root: str, people: int, images_per_person: int) -> str:
+    dataset_folder = os.path.join(root, f"dataset_{people}")
+    for i in range(people):
+        person_folder = os.path.join(dataset_folder, f"person_{i:06d}")
+        os.makedirs(person_folder)
+        for j in range(images_per_person):
+            open(os.path.join(person_folder, f"{j}.jpg"), 'wb').close()
+    return dataset_folder
+
+def timed(fn) -> float:
+    begin = time.perf_counter()
+    fn()
+    return (time.perf_counter() - begin) * 1000
+
+def run_case(dataset_folder: str, workers: int, pages: int, page_size: int) -> Dict:
+    catalog = DatasetCatalog(dataset_folder, workers=workers, refresh_seconds=0)
+    row = {
+        "people": len(os.listdir(dataset_folder)),
+        "legacy_ms": timed(lambda: legacy_listing(dataset_folder)),
+        "build_ms": timed(lambda: len(catalog)),
+    }
+    cursor = None
+    page_ms = []
+    for _ in range(pages):
+        begin = time.perf_counter()
+        _, cursor = catalog.page(after=cursor, limit=page_size)
+        page_ms.append((time.perf_counter() - begin) * 1000)
+        if cursor is None:
+            break
+    row["page_ms"] = max(page_ms)
+    row["refresh_ms"] = timed(catalog.refresh)
+    return row
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dataset listing against the catalog")
+    parser.add_argument('--people', nargs='+', type=int, default=[10000, 50000], help="Synthetic person folders")
+    parser.add_argument('--images-per-person', type=int, default=3)
+    parser.add_argument('--dataset', help="Measure an existing dataset folder instead")
+    parser.add_argument('--workers', type=int, default=16, help="DATASET_SCAN_WORKERS")
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--page-size', type=int, default=100)
+    args = parser.parse_args()
+    
+    rows: List[Dict] = []
+    if args.dataset:
+        rows.append(run_case(args.dataset, args.workers, args.pages, args.page_size))
+    else:
+        with tempfile.TemporaryDirectory() as work_dir:
+            for people in args.people:
+                dataset_folder = write_dataset(work_dir, people, args.images_per_person)
+                rows.append(run_case(dataset_folder, args.workers, args.pages, args.page_size))
+    
+    print(f"{'people':>8}{'legacy ms':>12}{'build ms':>11}{'page ms':>10}{'refresh ms':>12}")
+    for row in rows:
+        print(f"{row['people']:>8}{row['legacy_ms']:>12.1f}{row['build_ms']:>11.1f}"
+              f"{row['page_ms']:>10.3f}{row['refresh_ms']:>12.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Detection resolution benchmark: throughput and recall of the fixed, adaptive
+and two-pass detection modes.
+
+Synthetic scenes paste face crops at known positions and sizes onto a smooth
+background, from a single webcam face up to 12 MP group photos with small
+faces, so recall is measured against exact ground truth. Face crops are cut
+from the images under --faces-dir (the dataset folder by default); without
+any, drawn placeholder faces are used, which only exercise the timing.
+
+Sample images passed with --images have no labels, so their recall is
+relative to a reference pass at the image's native resolution.
+
+Needs the InsightFace models. Run from apps/ml-service:
+    python -m benchmarks.bench_detection --faces-dir dataset --images group.jpg
+"""
+
+import argparse
+import os
+import time
+from typing import Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+from config.settings import Config, TestingConfig
+from models.detection_planner import DETECTION_MODES, DetectionPlanner
+from models.face_tracker import iou_matrix
+from models.session_pool import create_face_analysis
+
+# name, (width, height), faces, (min face px, max face px)
+SCENES = [
+    ('webcam', (640, 480), 1, (160, 240)),
+    ('portrait', (1280, 720), 2, (180, 300)),
+    ('group-1080p', (1920, 1080), 20, (32, 90)),
+    ('group-4k', (3840, 2160), 40, (28, 140)),
+    ('group-12mp', (4032, 3024), 60, (32, 180)),
+]
+
+def background(width: int, height: int, rng) -> np.ndarray:
+    small = rng.integers(40, 200, size=(max(1, height // 64), max(1, width // 64), 3), dtype=np.uint8)
+    return cv2.GaussianBlur(cv2.resize(small, (width, height)), (31, 31), 0)
+
+def drawn_face(size: int = 160) -> Tuple[np.ndarray, np.ndarray]:
+    """A crude face drawing and its face box, for timing runs without real crops"""
+    crop = np.full((size, size, 3), 90, dtype=np.uint8)
+    center = (size // 2, size // 2)
+    cv2.ellipse(crop, center, (size // 3, size * 2 // 5), 0, 0, 360, (150, 180, 220), -1)
+    for dx in (-size // 8, size // 8):
+        cv2.circle(crop, (center[0] + dx, center[1] - size // 10), size // 20, (40, 40, 40), -1)
+    cv2.ellipse(crop, (center[0], center[1] + size // 6), (size // 8, size // 20), 0, 0, 180, (60, 60, 140), 2)
+    box = np.array([size / 6, size / 10, size * 5 / 6, size * 9 / 10], dtype=np.float32)
+    return crop, box
+
+def load_face_crops(det_model, faces_dir: str, limit: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Face crops with some context around them, each with its face box in crop coordinates"""
+    crops = []
+    for root, _, files in os.walk(faces_dir):
+        for filename in sorted(files):
+            if os.path.splitext(filename)[1].lower() not in TestingConfig.ALLOWED_EXTENSIONS:
+                continue
+            image = cv2.imread(os.path.join(root, filename))
+            if image is None:
+                continue
+            bboxes, _ = det_model.detect(image, max_num=0, metric='default')
+            for x1, y1, x2, y2, _ in bboxes:
+                margin = 0.5 * max(x2 - x1, y2 - y1)
+                cx1, cy1 = int(max(0, x1 - margin)), int(max(0, y1 - margin))
+                cx2, cy2 = int(min(image.shape[1], x2 + margin)), int(min(image.shape[0], y2 + margin))
+                crops.append((image[cy1:cy2, cx1:cx2].copy(), np.array([x1 - cx1, y1 - cy1, x2 - cx1, y2 - cy1])))
+                if len(crops) >= limit:
+                    return crops
+    return crops
+
+def compose_scene(size: Tuple[int, int], faces: int, face_range: Tuple[int, int],
+                  crops: List[Tuple[np.ndarray, np.ndarray]], rng) -> Tuple[np.ndarray, np.ndarray]:
+    """Paste crops at random non-overlapping positions; returns the image and its face boxes"""
+    width, height = size
+    image = background(width, height, rng)
+    occupied = np.zeros((height, width), dtype=bool)
+    boxes = []
+    for _ in range(faces * 20):
+        if len(boxes) == faces:
+            break
+        crop, box = crops[int(rng.integers(len(crops)))]
+        scale = rng.uniform(*face_range) / max(box[2] - box[0], box[3] - box[1])
+        resized = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        h, w = resized.shape[:2]
+        if w >= width or h >= height:
+            continue
+        x, y = int(rng.integers(0, width - w)), int(rng.integers(0, height - h))
+        if occupied[y:y + h, x:x + w].any():
+            continue
+        image[y:y + h, x:x + w] = resized
+        occupied[y:y + h, x:x + w] = True
+        boxes.append(box * scale + [x, y, x, y])
+    return image, np.array(boxes, dtype=np.float32).reshape(-1, 4)
+
+def recall(found: np.ndarray, truth: np.ndarray, iou_threshold: float = 0.4) -> float:
+    if len(truth) == 0:
+        return 1.0
+    overlaps = iou_matrix(truth, found[:, :4])
+    matched = 0
+    used = np.zeros(len(found), dtype=bool)
+    for row in overlaps:
+        candidates = np.where(~used & (row >= iou_threshold))[0]
+        if candidates.size:
+            used[candidates[np.argmax(row[candidates])]] = True
+            matched += 1
+    return matched / len(truth)
+
+def planner_for(mode: str, min_face: int) -> DetectionPlanner:
+    config = type('BenchConfig', (TestingConfig,), {'DETECTION_MODE': mode, 'DETECTION_MIN_FACE_SIZE': min_face})
+    return DetectionPlanner(config)
+
+def run_case(planner: DetectionPlanner, det_model, scenes: List[Tuple[np.ndarray, np.ndarray]],
+             repeat: int) -> Dict[str, float]:
+    latencies = []
+    recalls = []
+    for image, truth in scenes:
+        for run in range(repeat + 1):
+            begin = time.perf_counter()
+            bboxes, _ = planner.detect(det_model, image)
+            if run:
+                latencies.append(time.perf_counter() - begin)
+        recalls.append(recall(bboxes, truth))
+    latencies = np.array(latencies) * 1000
+    return {
+        "recall": float(np.mean(recalls)),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "images_per_s": float(1000 / latencies.mean()),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fixed, adaptive and two-pass face detection")
+    parser.add_argument('--faces-dir', default=Config.DATASET_FOLDER,
+                        help="Images to cut face crops from for the synthetic scenes")
+    parser.add_argument('--images', nargs='*', default=[], help="Unlabelled sample photos")
+    parser.add_argument('--min-face', nargs='+', type=int, default=[24, 40, 64],
+                        help="DETECTION_MIN_FACE_SIZE values to compare")
+    parser.add_argument('--scenes-per-type', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    
+    det_model = create_face_analysis(TestingConfig).det_model
+    rng = np.random.default_rng(args.seed)
+    crops = load_face_crops(det_model, args.faces_dir, 200) if os.path.isdir(args.faces_dir) else []
+    if not crops:
+        print(f"No faces found under {args.faces_dir}; using drawn faces, recall numbers are not meaningful")
+        crops = [drawn_face()]
+    
+    suites = {}
+    for name, size, faces, face_range in SCENES:
+        suites[name] = [compose_scene(size, faces, face_range, crops, rng) for _ in range(args.scenes_per_type)]
+    for path in args.images:
+        image = cv2.imread(path)
+        if image is None:
+            print(f"Skipping unreadable image {path}")
+            continue
+        native = (int(np.ceil(image.shape[1] / 32)) * 32, int(np.ceil(image.shape[0] / 32)) * 32)
+        reference, _ = det_model.detect(image, input_size=native, max_num=0, metric='default')
+        suites[f"sample/{os.path.basename(path)}"] = [(image, reference[:, :4])]
+    
+    print(f"{'scene':<28}{'mode':<10}{'min face':>9}{'recall':>8}{'p50 ms':>9}{'p99 ms':>9}{'img/s':>8}")
+    for name, scenes in suites.items():
+        for mode in DETECTION_MODES:
+            for min_face in (args.min_face if mode != 'fixed' else [None]):
+                row = run_case(planner_for(mode, min_face or Config.DETECTION_MIN_FACE_SIZE), det_model, scenes, args.repeat)
+                label = '-' if min_face is None else str(min_face)
+                print(f"{name:<28}{mode:<10}{label:>9}{row['recall']:>8.3f}{row['p50_ms']:>9.2f}"
+                      f"{row['p99_ms']:>9.2f}{row['images_per_s']:>8.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Embedding persistence benchmark: legacy pickle vs memory-mapped store.
+
+Each load runs in a fresh process so resident and anonymous memory are
+measured in isolation. Anonymous memory is what each additional worker
+process pays; memory-mapped file pages are shared through the page cache.
+
+Run from apps/ml-service:
+    python -m benchmarks.bench_embedding_store --sizes 10000 100000
+"""
+
+import argparse
+import multiprocessing
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from models.embedding_store import EmbeddingStore
+
+def memory_kb() -> Dict[str, int]:
+    """Current RSS and anonymous (unshareable) memory of this process from /proc"""
+    usage = {"rss_kb": 0, "anon_kb": 0}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                field, value = line.split(':', 1)
+                if field == 'Rss':
+                    usage["rss_kb"] = int(value.split()[0])
+                elif field == 'Anonymous':
+                    usage["anon_kb"] = int(value.split()[0])
+    except OSError:
+        pass
+    return usage
+
+def _load_in_child(fmt: str, path: str, dtype: str, queue):
+    """Load one format, touch every embedding, and report timing and memory"""
+    before = memory_kb()
+    start = time.perf_counter()
+    if fmt == 'pickle':
+        with open(path, 'rb') as f:
+            embeddings = pickle.load(f)
+        matrix = np.array(list(embeddings.values()), dtype=np.float32)
+    else:
+        store = EmbeddingStore(path, dtype)
+        _, matrix = store.load_snapshot()
+        store.read_journal()
+    load_s = time.perf_counter() - start
+    # Touch the data the way a gallery search would
+    float(matrix[:, 0].sum() + matrix.sum())
+    after = memory_kb()
+    queue.put({
+        "load_s": load_s,
+        "rss_kb": after["rss_kb"] - before["rss_kb"],
+        "anon_kb": after["anon_kb"] - before["anon_kb"],
+    })
+
+def measure_load(fmt: str, path: str, dtype: str = 'float32') -> Dict:
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_load_in_child, args=(fmt, path, dtype, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+def run_benchmark(sizes: List[int], dim: int) -> List[Dict]:
+    rows = []
+    work_dir = tempfile.mkdtemp(prefix='bench_store_')
+    try:
+        for size in sizes:
+            rng = np.random.default_rng(0)
+            embeddings = {f"person_{i}": rng.standard_normal(dim).astype(np.float32) for i in range(size)}
+            
+            pickle_file = os.path.join(work_dir, f"embeddings_{size}.pkl")
+            start = time.perf_counter()
+            with open(pickle_file, 'wb') as f:
+                pickle.dump(embeddings, f)
+            save_s = time.perf_counter() - start
+            rows.append({"size": size, "format": "pickle", "save_s": save_s,
+                         "file_mb": os.path.getsize(pickle_file) / 2**20, **measure_load('pickle', pickle_file)})
+            
+            for dtype in ('float32', 'float16'):
+                store_dir = os.path.join(work_dir, f"store_{size}_{dtype}")
+                store = EmbeddingStore(store_dir, dtype)
+                start = time.perf_counter()
+                store.save(embeddings)
+                save_s = time.perf_counter() - start
+                file_mb = sum(os.path.getsize(os.path.join(store_dir, n)) for n in os.listdir(store_dir)) / 2**20
+                rows.append({"size": size, "format": f"store-{dtype}", "save_s": save_s,
+                             "file_mb": file_mb, **measure_load('store', store_dir, dtype)})
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark embedding persistence formats")
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 100000])
+    parser.add_argument('--dim', type=int, default=512)
+    args = parser.parse_args()
+    
+    rows = run_benchmark(args.sizes, args.dim)
+    print(f"{'size':>8}  {'format':<16}{'file MB':>9}{'save s':>9}{'load s':>9}{'RSS MB':>9}{'anon MB':>9}")
+    for row in rows:
+        print(f"{row['size']:>8}  {row['format']:<16}{row['file_mb']:>9.1f}{row['save_s']:>9.3f}{row['load_s']:>9.3f}"
+              f"{row['rss_kb'] / 1024:>9.1f}{row['anon_kb'] / 1024:>9.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Gallery index benchmark: exact GEMM scan vs IVF, recall and latency.
+
+Run from apps/ml-service:
+    python -m benchmarks.bench_gallery_index --sizes 1000 100000 1000000
+
+The 1M case needs roughly 2 GB of RAM per index.
+"""
+
+import argparse
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from models.gallery_index import ExactGalleryIndex, IVFGalleryIndex, normalize_embeddings
+
+def synthetic_gallery(size: int, dim: int, seed: int = 0) -> np.ndarray:
+    """Random unit vectors standing in for ArcFace identity embeddings"""
+    rng = np.random.default_rng(seed)
+    return normalize_embeddings(rng.standard_normal((size, dim), dtype=np.float32))
+
+def synthetic_queries(gallery: np.ndarray, count: int, noise: float, seed: int = 1):
+    """Noisy copies of random gallery rows, with the row each should match"""
+    rng = np.random.default_rng(seed)
+    targets = rng.choice(gallery.shape[0], size=count, replace=False)
+    queries = gallery[targets] + noise * rng.standard_normal((count, gallery.shape[1]), dtype=np.float32) / np.sqrt(gallery.shape[1])
+    return normalize_embeddings(queries), targets
+
+def time_search(index, queries: np.ndarray, batch_size: int, k: int):
+    """Search in request-sized batches, returning results and per-batch latencies"""
+    results = []
+    latencies = []
+    for start in range(0, queries.shape[0], batch_size):
+        batch = queries[start:start + batch_size]
+        begin = time.perf_counter()
+        results.extend(index.search(batch, k))
+        latencies.append(time.perf_counter() - begin)
+    return results, np.array(latencies) * 1000
+
+def recall_at(results: List, truth: List[str], k: int) -> float:
+    """Fraction of queries whose true identity is in the top-k results"""
+    hits = sum(1 for found, name in zip(results, truth) if name in [n for n, _ in found[:k]])
+    return hits / len(truth)
+
+def run_benchmark(sizes: List[int], dim: int, queries: int, batch_size: int, k: int,
+                  nlist: int, nprobe: int, noise: float) -> List[Dict]:
+    """Benchmark both index modes at each gallery size"""
+    rows = []
+    for size in sizes:
+        gallery = synthetic_gallery(size, dim)
+        names = [f"person_{i}" for i in range(size)]
+        embeddings = dict(zip(names, gallery))
+        query_matrix, targets = synthetic_queries(gallery, min(queries, size), noise)
+        truth = [names[i] for i in targets]
+        
+        indexes = {
+            "exact": ExactGalleryIndex(),
+            f"ivf(nlist={nlist},nprobe={nprobe})": IVFGalleryIndex(nlist=nlist, nprobe=nprobe, min_train_size=1),
+        }
+        for mode, index in indexes.items():
+            begin = time.perf_counter()
+            index.build(embeddings)
+            build_s = time.perf_counter() - begin
+            
+            results, latencies = time_search(index, query_matrix, batch_size, k)
+            rows.append({
+                "size": size,
+                "mode": mode,
+                "build_s": build_s,
+                "p50_ms": float(np.percentile(latencies, 50)),
+                "p99_ms": float(np.percentile(latencies, 99)),
+                "recall@1": recall_at(results, truth, 1),
+                f"recall@{k}": recall_at(results, truth, k),
+            })
+        del indexes, embeddings, gallery
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark gallery index search")
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 100000, 1000000])
+    parser.add_argument('--dim', type=int, default=512)
+    parser.add_argument('--queries', type=int, default=256)
+    parser.add_argument('--batch-size', type=int, default=8, help="Faces per simulated request")
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--nlist', type=int, default=1024)
+    parser.add_argument('--nprobe', type=int, default=16)
+    parser.add_argument('--noise', type=float, default=0.8, help="Query noise relative to a unit vector")
+    args = parser.parse_args()
+    
+    rows = run_benchmark(args.sizes, args.dim, args.queries, args.batch_size, args.k,
+                         args.nlist, args.nprobe, args.noise)
+    
+    recall_k = f"recall@{args.k}"
+    print(f"{'size':>9}  {'mode':<28}{'build s':>9}{'p50 ms':>9}{'p99 ms':>9}{'recall@1':>10}{recall_k:>10}")
+    for row in rows:
+        print(f"{row['size']:>9}  {row['mode']:<28}{row['build_s']:>9.2f}{row['p50_ms']:>9.3f}"
+              f"{row['p99_ms']:>9.3f}{row['recall@1']:>10.3f}{row[recall_k]:>10.3f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Identity template benchmark: accuracy and search latency of a single centroid
+vs K quality-weighted templates per person.
+
+Each synthetic person has a few appearance modes (lighting, pose, glasses).
+Enrollment images are noisy draws from those modes whose noise grows as
+their quality drops, and whose raw norms vary the way ArcFace norms do.
+Probes come from enrolled people (rank-1 accuracy, genuine scores) and from
+people who were never enrolled (impostor scores for the open-set TAR@FAR).
+
+Run from apps/ml-service:
+    python -m benchmarks.bench_identity_templates --sizes 1000 10000
+"""
+
+import argparse
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from models.gallery_index import ExactGalleryIndex, normalize_embeddings
+from models.identity_templates import build_identity_templates
+
+def synthetic_people(count: int, dim: int, modes: int, spread: float, rng) -> np.ndarray:
+    """(people, modes, dim) appearance modes scattered around each person's identity direction"""
+    identities = normalize_embeddings(rng.standard_normal((count, dim), dtype=np.float32))
+    offsets = rng.standard_normal((count, modes, dim), dtype=np.float32) * spread / np.sqrt(dim)
+    return normalize_embeddings((identities[:, None, :] + offsets).reshape(-1, dim)).reshape(count, modes, dim)
+
+def sample_images(people_modes: np.ndarray, images: int, noise: float, rng) -> Tuple[np.ndarray, np.ndarray]:
+    """Raw (people, images, dim) embeddings and (people, images) quality weights"""
+    count, modes, dim = people_modes.shape
+    quality = rng.uniform(0.2, 1.0, size=(count, images)).astype(np.float32)
+    chosen = rng.integers(0, modes, size=(count, images))
+    base = np.take_along_axis(people_modes, chosen[:, :, None], axis=1)
+    jitter = rng.standard_normal((count, images, dim), dtype=np.float32) / np.sqrt(dim)
+    embeddings = base + jitter * noise * (1.5 - quality)[:, :, None]
+    # Raw ArcFace norms grow with image quality
+    norms = 10.0 + 20.0 * quality * rng.uniform(0.5, 1.0, size=quality.shape)
+    embeddings = normalize_embeddings(embeddings.reshape(-1, dim)).reshape(count, images, dim) * norms[:, :, None]
+    return embeddings, quality
+
+def build_gallery(mode: str, enrolled: np.ndarray, quality: np.ndarray) -> Dict[str, np.ndarray]:
+    """Aggregate each person's enrollment images the way the given mode would"""
+    gallery = {}
+    for person, (images, weights) in enumerate(zip(enrolled, quality)):
+        if mode == 'legacy-mean':
+            gallery[f"person_{person}"] = images.mean(axis=0)
+        elif mode == 'centroid':
+            gallery[f"person_{person}"] = build_identity_templates(images, weights, 1)
+        else:
+            templates = int(mode.split('-')[0][1:])
+            gallery[f"person_{person}"] = build_identity_templates(images, weights, templates)
+    return gallery
+
+def tar_at_far(genuine: np.ndarray, impostor: np.ndarray, far: float) -> float:
+    """True accept rate at the threshold that admits the given false accept rate"""
+    threshold = np.quantile(impostor, 1.0 - far)
+    return float((genuine > threshold).mean())
+
+def run_case(mode: str, reduction: str, gallery: Dict[str, np.ndarray], probes: np.ndarray, truth: List[str],
+             impostors: np.ndarray, batch_size: int, far: float) -> Dict:
+    index = ExactGalleryIndex(reduction=reduction)
+    index.build(gallery)
+    
+    latencies = []
+    results = []
+    for start in range(0, len(probes), batch_size):
+        begin = time.perf_counter()
+        results.extend(index.search(probes[start:start + batch_size], k=1))
+        latencies.append(time.perf_counter() - begin)
+    impostor_scores = np.array([found[0][1] for found in index.search(impostors, k=1)])
+    
+    rank1 = np.mean([found[0][0] == name for found, name in zip(results, truth)])
+    # Open-set genuine score: the best score only counts when it is the right person
+    genuine = np.array([found[0][1] if found[0][0] == name else -1.0 for found, name in zip(results, truth)])
+    latencies = np.array(latencies) * 1000
+    return {
+        "mode": mode if mode in ('legacy-mean', 'centroid') else f"{mode}-{reduction}",
+        "rows": index.row_count,
+        "rank1": float(rank1),
+        "tar": tar_at_far(genuine, impostor_scores, far),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+def run_benchmark(sizes: List[int], dim: int, modes: int, images: int, templates: List[int], probes: int,
+                  batch_size: int, spread: float, noise: float, far: float, seed: int) -> List[Dict]:
+    rows = []
+    for size in sizes:
+        rng = np.random.default_rng(seed)
+        people_modes = synthetic_people(size + probes, dim, modes, spread, rng)
+        enrolled, quality = sample_images(people_modes[:size], images, noise, rng)
+        
+        probe_people = rng.choice(size, size=probes, replace=size < probes)
+        probe_images, _ = sample_images(people_modes[probe_people], 1, noise, rng)
+        impostor_images, _ = sample_images(people_modes[size:], 1, noise, rng)
+        truth = [f"person_{person}" for person in probe_people]
+        
+        cases = [('legacy-mean', 'max'), ('centroid', 'max')]
+        for k in templates:
+            cases.extend([(f"k{k}-templates", 'max'), (f"k{k}-templates", 'mean')])
+        galleries = {}
+        for mode, reduction in cases:
+            if mode not in galleries:
+                galleries[mode] = build_gallery(mode, enrolled, quality)
+            row = run_case(mode, reduction, galleries[mode], probe_images[:, 0], truth,
+                           impostor_images[:, 0], batch_size, far)
+            row["size"] = size
+            rows.append(row)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark single-centroid vs multi-template identities")
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000], help="Enrolled people")
+    parser.add_argument('--dim', type=int, default=512)
+    parser.add_argument('--modes', type=int, default=3, help="Appearance modes per person")
+    parser.add_argument('--images', type=int, default=8, help="Enrollment images per person")
+    parser.add_argument('--templates', nargs='+', type=int, default=[3, 5])
+    parser.add_argument('--probes', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=8, help="Faces per simulated request")
+    parser.add_argument('--spread', type=float, default=3.0, help="Distance between a person's modes")
+    parser.add_argument('--noise', type=float, default=2.0, help="Per-image noise at the lowest quality")
+    parser.add_argument('--far', type=float, default=0.01)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    
+    rows = run_benchmark(args.sizes, args.dim, args.modes, args.images, args.templates, args.probes,
+                         args.batch_size, args.spread, args.noise, args.far, args.seed)
+    
+    tar = f"TAR@{args.far:g}"
+    print(f"{'size':>7}  {'mode':<20}{'rows':>9}{'rank-1':>9}{tar:>11}{'p50 ms':>9}{'p99 ms':>9}")
+    for row in rows:
+        print(f"{row['size']:>7}  {row['mode']:<20}{row['rows']:>9}{row['rank1']:>9.3f}{row['tar']:>11.3f}"
+              f"{row['p50_ms']:>9.3f}{row['p99_ms']:>9.3f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Upload decode benchmark: temp-file round trip vs in-memory decoding.
+
+Run from apps/ml-service:
+    python -m benchmarks.bench_image_decode --iterations 200
+"""
+
+import argparse
+import io
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+import cv2
+import numpy as np
+from werkzeug.datastructures import FileStorage
+from werkzeug.utils import secure_filename
+
+from utils import decode_image
+
+def make_jpeg(width: int, height: int, quality: int = 90) -> bytes:
+    """Create a synthetic JPEG with enough structure to be representative"""
+    rng = np.random.default_rng(0)
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    image = np.repeat(np.repeat(gradient, height, axis=0), 3, axis=2)
+    image += rng.normal(0, 20, size=image.shape).astype(np.float32)
+    image = np.clip(image, 0, 255).astype(np.uint8)
+    _, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes()
+
+def temp_file_path(upload_folder: str) -> Callable[[FileStorage], np.ndarray]:
+    """The previous controller path: save, imread, delete"""
+    def run(image_file: FileStorage) -> np.ndarray:
+        filename = secure_filename(image_file.filename)
+        filepath = os.path.join(upload_folder, filename)
+        image_file.save(filepath)
+        image = cv2.imread(filepath)
+        os.remove(filepath)
+        return image
+    return run
+
+def in_memory_path(max_dimension=None) -> Callable[[FileStorage], np.ndarray]:
+    """The current controller path: read the stream and imdecode"""
+    def run(image_file: FileStorage) -> np.ndarray:
+        image, _ = decode_image(image_file.read(), max_dimension)
+        return image
+    return run
+
+def measure(fn: Callable[[FileStorage], np.ndarray], payload: bytes, iterations: int) -> Dict[str, float]:
+    """Return latency percentiles and peak allocation per call"""
+    latencies = []
+    for _ in range(iterations):
+        image_file = FileStorage(stream=io.BytesIO(payload), filename='frame.jpg')
+        start = time.perf_counter()
+        fn(image_file)
+        latencies.append(time.perf_counter() - start)
+    
+    tracemalloc.start()
+    image_file = FileStorage(stream=io.BytesIO(payload), filename='frame.jpg')
+    tracemalloc.reset_peak()
+    fn(image_file)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "peak_alloc_kb": peak / 1024,
+    }
+
+def run_benchmark(sizes: List[str], iterations: int, max_dimension: int) -> List[Dict]:
+    """Benchmark every decode path for each image size"""
+    results = []
+    upload_folder = tempfile.mkdtemp(prefix='bench_uploads_')
+    try:
+        paths = {
+            "temp_file": temp_file_path(upload_folder),
+            "in_memory": in_memory_path(),
+            f"in_memory_reduced_{max_dimension}": in_memory_path(max_dimension),
+        }
+        for size in sizes:
+            width, height = (int(v) for v in size.split('x'))
+            payload = make_jpeg(width, height)
+            for name, fn in paths.items():
+                stats = measure(fn, payload, iterations)
+                results.append({"size": size, "path": name, **stats})
+    finally:
+        shutil.rmtree(upload_folder, ignore_errors=True)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark upload image decoding")
+    parser.add_argument('--sizes', nargs='+', default=['640x480', '1920x1080', '4000x3000'])
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--max-dimension', type=int, default=1280)
+    args = parser.parse_args()
+    
+    results = run_benchmark(args.sizes, args.iterations, args.max_dimension)
+    
+    print(f"{'size':<12}{'path':<28}{'p50 ms':>10}{'p99 ms':>10}{'peak KiB':>12}")
+    for row in results:
+        print(f"{row['size']:<12}{row['path']:<28}{row['p50_ms']:>10.2f}{row['p99_ms']:>10.2f}{row['peak_alloc_kb']:>12.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Quantized gallery benchmark: memory, recall and latency of float16, int8 and
+PQ codes against the float32 exact scan.
+
+The gallery is written to a .npy file and memory-mapped, the way the
+embedding store serves it, so re-rank references are mapped pages and the
+reported memory is what the index holds on the heap. Recall@1 is the share
+of probes whose top match equals the float32 index's top match; the score
+error is the largest difference between the two top-1 similarities.
+
+Run from apps/ml-service:
+    python -m benchmarks.bench_quantized_index --sizes 10000 100000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from models.gallery_index import ExactGalleryIndex, QuantizedGalleryIndex, normalize_embeddings
+from models.quantization import CODECS, create_codec
+
+def synthetic_gallery(size: int, dim: int, clusters: int, rng) -> np.ndarray:
+    """Unit embeddings scattered around a few shared directions, like faces of similar people"""
+    centers = normalize_embeddings(rng.standard_normal((clusters, dim), dtype=np.float32))
+    offsets = rng.standard_normal((size, dim), dtype=np.float32) / np.sqrt(dim)
+    return normalize_embeddings(centers[rng.integers(0, clusters, size)] * 0.5 + offsets)
+
+def run_case(label: str, index, names: List[str], matrix: np.ndarray, probes: np.ndarray,
+             reference: List[str], reference_scores: np.ndarray, batch_size: int) -> Dict:
+    begin = time.perf_counter()
+    index.build_from_matrix(names, matrix)
+    build_s = time.perf_counter() - begin
+    
+    latencies = []
+    results = []
+    for start in range(0, len(probes), batch_size):
+        begin = time.perf_counter()
+        results.extend(index.search(probes[start:start + batch_size], k=1))
+        latencies.append(time.perf_counter() - begin)
+    latencies = np.array(latencies) * 1000
+    top = [found[0] for found in results]
+    return {
+        "mode": label,
+        "mb": index.nbytes / 2 ** 20,
+        "recall": float(np.mean([name == expected for (name, _), expected in zip(top, reference)])),
+        "error": float(np.max(np.abs(np.array([score for _, score in top]) - reference_scores))),
+        "build_s": build_s,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+def run_benchmark(sizes: List[int], dim: int, clusters: int, probes: int, noise: float, batch_size: int,
+                  rerank: List[int], pq_subspaces: int, seed: int) -> List[Dict]:
+    rows = []
+    for size in sizes:
+        rng = np.random.default_rng(seed)
+        gallery = synthetic_gallery(size, dim, clusters, rng)
+        names = [f"person_{i}" for i in range(size)]
+        targets = rng.integers(0, size, probes)
+        jitter = rng.standard_normal((probes, dim), dtype=np.float32) * noise / np.sqrt(dim)
+        queries = normalize_embeddings(gallery[targets] + jitter)
+        
+        with tempfile.TemporaryDirectory() as work_dir:
+            path = os.path.join(work_dir, 'gallery.npy')
+            np.save(path, gallery)
+            matrix = np.load(path, mmap_mode='r')
+            
+            baseline = ExactGalleryIndex()
+            baseline.build_from_matrix(names, np.asarray(matrix))
+            exact = [found[0] for found in baseline.search(queries, k=1)]
+            reference = [name for name, _ in exact]
+            reference_scores = np.array([score for _, score in exact])
+            
+            cases = [('float32', ExactGalleryIndex())]
+            for codec in CODECS:
+                for candidates in rerank:
+                    index = QuantizedGalleryIndex(create_codec(codec, pq_subspaces=pq_subspaces), rerank=candidates)
+                    cases.append((f"{codec}/rerank={candidates}", index))
+            for label, index in cases:
+                row = run_case(label, index, names, matrix, queries, reference, reference_scores, batch_size)
+                row["size"] = size
+                rows.append(row)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark quantized gallery codes against the float32 scan")
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 100000], help="Gallery identities")
+    parser.add_argument('--dim', type=int, default=512)
+    parser.add_argument('--clusters', type=int, default=64)
+    parser.add_argument('--probes', type=int, default=1000)
+    parser.add_argument('--noise', type=float, default=0.6, help="Probe distance from its gallery embedding")
+    parser.add_argument('--batch-size', type=int, default=8, help="Faces per simulated request")
+    parser.add_argument('--rerank', nargs='+', type=int, default=[0, 32], help="GALLERY_RERANK_CANDIDATES values")
+    parser.add_argument('--pq-subspaces', type=int, default=64)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    
+    rows = run_benchmark(args.sizes, args.dim, args.clusters, args.probes, args.noise, args.batch_size,
+                         args.rerank, args.pq_subspaces, args.seed)
+    
+    print(f"{'size':>8}  {'mode':<20}{'MB':>9}{'recall@1':>10}{'max err':>9}{'build s':>9}{'p50 ms':>9}{'p99 ms':>9}")
+    for row in rows:
+        print(f"{row['size']:>8}  {row['mode']:<20}{row['mb']:>9.1f}{row['recall']:>10.4f}{row['error']:>9.4f}"
+              f"{row['build_s']:>9.2f}{row['p50_ms']:>9.3f}{row['p99_ms']:>9.3f}")
+
+if __name__ == '__main__':
+    main()
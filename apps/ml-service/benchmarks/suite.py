@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark suite for the ml-service hot paths, with baseline comparison.
+
+Everything runs on CPU from synthetic data in a temporary directory; nothing
+is downloaded. Cases that need the InsightFace model files are skipped when
+the models are not already present locally.
+
+Run from apps/ml-service:
+    python -m benchmarks.suite --output bench.json
+    python -m benchmarks.suite --baseline bench.json --threshold 0.15
+
+With --baseline the run exits non-zero if any case's median is more than
+--threshold slower than the baseline's.
+"""
+
+import argparse
+import io
+import json
+import os
+import pickle
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from config.settings import TestingConfig
+from models.embedding_store import EmbeddingStore
+from models.gallery_index import normalize_embeddings
+from utils import decode_image
+
+MODEL_DIR = os.path.expanduser(os.path.join('~', '.insightface', 'models', 'buffalo_l'))
+
+def measure(fn: Callable[[], object], repeat: int, warmup: int = 1) -> Dict:
+    """Time fn over several runs and summarize the latencies in milliseconds"""
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - begin) * 1000)
+    latencies = np.array(latencies)
+    return {
+        "median_ms": float(np.median(latencies)),
+        "p90_ms": float(np.percentile(latencies, 90)),
+        "min_ms": float(latencies.min()),
+        "runs": repeat,
+    }
+
+def models_available() -> bool:
+    """True when insightface is importable and its model files are already on disk"""
+    try:
+        import insightface  # noqa: F401
+    except ImportError:
+        return False
+    return os.path.isdir(MODEL_DIR)
+
+def synthetic_photo(width: int, height: int, seed: int = 0) -> np.ndarray:
+    """Smooth random image that compresses like a photo rather than noise"""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 255, size=(height // 16, width // 16, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(cv2.resize(small, (width, height)), (5, 5), 0)
+
+def synthetic_embeddings(size: int, dim: int = 512, seed: int = 0) -> Dict[str, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    matrix = normalize_embeddings(rng.standard_normal((size, dim), dtype=np.float32))
+    return {f"person_{i}": matrix[i] for i in range(size)}
+
+def bench_decode(results: Dict, repeat: int):
+    for width, height in [(640, 480), (1920, 1080), (4032, 3024)]:
+        data = cv2.imencode('.jpg', synthetic_photo(width, height))[1].tobytes()
+        results[f"decode/{width}x{height}"] = measure(lambda: decode_image(data, None), repeat)
+        results[f"decode/{width}x{height}/max1280"] = measure(lambda: decode_image(data, 1280), repeat)
+
+def bench_matching(results: Dict, repeat: int, sizes: List[int]):
+    from models.face_model import FaceModel
+    face_model = FaceModel('testing')
+    rng = np.random.default_rng(1)
+    for size in sizes:
+        with face_model.galleries.use() as gallery:
+            gallery.dataset_embeddings = synthetic_embeddings(size)
+            gallery.rebuild_index()
+        for faces in (1, 8):
+            queries = list(rng.standard_normal((faces, 512), dtype=np.float32))
+            results[f"match/gallery={size}/faces={faces}"] = measure(
+                lambda: face_model._find_best_matches_batch(queries, face_model.config.RECOGNITION_THRESHOLD),
+                repeat
+            )
+        # Two faces close to each of 8 people, so every image needs the one-to-one assignment
+        with face_model.galleries.use() as gallery:
+            people = rng.choice(size, size=min(8, size), replace=False).repeat(2)
+            targets = np.array([gallery.dataset_embeddings[f"person_{i}"] for i in people])
+        crowd = list(targets + 0.02 * rng.standard_normal(targets.shape, dtype=np.float32))
+        results[f"match/gallery={size}/faces=16/one_to_one"] = measure(
+            lambda: face_model._find_best_matches_batch(crowd, face_model.config.RECOGNITION_THRESHOLD),
+            repeat
+        )
+
+def bench_persistence(results: Dict, repeat: int, sizes: List[int], work_dir: str):
+    for size in sizes:
+        embeddings = synthetic_embeddings(size)
+        pickle_path = os.path.join(work_dir, f"embeddings-{size}.pkl")
+        store = EmbeddingStore(os.path.join(work_dir, f"store-{size}"), 'float32')
+        
+        def save_pickle():
+            with open(pickle_path, 'wb') as f:
+                pickle.dump(embeddings, f)
+        
+        def load_pickle():
+            with open(pickle_path, 'rb') as f:
+                return pickle.load(f)
+        
+        results[f"persist/pickle_save/gallery={size}"] = measure(save_pickle, repeat)
+        results[f"persist/pickle_load/gallery={size}"] = measure(load_pickle, repeat)
+        results[f"persist/store_save/gallery={size}"] = measure(lambda: store.save(embeddings), repeat)
+        results[f"persist/store_load/gallery={size}"] = measure(store.load_snapshot, repeat)
+
+def bench_model(results: Dict, repeat: int, dataset_people: int, images_per_person: int):
+    from models.face_model import FaceModel
+    face_model = FaceModel('testing')
+    if not face_model.initialize_model():
+        raise RuntimeError("Face model failed to initialize")
+    
+    image = synthetic_photo(1280, 720)
+    results["model/get/1280x720"] = measure(lambda: face_model.face_analysis_model.get(image), repeat)
+    results["model/detect/1280x720"] = measure(lambda: face_model.detect_face_objects(image), repeat)
+    
+    # Synthetic dataset; force=True so every run embeds every image
+    dataset_folder = face_model.galleries.peek().dataset_folder
+    for p in range(dataset_people):
+        person_folder = os.path.join(dataset_folder, f"person_{p}")
+        os.makedirs(person_folder, exist_ok=True)
+        for i in range(images_per_person):
+            cv2.imwrite(os.path.join(person_folder, f"{i}.jpg"), synthetic_photo(640, 480, seed=p * 1000 + i))
+    results[f"model/compute_dataset/{dataset_people * images_per_person}_images"] = measure(
+        lambda: face_model.compute_dataset_embeddings(force=True), max(1, repeat // 5), warmup=0
+    )
+    return face_model
+
+def bench_flask(results: Dict, repeat: int):
+    from views import create_app
+    client = create_app('testing').test_client()
+    data = cv2.imencode('.jpg', synthetic_photo(1280, 720))[1].tobytes()
+    
+    def post(path: str):
+        response = client.post(path, data={'image': (io.BytesIO(data), 'bench.jpg')},
+                               content_type='multipart/form-data')
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}: {response.get_data(as_text=True)}")
+    
+    results["flask/health"] = measure(lambda: client.get('/health'), repeat)
+    results["flask/detect_faces"] = measure(lambda: post('/detect_faces'), repeat)
+    results["flask/detect_faces/bbox"] = measure(lambda: post('/detect_faces?profile=bbox'), repeat)
+    results["flask/recognize_faces"] = measure(lambda: post('/recognize_faces'), repeat)
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Print the comparison table and return the names of regressed cases"""
+    regressions = []
+    print(f"{'case':<48}{'median ms':>11}{'baseline':>11}{'change':>9}")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<48}{result['median_ms']:>11.3f}{'-':>11}{'new':>9}")
+            continue
+        change = result['median_ms'] / base['median_ms'] - 1 if base['median_ms'] else 0.0
+        flag = "  REGRESSION" if change > threshold else ""
+        print(f"{name:<48}{result['median_ms']:>11.3f}{base['median_ms']:>11.3f}{change:>+9.1%}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the offline ml-service benchmark suite")
+    parser.add_argument('--output', help="Write results as JSON to this path")
+    parser.add_argument('--baseline', help="Compare against a previous --output file")
+    parser.add_argument('--threshold', type=float, default=0.15, help="Allowed median slowdown, e.g. 0.15 = 15%%")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--gallery-sizes', nargs='+', type=int, default=[100, 10000, 100000])
+    parser.add_argument('--dataset-people', type=int, default=10)
+    parser.add_argument('--images-per-person', type=int, default=5)
+    parser.add_argument('--skip-model', action='store_true', help="Skip cases that need the InsightFace models")
+    args = parser.parse_args()
+    
+    # Time the full pipeline on every run rather than cache hits
+    TestingConfig.RESULT_CACHE_ENABLED = False
+    TestingConfig.MATCH_CACHE_SIZE = 0
+    
+    # Config paths are relative, so run inside a scratch directory
+    origin = os.getcwd()
+    work_dir = tempfile.mkdtemp(prefix='ml-bench-')
+    results: Dict[str, Dict] = {}
+    skipped: List[str] = []
+    try:
+        os.chdir(work_dir)
+        bench_decode(results, args.repeat)
+        bench_matching(results, args.repeat, args.gallery_sizes)
+        bench_persistence(results, max(1, args.repeat // 4), args.gallery_sizes, work_dir)
+        
+        if args.skip_model or not models_available():
+            skipped.extend(["model", "flask"])
+            print(f"Skipping model and Flask cases: InsightFace models not found in {MODEL_DIR}")
+        else:
+            bench_model(results, args.repeat, args.dataset_people, args.images_per_person)
+            bench_flask(results, args.repeat)
+    finally:
+        os.chdir(origin)
+        shutil.rmtree(work_dir, ignore_errors=True)
+    
+    report = {
+        "meta": {
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "skipped": skipped,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    
+    baseline: Optional[Dict] = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    
+    regressions = compare(results, baseline or {}, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} case(s) regressed by more than {args.threshold:.0%}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
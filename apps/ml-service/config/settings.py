@@ -6,26 +6,153 @@ class Config:
     HOST = '0.0.0.0'
     PORT = 5001
     DEBUG = False
+    SERVER_WORKERS = 1  # Pre-fork worker processes (gunicorn.conf.py; WEB_CONCURRENCY overrides); cores are split between them
+    SERVER_THREADS = None  # Request threads per worker; None keeps every model session's batches full
+    SERVER_PRELOAD = True  # Load the app and default gallery once in the master, before workers fork
+    SERVER_TIMEOUT = 120  # Seconds a worker may stay busy on one request before it is restarted
     
     # Directory settings
     DATASET_FOLDER = 'dataset'
     UPLOAD_FOLDER = 'uploads'
-    EMBEDDINGS_FILE = 'dataset_embeddings.pkl'
+    VIDEO_FOLDER = 'videos'
+    EMBEDDINGS_FILE = 'dataset_embeddings.pkl'  # Legacy pickle, migrated into the store on load
+    EMBEDDINGS_STORE_DIR = 'embeddings_store'
+    EMBEDDING_CACHE_FILE = 'embedding_cache.pkl'
+    GROUPS_FOLDER = 'groups'  # Per-group galleries, each with its own dataset, store and cache
     
     # Face recognition settings
     RECOGNITION_THRESHOLD = 0.6
     DETECTION_SIZE = (640, 640)
     
+    # Detection resolution settings
+    DETECTION_MODE = 'fixed'  # 'fixed' (DETECTION_SIZE), 'adaptive' (per-image size) or 'two_pass' (coarse, then refine regions)
+    DETECTION_MIN_FACE_SIZE = 40  # Smallest face to find, in source image pixels (adaptive modes)
+    DETECTION_MIN_FACE_INPUT = 16  # Face size in detector input pixels the model finds reliably
+    DETECTION_MIN_INPUT = 128  # Bounds on the long side of an adaptive detector input
+    DETECTION_MAX_INPUT = 1920
+    DETECTION_SIZE_STEP = 128  # Adaptive sizes are rounded up to this so few distinct shapes reach the runtime
+    DETECTION_COARSE_THRESHOLD = 0.3  # Detector score that marks a candidate region in the coarse pass
+    DETECTION_REGION_MARGIN = 2.0  # Candidate boxes grow by this many face sizes on each side before refinement
+    DETECTION_REGION_MAX_FRACTION = 0.5  # Above this share of the image, refine the whole image in one pass
+    
+    # Dataset catalog settings
+    DATASET_SCAN_WORKERS = 16  # Threads scanning person folders in parallel; helps most on network storage
+    DATASET_CATALOG_REFRESH_SECONDS = 60  # Poll folder mtimes for changes made outside this process; 0 disables
+    DATASET_LIST_PAGE_SIZE = 100  # People per /dataset/list page unless 'limit' is given
+    DATASET_LIST_MAX_PAGE_SIZE = 1000
+    
+    # Embedding store settings
+    EMBEDDINGS_STORE_DTYPE = 'float32'  # 'float32' or 'float16' on disk
+    EMBEDDINGS_JOURNAL_COMPACT_THRESHOLD = 1000  # Journal entries before writing a new snapshot
+    
+    # Gallery index settings
+    GALLERY_INDEX_MODE = 'exact'  # 'exact' (GEMM scan) or 'ivf' (approximate)
+    GALLERY_INDEX_DTYPE = 'float32'  # Exact scan codes: 'float32', 'float16', 'int8' (1/4 the memory) or 'pq' (smallest, slowest)
+    GALLERY_RERANK_CANDIDATES = 32  # Identities re-scored in float32 after a quantized scan; 0 keeps code scores
+    PQ_SUBSPACES = 64  # Bytes per row for GALLERY_INDEX_DTYPE = 'pq'; must divide the embedding size
+    MATCH_TOP_K = 1  # Candidates returned per face; > 1 adds a 'candidates' list
+    MATCH_ASSIGNMENT_CANDIDATES = 5  # Candidates searched per face for the margin and the one-to-one assignment
+    MATCH_MIN_MARGIN = 0.0  # Min similarity gap between a face's two best identities; closer faces stay unknown
+    MATCH_ONE_TO_ONE = True  # Match each person at most once per image (Hungarian assignment over its faces)
+    IDENTITY_CALIBRATION_ENABLED = True  # Per-person thresholds set at enrollment from their nearest other identities
+    IDENTITY_IMPOSTOR_MARGIN = 0.05  # A person's threshold stays this far above their nearest impostor's similarity
+    IDENTITY_THRESHOLD_LOWERING = False  # Lower thresholds below RECOGNITION_THRESHOLD to fit each person's held-out enrollment photos
+    IDENTITY_MIN_THRESHOLD = 0.45  # Floor for thresholds lowered to fit a person's own enrollment photos
+    IDENTITY_MAX_THRESHOLD = 0.85
+    IDENTITY_CALIBRATION_NEIGHBOURS = 5  # Nearest identities checked per person, and raised when they come too close
+    IDENTITY_TEMPLATES = 1  # Embeddings kept per person; 1 keeps a single quality-weighted centroid
+    TEMPLATE_REDUCTION = 'max'  # How a person's template scores combine: 'max' or 'mean'
+    IVF_NLIST = 1024  # Max coarse cells for the IVF index
+    IVF_NPROBE = 16  # Cells scanned per query
+    IVF_MIN_TRAIN_SIZE = 10000  # Gallery size at which the IVF quantizer is trained
+    GALLERY_MEMORY_BUDGET_BYTES = 512 * 1024 * 1024  # Idle group galleries are evicted above this; None never evicts
+    GALLERY_RELOAD_INTERVAL_SECONDS = 5  # Poll loaded galleries' stores for changes made by other workers; 0 disables
+    GALLERY_SYNC_SOURCE = None  # Base URL of a primary instance; replicas import its snapshots and deltas instead of embedding
+    GALLERY_SYNC_INTERVAL_SECONDS = 10  # Poll the primary for gallery deltas; 0 only syncs at startup
+    GALLERY_SYNC_TOKEN = os.environ.get('GALLERY_SYNC_TOKEN')  # Bearer token for /gallery/snapshot and /gallery/delta; POSTs to them are refused while unset
+    
+    # Face quality gate settings
+    QUALITY_GATE_ENABLED = True  # Skip embedding faces unlikely to match; they are reported with a rejection reason
+    QUALITY_MIN_FACE_SIZE = 24  # Shortest bbox side in pixels of the decoded image (after DECODE_MAX_DIMENSION downscale)
+    QUALITY_MIN_DET_SCORE = 0.6
+    QUALITY_MIN_SHARPNESS = 15.0  # Laplacian variance over a 64px grayscale face crop; 0 disables the blur check
+    QUALITY_MAX_YAW = 0.7  # Nose offset from the eye midpoint, as a share of half the eye distance
+    QUALITY_MAX_PITCH = 0.7  # Nose offset from midway between the eye and mouth lines, as a share of half that gap
+    
     # InsightFace settings
     PROVIDERS = ['CPUExecutionProvider']
     ALLOWED_MODULES = ['detection', 'recognition']
     CTX_ID = 0
     
+    # Inference concurrency settings
+    MODEL_POOL_SIZE = None  # Independent model sessions; None sizes the pool to the core count
+    ORT_INTRA_OP_THREADS = None  # Threads per session; None splits the cores across the pool
+    ORT_INTER_OP_THREADS = 1  # Values > 1 enable ONNX Runtime parallel execution mode
+    ORT_SESSION_PINNING = False  # Pin each session's intra-op threads to its own cores
+    
+    # Video stream settings
+    STREAM_ALLOWED_SCHEMES = ('rtsp', 'rtsps', 'http', 'https')
+    STREAM_ALLOWED_HOSTS = ()  # Hostnames stream URLs may point at; empty allows only files in VIDEO_FOLDER
+    STREAM_DETECTION_STRIDE = 5  # Run detection every Nth frame, track in between
+    STREAM_IOU_THRESHOLD = 0.3  # Min IoU to associate a detection with a track
+    STREAM_MAX_TRACK_AGE = 30  # Frames a track survives without a matching detection
+    STREAM_CONFIDENCE_DECAY = 0.98  # Per-frame decay of a track's identity confidence
+    STREAM_MIN_TRACK_CONFIDENCE = 0.5  # Re-recognize a known track below this confidence
+    STREAM_UNKNOWN_RETRY_FRAMES = 30  # Frames between recognition retries for unknown tracks
+    STREAM_EVENT_COOLDOWN_SECONDS = 60  # Min gap between attendance events for one person
+    STREAM_MAX_FRAMES = 9000  # Upper bound on frames read per request
+    STREAM_MAX_SECONDS = 300  # Wall-clock cap on reading a source for a non-streamed response
+    STREAM_HEARTBEAT_SECONDS = 5  # Progress record interval for streamed video responses without new events
+    
+    # Attendance aggregation settings
+    ATTENDANCE_WINDOW_SECONDS = 300  # Sightings of a person closer together than this merge into one presence
+    ATTENDANCE_SESSION_TTL_SECONDS = 24 * 3600  # Sessions without sightings for this long are dropped, flushed or not
+    ATTENDANCE_FLUSH_URL = None  # POST changed presences here periodically; None leaves flushing to /attendance/flush
+    ATTENDANCE_FLUSH_INTERVAL_SECONDS = 30
+    
+    # Detection response settings
+    CROP_JPEG_QUALITY = 95  # Default JPEG quality for face crops
+    MAX_CROP_SIZE = 512  # Largest crop_size a client may request
+    
     # Supported image formats
     ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff'}
     
     # Performance settings
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+    DECODE_MAX_DIMENSION = None  # Decode large JPEGs at 1/2, 1/4 or 1/8 scale down to this size
+    
+    # Batching settings
+    MICRO_BATCHING_ENABLED = True  # Merge concurrent /recognize_faces requests into one pass
+    BATCH_MAX_SIZE = 8  # Max images per detection/recognition pass
+    BATCH_MAX_WAIT_MS = 5  # Max time the first queued request waits for others
+    MAX_BATCH_IMAGES = 64  # Max images accepted by /recognize_faces/batch
+    MAX_STREAM_BATCH_IMAGES = 1000  # Max images for a streamed batch, which holds one chunk in memory at a time
+    
+    # Startup settings
+    BACKGROUND_MODEL_LOADING = True  # Load models and gallery after the server starts; see /health/ready
+    MODEL_WARMUP = True  # Run one synthetic inference per session before reporting ready
+    
+    # Result cache settings
+    RESULT_CACHE_ENABLED = True  # Reuse /recognize_faces results for byte-identical uploads
+    RESULT_CACHE_MAX_BYTES = 16 * 1024 * 1024  # Approximate memory bound for cached results
+    RESULT_CACHE_TTL_SECONDS = 60
+    MATCH_CACHE_SIZE = 1024  # Recent query embeddings kept for near-duplicate reuse; 0 disables
+    MATCH_CACHE_RADIUS = 0.02  # Max cosine distance at which a cached match is reused
+    
+    # Profiling settings
+    PROFILING_SAMPLE_EVERY = 0  # Profile 1 in N requests; 0 disables sampling
+    PROFILING_HEADER_ENABLED = False  # Profile requests sent with 'X-Profile: 1'
+    PROFILING_OUTPUT_DIR = 'profiles'
+    
+    # Dataset embedding settings
+    EMBEDDING_WORKERS = None  # Process pool size for recompute; None uses all cores
+    EMBEDDING_CHUNK_SIZE = 16  # Images per pool task
+    EMBEDDING_POOL_MIN_IMAGES = 64  # Below this many uncached images, embed in-process
+    
+    # Background job settings
+    JOB_WORKERS = 1  # Dataset jobs run one at a time so gallery updates never interleave
+    JOB_MAX_PENDING = 16  # Queued + running jobs before new ones are rejected with 503
+    JOB_HISTORY_SIZE = 100  # Finished jobs kept for /jobs/<id>
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -38,9 +165,13 @@ class ProductionConfig(Config):
 class TestingConfig(Config):
     """Testing configuration"""
     DEBUG = True
+    BACKGROUND_MODEL_LOADING = False
     DATASET_FOLDER = 'test_dataset'
     UPLOAD_FOLDER = 'test_uploads'
     EMBEDDINGS_FILE = 'test_embeddings.pkl'
+    EMBEDDINGS_STORE_DIR = 'test_embeddings_store'
+    EMBEDDING_CACHE_FILE = 'test_embedding_cache.pkl'
+    GROUPS_FOLDER = 'test_groups'
 
 # Configuration mapping
 config = {
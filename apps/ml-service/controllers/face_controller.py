@@ -1,12 +1,26 @@
-from flask import request, jsonify
-from werkzeug.utils import secure_filename
-import cv2
+from flask import request, jsonify, send_file, Response
+import hashlib
+import hmac
+import io
+import json
+import numpy as np
 import os
+import tempfile
 import time
-from typing import Dict, Any
+import uuid
+from urllib.parse import urlparse
+from werkzeug.datastructures import FileStorage
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from models.attendance import AttendanceAggregator, validate_session_id
 from models.face_model import FaceModel
+from models.gallery import validate_group
+from models.gallery_snapshot import SnapshotConflict, SnapshotError
+from models.job_queue import JobQueue, JobQueueFull, JobReservation
+from models.response_profile import ResponseProfile
+from models.stream_pipeline import StreamRecognizer
 from prometheus_client import Counter, Histogram
 from config import get_config
+from utils import StageTimer, decode_image, requested_stream_format, streaming_response
 
 class FaceController:
     """Controller class for face recognition endpoints"""
@@ -14,23 +28,47 @@ class FaceController:
     def __init__(self, face_model: FaceModel, config_name=None):
         self.config = get_config(config_name)
         self.face_model = face_model
-        self.upload_folder = self.config.UPLOAD_FOLDER
-        
-        os.makedirs(self.upload_folder, exist_ok=True)
+        self.decode_max_dimension = self.config.DECODE_MAX_DIMENSION
+        self.job_queue = JobQueue(
+            max_workers=self.config.JOB_WORKERS,
+            max_pending=self.config.JOB_MAX_PENDING,
+            max_history=self.config.JOB_HISTORY_SIZE
+        )
+        self.attendance = AttendanceAggregator(
+            window_seconds=self.config.ATTENDANCE_WINDOW_SECONDS,
+            session_ttl_seconds=self.config.ATTENDANCE_SESSION_TTL_SECONDS
+        )
+        if self.config.ATTENDANCE_FLUSH_URL:
+            self.attendance.start_flushing(self.config.ATTENDANCE_FLUSH_URL, self.config.ATTENDANCE_FLUSH_INTERVAL_SECONDS)
         
         self.face_detection_counter = Counter('face_detection_requests_total', 'Total face detection requests')
         self.face_recognition_counter = Counter('face_recognition_requests_total', 'Total face recognition requests')
         self.face_detection_duration = Histogram('face_detection_duration_seconds', 'Face detection duration')
         self.face_recognition_duration = Histogram('face_recognition_duration_seconds', 'Face recognition duration')
+        self.face_recognition_batch_size = Histogram('face_recognition_batch_size', 'Images per batch recognition request',
+                                                     buckets=(1, 2, 4, 8, 16, 32, 64))
+        self.face_recognition_batch_duration = Histogram('face_recognition_batch_duration_seconds', 'Batch face recognition duration')
     
     def health_check(self) -> Dict[str, Any]:
         """Health check endpoint"""
         return {
             "status": "healthy", 
             "model_loaded": self.face_model.is_model_loaded(),
+            "ready": self.face_model.is_ready(),
             "dataset_size": self.face_model.get_dataset_size()
         }
     
+    def liveness(self) -> Dict[str, Any]:
+        """Liveness probe: the process is up and serving requests"""
+        return {"status": "alive"}
+    
+    def readiness(self) -> Dict[str, Any]:
+        """Readiness probe: 200 once models are warm and the gallery is loaded, 503 with progress before"""
+        load_status = self.face_model.get_load_status()
+        if not self.face_model.is_ready():
+            return load_status, 503
+        return {**load_status, "dataset_size": self.face_model.get_dataset_size()}
+    
     def detect_faces(self) -> Dict[str, Any]:
         """Detect faces in uploaded image"""
         start_time = time.time()
@@ -40,29 +78,39 @@ class FaceController:
             # Validate request
             if 'image' not in request.files:
                 return {"error": "No image file provided"}, 400
-                
-            if not self.face_model.is_model_loaded():
-                return {"error": "Face analysis model not loaded"}, 500
-                
+            
+            if not self.face_model.is_ready():
+                return self._not_ready()
+            
             image_file = request.files['image']
             if image_file.filename == '':
                 return {"error": "No image selected"}, 400
             
-            image = self._save_and_load_image(image_file)
+            try:
+                profile = ResponseProfile.from_params({**request.args, **request.form}, self.config)
+            except ValueError as e:
+                return {"error": str(e)}, 400
+            
+            timer = StageTimer()
+            image, scale = self._load_image(image_file, timer, start_time)
             if image is None:
                 return {"error": "Invalid image format"}, 400
             
-            detected_faces = self.face_model.detect_faces(image)
-            
-            self._cleanup_temp_file(image_file.filename)
+            detected_faces = self.face_model.detect_faces(image, profile)
+            self._rescale_faces(detected_faces, scale)
+            timer.observe(len(detected_faces))
             
-            self.face_detection_duration.observe(time.time() - start_time)
-            
-            return {
+            result = {
                 "faces_detected": len(detected_faces),
                 "faces": detected_faces
             }
+            if profile.binary_crops:
+                result = self._multipart_response(result)
             
+            self.face_detection_duration.observe(time.time() - start_time)
+            
+            return result
+        
         except Exception as e:
             return {"error": str(e)}, 500
     
@@ -75,25 +123,33 @@ class FaceController:
             # Validate request
             if 'image' not in request.files:
                 return {"error": "No image file provided"}, 400
-                
-            if not self.face_model.is_model_loaded():
-                return {"error": "Face analysis model not loaded"}, 500
-                
+            
+            if not self.face_model.is_ready():
+                return self._not_ready()
+            
             image_file = request.files['image']
             if image_file.filename == '':
                 return {"error": "No image selected"}, 400
             
-            image = self._save_and_load_image(image_file)
-            if image is None:
-                return {"error": "Invalid image format"}, 400
+            group = self._request_group()
+            if not self.face_model.group_exists(group):
+                return self._group_not_found(group)
+            session = self._request_session()
             
-            recognized_faces, attendance_records = self.face_model.recognize_faces(image)
+            # Form parsing and the read cover the upload; decode is timed separately
+            timer = StageTimer()
+            data = image_file.read()
+            timer.record('upload', time.time() - start_time)
+            recognized_faces, attendance_records = self._recognize_cached(data, timer, group)
+            if recognized_faces is None:
+                return {"error": "Invalid image format"}, 400
+            timer.observe(len(recognized_faces))
             
             current_time = time.time()
             for record in attendance_records:
                 record["timestamp"] = current_time
-            
-            self._cleanup_temp_file(image_file.filename)
+            if session:
+                self.attendance.record(session, attendance_records, group)
             
             self.face_recognition_duration.observe(time.time() - start_time)
             
@@ -102,17 +158,296 @@ class FaceController:
                 "recognized_faces": recognized_faces,
                 "attendance_records": attendance_records
             }
+        
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        except Exception as e:
+            return {"error": str(e)}, 500
+    
+    def recognize_faces_batch(self) -> Dict[str, Any]:
+        """Recognize faces in several uploaded images in one request.
+
+        With ?stream=ndjson or ?stream=sse (or a matching Accept header) each
+        image's result is sent as soon as its chunk is processed, followed by
+        a summary record, instead of one JSON document at the end.
+        """
+        start_time = time.time()
+        
+        try:
+            # Validate request
+            if 'images' not in request.files:
+                return {"error": "No images provided"}, 400
+            
+            if not self.face_model.is_ready():
+                return self._not_ready()
+            
+            stream_format = requested_stream_format(request.values.get('stream'), request.accept_mimetypes)
+            image_files = [f for f in request.files.getlist('images') if f.filename]
+            if not image_files:
+                return {"error": "At least one image is required"}, 400
+            
+            max_images = self.config.MAX_STREAM_BATCH_IMAGES if stream_format else self.config.MAX_BATCH_IMAGES
+            if len(image_files) > max_images:
+                return {"error": f"At most {max_images} images per batch"}, 400
+            
+            group = self._request_group()
+            if not self.face_model.group_exists(group):
+                return self._group_not_found(group)
+            session = self._request_session()
+            
+            self.face_recognition_counter.inc(len(image_files))
+            self.face_recognition_batch_size.observe(len(image_files))
+            
+            # Form parsing covers the upload; files are read chunk by chunk as they are recognized
+            timer = StageTimer()
+            timer.record('upload', time.time() - start_time)
+            
+            if stream_format:
+                uploads = self._detach_uploads(image_files)
+                return streaming_response(self._stream_batch(uploads, group, session, timer, start_time), stream_format)
+            
+            results = [None] * len(image_files)
+            total_faces = 0
+            for position, result in self._recognize_uploads(image_files, group, session, timer):
+                results[position] = result
+                total_faces += result.get("total_faces", 0)
+            
+            timer.observe(total_faces)
+            self.face_recognition_batch_duration.observe(time.time() - start_time)
+            
+            return {
+                "total_images": len(image_files),
+                "total_faces": total_faces,
+                "results": results
+            }
+        
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        except Exception as e:
+            return {"error": str(e)}, 500
+    
+    def _recognize_uploads(self, image_files: List[FileStorage], group: Optional[str], session: Optional[str],
+                           timer: StageTimer) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """Recognize uploads BATCH_MAX_SIZE at a time, yielding (position, result) as each chunk finishes.
+
+        Only one chunk's images are held in memory. A failing image gets an
+        error result of its own instead of failing the rest of its chunk.
+        With a session, attendance records are also merged into it.
+        """
+        result_cache = self.face_model.result_cache
+        chunk_size = self.config.BATCH_MAX_SIZE
+        for start in range(0, len(image_files), chunk_size):
+            generation = result_cache.generation if result_cache is not None else None
+            outputs = {}
+            pending = []
+            for position in range(start, min(start + chunk_size, len(image_files))):
+                data = image_files[position].read()
+                cache_key = self._result_cache_key(data, group)
+                cached = result_cache.get(cache_key) if result_cache is not None else None
+                if cached is not None:
+                    outputs[position] = self._copy_result(cached)
+                    continue
+                with timer.stage('decode'):
+                    image, scale = decode_image(data, self.decode_max_dimension)
+                if image is None:
+                    outputs[position] = "Invalid image format"
+                    continue
+                pending.append((position, image, scale, cache_key))
+            
+            try:
+                chunk_results = self.face_model.recognize_faces_batch([item[1] for item in pending], group=group)
+            except Exception:
+                # Retry one by one so only the image that fails is reported as failed
+                chunk_results = []
+                for _, image, _, _ in pending:
+                    try:
+                        chunk_results.append(self.face_model.recognize_faces_batch([image], group=group)[0])
+                    except Exception as e:
+                        chunk_results.append(e)
             
+            for (position, _, scale, cache_key), result in zip(pending, chunk_results):
+                if isinstance(result, Exception):
+                    outputs[position] = f"Recognition failed: {result}"
+                    continue
+                self._rescale_faces(result[0], scale)
+                self._rescale_faces(result[1], scale)
+                self._store_result(cache_key, result, generation)
+                outputs[position] = self._copy_result(result)
+            
+            current_time = time.time()
+            for position in sorted(outputs):
+                output = outputs[position]
+                filename = image_files[position].filename
+                if isinstance(output, str):
+                    yield position, {"filename": filename, "error": output}
+                    continue
+                recognized_faces, attendance_records = output
+                for record in attendance_records:
+                    record["timestamp"] = current_time
+                if session:
+                    self.attendance.record(session, attendance_records, group)
+                yield position, {
+                    "filename": filename,
+                    "total_faces": len(recognized_faces),
+                    "recognized_faces": recognized_faces,
+                    "attendance_records": attendance_records
+                }
+    
+    def _detach_uploads(self, image_files: List[FileStorage]) -> List[FileStorage]:
+        """Take over upload streams so they outlive the view; Flask closes request files when it returns"""
+        uploads = [FileStorage(stream=f.stream, filename=f.filename) for f in image_files]
+        for image_file in image_files:
+            image_file.stream = io.BytesIO()
+        return uploads
+    
+    def _stream_batch(self, image_files: List[FileStorage], group: Optional[str], session: Optional[str],
+                      timer: StageTimer, start_time: float) -> Iterator[Dict[str, Any]]:
+        """Streaming records for a batch: one per image, then a summary"""
+        total_faces = 0
+        failed = 0
+        error = None
+        try:
+            for position, result in self._recognize_uploads(image_files, group, session, timer):
+                if "error" in result:
+                    failed += 1
+                    yield {"type": "error", "index": position, **result}
+                    continue
+                total_faces += result["total_faces"]
+                yield {"type": "result", "index": position, **result}
+        except Exception as e:
+            error = str(e)
+        finally:
+            for image_file in image_files:
+                image_file.close()
+        
+        timer.observe(total_faces)
+        self.face_recognition_batch_duration.observe(time.time() - start_time)
+        summary = {
+            "type": "summary",
+            "total_images": len(image_files),
+            "total_faces": total_faces,
+            "failed_images": failed,
+            "complete": error is None
+        }
+        if error is not None:
+            summary["error"] = error
+        yield summary
+    
+    def recognize_stream(self) -> Dict[str, Any]:
+        """Run tracked recognition over a video file or stream URL and return attendance events.
+
+        In streaming mode (see recognize_faces_batch) each event is sent as it
+        happens, with progress records while no one new appears.
+        """
+        start_time = time.time()
+        
+        try:
+            params = request.get_json(silent=True) or request.form
+            source = params.get('source')
+            if not source:
+                return {"error": "source is required"}, 400
+            
+            if not self.face_model.is_ready():
+                return self._not_ready()
+            
+            try:
+                source = self._resolve_stream_source(source)
+                stride = int(params.get('stride') or self.config.STREAM_DETECTION_STRIDE)
+                max_frames = min(int(params.get('max_frames') or self.config.STREAM_MAX_FRAMES),
+                                 self.config.STREAM_MAX_FRAMES)
+                group = self._request_group(params)
+                session = validate_session_id(params.get('session') or request.args.get('session'))
+                stream_format = requested_stream_format(params.get('stream') or request.args.get('stream'),
+                                                        request.accept_mimetypes)
+            except ValueError as e:
+                return {"error": str(e)}, 400
+            if not self.face_model.group_exists(group):
+                return self._group_not_found(group)
+            
+            recognizer = StreamRecognizer(self.face_model, self.config, stride, group)
+            if stream_format:
+                return streaming_response(self._stream_events(recognizer, source, max_frames, session, start_time),
+                                          stream_format)
+            # Without a stream the client waits for the whole read, so it is bounded in time as well
+            events = list(recognizer.run(source, max_frames, max_seconds=self.config.STREAM_MAX_SECONDS))
+            if session:
+                self._record_stream_events(session, events, group, start_time)
+            
+            return {
+                "events": events,
+                "total_events": len(events),
+                **recognizer.stats(),
+                "processing_time": time.time() - start_time
+            }
+        
+        except Exception as e:
+            return {"error": str(e)}, 500
+    
+    def _stream_events(self, recognizer: StreamRecognizer, source: str, max_frames: int, session: Optional[str],
+                       start_time: float) -> Iterator[Dict[str, Any]]:
+        """Streaming records for a video: events and progress as frames are read, then a summary"""
+        total_events = 0
+        error = None
+        try:
+            for event in recognizer.run(source, max_frames, heartbeat_seconds=self.config.STREAM_HEARTBEAT_SECONDS):
+                if event is None:
+                    yield {"type": "progress", **recognizer.stats()}
+                    continue
+                total_events += 1
+                if session:
+                    self._record_stream_events(session, [event], recognizer.group, start_time)
+                yield {"type": "event", **event}
+        except Exception as e:
+            error = str(e)
+        
+        summary = {
+            "type": "summary",
+            "total_events": total_events,
+            **recognizer.stats(),
+            "processing_time": time.time() - start_time,
+            "complete": error is None
+        }
+        if error is not None:
+            summary["error"] = error
+        yield summary
+    
+    def _record_stream_events(self, session: str, events: List[Dict[str, Any]], group: Optional[str],
+                              start_time: float):
+        """Merge video events into a session; their timestamps are seconds into the video from the request start"""
+        self.attendance.record(session, [{**event, "timestamp": start_time + event["timestamp"]} for event in events],
+                               group)
+    
+    def get_attendance(self, session_id: str) -> Dict[str, Any]:
+        """Current presences of one attendance session"""
+        try:
+            snapshot = self.attendance.snapshot(validate_session_id(session_id))
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        if snapshot is None:
+            return {"error": f"Session {session_id} not found"}, 404
+        return snapshot
+    
+    def flush_attendance(self) -> Dict[str, Any]:
+        """Export presences changed since the last flush, for one session or all; each is returned once"""
+        try:
+            params = request.get_json(silent=True) or request.values
+            records = self.attendance.flush(validate_session_id(params.get('session')))
+            return {
+                "records": records,
+                "total_records": len(records)
+            }
+        except ValueError as e:
+            return {"error": str(e)}, 400
         except Exception as e:
             return {"error": str(e)}, 500
     
     def add_to_dataset(self) -> Dict[str, Any]:
-        """Add person with images to dataset"""
+        """Save images for a person and queue their embedding computation"""
         try:
             # Validate request
             if 'images' not in request.files:
                 return {"error": "No images provided"}, 400
-                
+            
             person_name = request.form.get('person_name')
             if not person_name:
                 return {"error": "Person name is required"}, 400
@@ -121,52 +456,439 @@ class FaceController:
             if not images:
                 return {"error": "At least one image is required"}, 400
             
-            uploaded_files, embeddings_computed = self.face_model.add_person_to_dataset(
-                person_name, images
-            )
+            if not self.face_model.is_ready():
+                return self._not_ready()
+            
+            # Enrolling into a new group creates it
+            group = self._request_group()
+            
+            # The upload stream is gone once the request ends, so files are saved up front,
+            # in a queue slot taken first so a full queue leaves the dataset untouched
+            with self.job_queue.reserve() as reservation:
+                uploaded_files = self.face_model.save_person_images(person_name, images, group)
+                job = reservation.submit('dataset_add', lambda job: {
+                    "embeddings_computed": self.face_model.compute_person_embedding(
+                        person_name, uploaded_files, job.set_progress, group
+                    )
+                })
             
             return {
                 "message": f"Added {len(uploaded_files)} images for {person_name}",
                 "files": uploaded_files,
-                "embeddings_computed": embeddings_computed
-            }
+                "job_id": job.id,
+                "status": job.status
+            }, 202
+        
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        except JobQueueFull as e:
+            return {"error": str(e)}, 503
+        except Exception as e:
+            return {"error": str(e)}, 500
+    
+    def delete_person(self, person_name: str) -> Dict[str, Any]:
+        """Queue removal of a person from the gallery and the dataset"""
+        try:
+            if not self.face_model.is_ready():
+                return self._not_ready()
+            group = self._request_group()
+            if not self.face_model.group_exists(group):
+                return self._group_not_found(group)
+            if not self.face_model.person_exists(person_name, group):
+                return {"error": f"Person {person_name} not found"}, 404
+            
+            return self._queue_dataset_job('dataset_delete', f"Deletion of {person_name} queued", lambda job: {
+                "deleted": self.face_model.delete_person(person_name, group)
+            })
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        except JobQueueFull as e:
+            return {"error": str(e)}, 503
+        except Exception as e:
+            return {"error": str(e)}, 500
+    
+    def remove_person_image(self, person_name: str, filename: str) -> Dict[str, Any]:
+        """Queue removal of one image and re-aggregation of the person's embedding"""
+        try:
+            if not self.face_model.is_ready():
+                return self._not_ready()
+            group = self._request_group()
+            if not self.face_model.group_exists(group):
+                return self._group_not_found(group)
+            if not self.face_model.image_exists(person_name, filename, group):
+                return {"error": f"Image {filename} not found for {person_name}"}, 404
             
+            return self._queue_dataset_job('dataset_remove_image', f"Removal of {filename} queued", lambda job: {
+                "removed": self.face_model.remove_person_image(person_name, filename, job.set_progress, group)
+            })
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        except JobQueueFull as e:
+            return {"error": str(e)}, 503
+        except Exception as e:
+            return {"error": str(e)}, 500
+    
+    def replace_person_image(self, person_name: str, filename: str) -> Dict[str, Any]:
+        """Overwrite one image and queue re-embedding of just that image"""
+        try:
+            if 'image' not in request.files or request.files['image'].filename == '':
+                return {"error": "No image file provided"}, 400
+            if not self.face_model.is_ready():
+                return self._not_ready()
+            group = self._request_group()
+            if not self.face_model.group_exists(group):
+                return self._group_not_found(group)
+            if not self.face_model.image_exists(person_name, filename, group):
+                return {"error": f"Image {filename} not found for {person_name}"}, 404
+            
+            # The upload stream is gone once the request ends, so the file is written up front,
+            # in a queue slot taken first so a full queue leaves the image untouched
+            with self.job_queue.reserve() as reservation:
+                self.face_model.save_person_image(person_name, filename, request.files['image'], group)
+                return self._queue_dataset_job('dataset_replace_image', f"Replaced {filename}; re-embedding queued", lambda job: {
+                    "embeddings_computed": self.face_model.compute_person_embedding(
+                        person_name, [filename], job.set_progress, group
+                    )
+                }, reservation)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        except JobQueueFull as e:
+            return {"error": str(e)}, 503
+        except Exception as e:
+            return {"error": str(e)}, 500
+    
+    def rename_person(self, person_name: str) -> Dict[str, Any]:
+        """Queue a rename of a person's folder and gallery entry"""
+        try:
+            data = request.get_json(silent=True) or request.form
+            new_name = data.get('new_name')
+            if not new_name:
+                return {"error": "New person name is required"}, 400
+            if not self.face_model.is_ready():
+                return self._not_ready()
+            group = self._request_group(data)
+            if not self.face_model.group_exists(group):
+                return self._group_not_found(group)
+            if not self.face_model.person_exists(person_name, group):
+                return {"error": f"Person {person_name} not found"}, 404
+            if self.face_model.person_exists(new_name, group):
+                return {"error": f"Person {new_name} already exists"}, 409
+            
+            return self._queue_dataset_job('dataset_rename', f"Rename of {person_name} to {new_name} queued", lambda job: {
+                "renamed": self.face_model.rename_person(person_name, new_name, group)
+            })
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        except JobQueueFull as e:
+            return {"error": str(e)}, 503
         except Exception as e:
             return {"error": str(e)}, 500
     
     def list_dataset(self) -> Dict[str, Any]:
-        """List all people in dataset"""
+        """List people in the dataset, one page at a time.
+
+        Query parameters: limit, cursor (the previous page's next_cursor),
+        prefix, search (substring of the name) and has_embedding.
+        """
         try:
-            return self.face_model.get_dataset_info()
+            group = self._request_group()
+            if not self.face_model.group_exists(group):
+                return self._group_not_found(group)
+            
+            limit = int(request.args.get('limit') or self.config.DATASET_LIST_PAGE_SIZE)
+            if not 1 <= limit <= self.config.DATASET_LIST_MAX_PAGE_SIZE:
+                return {"error": f"limit must be between 1 and {self.config.DATASET_LIST_MAX_PAGE_SIZE}"}, 400
+            has_embedding = request.args.get('has_embedding')
+            if has_embedding is not None:
+                has_embedding = has_embedding.lower() == 'true'
+            
+            return self.face_model.get_dataset_info(
+                group,
+                after=request.args.get('cursor') or None,
+                limit=limit,
+                prefix=request.args.get('prefix') or None,
+                search=request.args.get('search') or None,
+                has_embedding=has_embedding
+            )
+        except ValueError as e:
+            return {"error": str(e)}, 400
         except Exception as e:
             return {"error": str(e)}, 500
     
     def recompute_embeddings(self) -> Dict[str, Any]:
-        """Recompute all dataset embeddings"""
+        """Queue a recompute of all dataset embeddings"""
         try:
-            total_embeddings = self.face_model.recompute_all_embeddings()
+            # Startup loading owns the gallery until the service is ready
+            if not self.face_model.is_ready():
+                return self._not_ready()
+            
+            force = request.args.get('force', 'false').lower() == 'true'
+            group = self._request_group()
+            if not self.face_model.group_exists(group):
+                return self._group_not_found(group)
+            job = self.job_queue.submit('dataset_recompute', lambda job: {
+                "total_embeddings": self.face_model.recompute_all_embeddings(job.set_progress, force, group)
+            })
             
             return {
-                "message": "Dataset embeddings recomputed successfully",
-                "total_embeddings": total_embeddings
-            }
+                "message": "Dataset embedding recompute queued",
+                "job_id": job.id,
+                "status": job.status
+            }, 202
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        except JobQueueFull as e:
+            return {"error": str(e)}, 503
         except Exception as e:
             return {"error": str(e)}, 500
     
-    def _save_and_load_image(self, image_file) -> cv2.Mat:
-        """Save uploaded image file and load it with OpenCV"""
-        filename = secure_filename(image_file.filename)
-        filepath = os.path.join(self.upload_folder, filename)
-        image_file.save(filepath)
-        
-        image = cv2.imread(filepath)
-        return image
+    def gallery_version(self) -> Dict[str, Any]:
+        """Version and size of a group's gallery, for replicas deciding whether to sync"""
+        try:
+            if not self.face_model.is_ready():
+                return self._not_ready()
+            group = self._request_group()
+            if not self.face_model.group_exists(group):
+                return self._group_not_found(group)
+            return self.face_model.get_gallery_version(group)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        except Exception as e:
+            return {"error": str(e)}, 500
+    
+    def export_gallery_snapshot(self) -> Dict[str, Any]:
+        """Download a group's gallery as a checksummed tar of its names and embedding matrix"""
+        try:
+            if not self.face_model.is_ready():
+                return self._not_ready()
+            unauthorized = self._sync_unauthorized(write=False)
+            if unauthorized is not None:
+                return unauthorized
+            group = self._request_group()
+            if not self.face_model.group_exists(group):
+                return self._group_not_found(group)
+            
+            # Spilled to disk past 64 MiB; send_file closes it once the response is sent
+            snapshot = tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024)
+            version = self.face_model.export_gallery_snapshot(snapshot, group)
+            snapshot.seek(0)
+            response = send_file(snapshot, mimetype='application/x-tar', as_attachment=True,
+                                 download_name=f"gallery-{group or 'default'}-v{version}.tar")
+            response.headers['X-Gallery-Version'] = str(version)
+            return response
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        except Exception as e:
+            return {"error": str(e)}, 500
     
-    def _cleanup_temp_file(self, filename: str):
-        """Remove temporary uploaded file"""
+    def import_gallery_snapshot(self) -> Dict[str, Any]:
+        """Replace a group's gallery with an uploaded snapshot: a 'snapshot' file or the raw request body"""
         try:
-            filepath = os.path.join(self.upload_folder, secure_filename(filename))
-            if os.path.exists(filepath):
-                os.remove(filepath)
+            if not self.face_model.is_ready():
+                return self._not_ready()
+            unauthorized = self._sync_unauthorized(write=True)
+            if unauthorized is not None:
+                return unauthorized
+            group = self._request_group()
+            if not self.face_model.group_exists(group):
+                return self._group_not_found(group)
+            snapshot_file = request.files.get('snapshot')
+            stream = snapshot_file.stream if snapshot_file is not None else request.stream
+            return self.face_model.import_gallery_snapshot(stream, group)
+        except ValueError as e:
+            return {"error": str(e)}, 400
         except Exception as e:
-            print(f"Error cleaning up temp file {filename}: {e}") 
\ No newline at end of file
+            return {"error": str(e)}, 500
+    
+    def export_gallery_delta(self) -> Dict[str, Any]:
+        """Gallery changes after the 'since' version; 410 once they have been compacted into a snapshot"""
+        try:
+            if not self.face_model.is_ready():
+                return self._not_ready()
+            unauthorized = self._sync_unauthorized(write=False)
+            if unauthorized is not None:
+                return unauthorized
+            group = self._request_group()
+            if not self.face_model.group_exists(group):
+                return self._group_not_found(group)
+            since = request.args.get('since')
+            if since is None:
+                return {"error": "since is required"}, 400
+            
+            delta = self.face_model.export_gallery_delta(int(since), group)
+            if delta is None:
+                return {"error": f"Changes since version {since} are no longer available; fetch /gallery/snapshot"}, 410
+            return delta
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        except Exception as e:
+            return {"error": str(e)}, 500
+    
+    def apply_gallery_delta(self) -> Dict[str, Any]:
+        """Replay a delta exported by another instance"""
+        try:
+            if not self.face_model.is_ready():
+                return self._not_ready()
+            unauthorized = self._sync_unauthorized(write=True)
+            if unauthorized is not None:
+                return unauthorized
+            group = self._request_group()
+            if not self.face_model.group_exists(group):
+                return self._group_not_found(group)
+            delta = request.get_json(silent=True)
+            if delta is None:
+                return {"error": "A JSON gallery delta is required"}, 400
+            return self.face_model.apply_gallery_delta(delta, group)
+        except SnapshotConflict as e:
+            return {"error": str(e)}, 409
+        except (SnapshotError, ValueError) as e:
+            return {"error": str(e)}, 400
+        except Exception as e:
+            return {"error": str(e)}, 500
+    
+    def get_job(self, job_id: str) -> Dict[str, Any]:
+        """Report the status and progress of a background job"""
+        job = self.job_queue.get(job_id)
+        if job is None:
+            return {"error": "Job not found"}, 404
+        return job.to_dict()
+    
+    def _queue_dataset_job(self, kind: str, message: str, fn,
+                           reservation: Optional[JobReservation] = None) -> Tuple[Dict[str, Any], int]:
+        """Run a gallery mutation on the job queue, which serializes it with adds and recomputes"""
+        job = reservation.submit(kind, fn) if reservation is not None else self.job_queue.submit(kind, fn)
+        return {
+            "message": message,
+            "job_id": job.id,
+            "status": job.status
+        }, 202
+    
+    def _request_group(self, params=None) -> Optional[str]:
+        """Gallery group from the request body or query string; None selects the default gallery"""
+        group = (params.get('group') if params is not None else None) or request.values.get('group')
+        return validate_group(group)
+    
+    def _request_session(self) -> Optional[str]:
+        """Attendance session from the request body or query string; None leaves attendance unaggregated"""
+        return validate_session_id(request.values.get('session'))
+    
+    def _sync_unauthorized(self, write: bool) -> Optional[Tuple[Dict[str, Any], int]]:
+        """401 unless the request carries GALLERY_SYNC_TOKEN; without a token configured, imports are refused outright"""
+        token = self.config.GALLERY_SYNC_TOKEN
+        if not token:
+            return ({"error": "Gallery imports are disabled; set GALLERY_SYNC_TOKEN"}, 403) if write else None
+        supplied = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode()):
+            return {"error": "Invalid or missing gallery sync token"}, 401
+        return None
+    
+    def _group_not_found(self, group: str) -> Tuple[Dict[str, Any], int]:
+        return {"error": f"Group {group} not found"}, 404
+    
+    def _not_ready(self) -> Tuple[Dict[str, Any], int]:
+        """503 while the model is still loading; 500 if loading failed"""
+        load_status = self.face_model.get_load_status()
+        if load_status["status"] == 'failed':
+            return {"error": "Face analysis model not loaded", "detail": load_status["error"]}, 500
+        return {"error": "Service is starting", "load_status": load_status}, 503
+    
+    def _multipart_response(self, result: Dict[str, Any]) -> Response:
+        """Send face metadata as a JSON part followed by one binary JPEG part per crop"""
+        boundary = uuid.uuid4().hex
+        parts = []
+        for face in result["faces"]:
+            crop = face.pop("face_crop", None)
+            face["face_crop_part"] = f"face-{face['face_id']}" if crop else None
+            if crop:
+                parts.append((face["face_crop_part"], crop))
+        
+        chunks = [
+            f"--{boundary}\r\nContent-Type: application/json\r\nContent-ID: <metadata>\r\n\r\n".encode(),
+            json.dumps(result).encode(),
+            b"\r\n"
+        ]
+        for part_id, crop in parts:
+            chunks.append(f"--{boundary}\r\nContent-Type: image/jpeg\r\nContent-ID: <{part_id}>\r\n"
+                          f"Content-Length: {len(crop)}\r\n\r\n".encode())
+            chunks.append(crop)
+            chunks.append(b"\r\n")
+        chunks.append(f"--{boundary}--\r\n".encode())
+        
+        return Response(b"".join(chunks), mimetype=f"multipart/mixed; boundary={boundary}")
+    
+    def _resolve_stream_source(self, source: str) -> str:
+        """Allow stream URLs with permitted schemes and hosts, or files inside VIDEO_FOLDER"""
+        url = urlparse(source)
+        scheme = url.scheme.lower()
+        if scheme in self.config.STREAM_ALLOWED_SCHEMES:
+            if (url.hostname or '').lower() not in self.config.STREAM_ALLOWED_HOSTS:
+                raise ValueError(f"Stream host not allowed: {url.hostname}")
+            return source
+        if scheme and len(scheme) > 1:
+            raise ValueError(f"Unsupported stream scheme: {scheme}")
+        
+        video_folder = os.path.realpath(self.config.VIDEO_FOLDER)
+        path = os.path.realpath(os.path.join(video_folder, source))
+        if os.path.commonpath([video_folder, path]) != video_folder:
+            raise ValueError("Video files must be inside the video folder")
+        if not os.path.isfile(path):
+            raise ValueError(f"Video file not found: {source}")
+        return path
+    
+    def _recognize_cached(self, data: bytes, timer: StageTimer,
+                          group: Optional[str] = None) -> Tuple[Optional[List[Dict]], Optional[List[Dict]]]:
+        """Recognize an uploaded image, reusing the result for byte-identical uploads to the same group"""
+        result_cache = self.face_model.result_cache
+        generation = result_cache.generation if result_cache is not None else None
+        cache_key = self._result_cache_key(data, group)
+        cached = result_cache.get(cache_key) if result_cache is not None else None
+        if cached is not None:
+            return self._copy_result(cached)
+        
+        with timer.stage('decode'):
+            image, scale = decode_image(data, self.decode_max_dimension)
+        if image is None:
+            return None, None
+        
+        result = self.face_model.recognize_faces(image, group=group)
+        self._rescale_faces(result[0], scale)
+        self._rescale_faces(result[1], scale)
+        self._store_result(cache_key, result, generation)
+        return self._copy_result(result)
+    
+    def _result_cache_key(self, data: bytes, group: Optional[str] = None) -> str:
+        """Hash the upload bytes together with the group and the settings that shape the result"""
+        digest = hashlib.blake2b(data, digest_size=16)
+        digest.update(f"|{group}|{self.decode_max_dimension}|{self.config.RECOGNITION_THRESHOLD}".encode())
+        return digest.hexdigest()
+    
+    def _store_result(self, cache_key: str, result: Tuple[List[Dict], List[Dict]], generation: Optional[int]):
+        """Cache a recognition result computed under the given cache generation"""
+        result_cache = self.face_model.result_cache
+        if result_cache is None:
+            return
+        # Rough per-face footprint of the response dicts
+        size = 512 + 512 * (len(result[0]) + len(result[1]))
+        result_cache.put(cache_key, result, size, generation)
+    
+    def _copy_result(self, result: Tuple[List[Dict], List[Dict]]) -> Tuple[List[Dict], List[Dict]]:
+        """Copy cached response dicts so per-request fields never leak into the cache"""
+        recognized_faces, attendance_records = result
+        return [dict(face) for face in recognized_faces], [dict(record) for record in attendance_records]
+    
+    def _load_image(self, image_file, timer: StageTimer, start_time: float) -> Tuple[Optional[np.ndarray], int]:
+        """Decode an uploaded image straight from the request stream"""
+        data = image_file.read()
+        timer.record('upload', time.time() - start_time)
+        with timer.stage('decode'):
+            return decode_image(data, self.decode_max_dimension)
+    
+    def _rescale_faces(self, faces: List[Dict], scale: int):
+        """Map bboxes and landmarks from a reduced decode back to full resolution"""
+        if scale == 1:
+            return
+        for face in faces:
+            if face.get("bbox") is not None:
+                face["bbox"] = [int(v * scale) for v in face["bbox"]]
+            if face.get("landmarks") is not None:
+                face["landmarks"] = [[float(x * scale), float(y * scale)] for x, y in face["landmarks"]]
\ No newline at end of file
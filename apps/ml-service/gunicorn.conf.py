@@ -0,0 +1,39 @@
+"""
+Gunicorn settings for the production server, derived from config.settings:
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The cores are split evenly between the worker processes. Each worker sizes
+its ONNX Runtime sessions (see resolve_thread_settings), OpenCV and BLAS
+thread pools to its share, so the workers together do not run more compute
+threads than there are cores.
+"""
+
+import os
+
+from config import get_config
+
+_config = get_config(os.environ.get('FLASK_ENV', 'production'))
+
+workers = int(os.environ.get('WEB_CONCURRENCY') or _config.SERVER_WORKERS)
+# Workers inherit the environment, so their thread settings see the same worker count
+os.environ['WEB_CONCURRENCY'] = str(workers)
+# BLAS pools size themselves when NumPy is first imported, which happens below in the master
+for _variable in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+    os.environ.setdefault(_variable, str(max(1, (os.cpu_count() or 1) // workers)))
+
+from models.session_pool import resolve_thread_settings  # noqa: E402
+
+_pool_size, _, _ = resolve_thread_settings(_config)
+
+bind = f"{_config.HOST}:{_config.PORT}"
+worker_class = 'gthread'
+# Enough request threads to fill a micro-batch on every session, plus a couple for probes
+threads = _config.SERVER_THREADS or _pool_size * (_config.BATCH_MAX_SIZE if _config.MICRO_BATCHING_ENABLED else 2) + 2
+preload_app = _config.SERVER_PRELOAD
+timeout = _config.SERVER_TIMEOUT
+graceful_timeout = 30
+
+def post_worker_init(worker):
+    """Create this worker's model sessions once it has forked and loaded the app"""
+    import wsgi
+    wsgi.start_worker()
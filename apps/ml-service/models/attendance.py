@@ -0,0 +1,225 @@
+import json
+import re
+import threading
+import time
+import urllib.request
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from utils.metrics import ATTENDANCE_RECORDS_FLUSHED, ATTENDANCE_SIGHTINGS
+
+SESSION_ID_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.:-]{0,127}$')
+
+def validate_session_id(session_id: Optional[str]) -> Optional[str]:
+    """Normalize a session parameter, raising ValueError for ids that are not plain tokens"""
+    if not session_id:
+        return None
+    if not SESSION_ID_PATTERN.match(session_id):
+        raise ValueError(f"Invalid session: {session_id!r}")
+    return session_id
+
+class Presence:
+    """One person's continuous presence in a session"""
+    
+    __slots__ = ('person_name', 'first_seen', 'last_seen', 'best_confidence', 'sightings', 'revision', 'exported')
+    
+    def __init__(self, person_name: str, timestamp: float, confidence: float):
+        self.person_name = person_name
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.best_confidence = confidence
+        self.sightings = 1
+        # Bumped on every change; equal to exported once the current state has been flushed
+        self.revision = 1
+        self.exported = 0
+    
+    def close(self):
+        """Mark a change so the record is exported once more, with open set to False"""
+        self.revision += 1
+    
+    def merge(self, timestamp: float, confidence: float):
+        self.first_seen = min(self.first_seen, timestamp)
+        self.last_seen = max(self.last_seen, timestamp)
+        self.best_confidence = max(self.best_confidence, confidence)
+        self.sightings += 1
+        self.revision += 1
+
+class AttendanceSession:
+    """Presences in one session: the open one per person and closed ones not yet flushed"""
+    
+    __slots__ = ('group', 'open', 'closed', 'last_activity')
+    
+    def __init__(self, group: Optional[str]):
+        self.group = group
+        self.open: Dict[str, Presence] = {}
+        self.closed: List[Presence] = []
+        self.last_activity = time.time()
+
+class AttendanceAggregator:
+    """Merges attendance sightings into one record per person and presence, per session.
+
+    A sighting within window_seconds of the person's last one extends their
+    open presence (first and last seen, best confidence, sighting count); a
+    longer gap closes it and starts a new one. flush() exports only the
+    presences that changed since the previous flush, so downstream writes
+    scale with the people present rather than the frames processed. Records
+    are keyed by (session_id, person_name, first_seen) for upserts. Sessions
+    idle past session_ttl_seconds are dropped, at most once per window from
+    record() and snapshot() as well, so the TTL holds without a flusher.
+    """
+    
+    def __init__(self, window_seconds: float = 300, session_ttl_seconds: float = 24 * 3600):
+        self.window_seconds = window_seconds
+        self.session_ttl_seconds = session_ttl_seconds
+        self._sessions: Dict[str, AttendanceSession] = {}
+        self._lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+        self._flush_url: Optional[str] = None
+        self._flush_interval = 0.0
+        self._last_expired = time.time()
+    
+    def record(self, session_id: str, records: Iterable[Dict], group: Optional[str] = None) -> int:
+        """Merge attendance records (person_name, confidence, timestamp) into a session"""
+        count = 0
+        now = time.time()
+        with self._lock:
+            self._expire_due(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = AttendanceSession(group)
+            session.last_activity = now
+            for record in records:
+                name = record["person_name"]
+                timestamp = float(record.get("timestamp", now))
+                confidence = float(record.get("confidence", 0.0))
+                presence = session.open.get(name)
+                if presence is not None and timestamp - presence.last_seen > self.window_seconds:
+                    presence.close()
+                    session.closed.append(presence)
+                    presence = None
+                if presence is None:
+                    session.open[name] = Presence(name, timestamp, confidence)
+                else:
+                    presence.merge(timestamp, confidence)
+                count += 1
+        if count:
+            ATTENDANCE_SIGHTINGS.inc(count)
+        self._ensure_flusher()
+        return count
+    
+    def snapshot(self, session_id: str) -> Optional[Dict]:
+        """Every presence held for a session, flushed or not; None for an unknown session"""
+        with self._lock:
+            self._expire_due(time.time())
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            presences = session.closed + list(session.open.values())
+            people = [self._to_dict(session_id, session, presence) for presence in presences]
+        people.sort(key=lambda person: (person["first_seen"], person["person_name"]))
+        return {
+            "session_id": session_id,
+            "group": session.group,
+            "total_people": len({person["person_name"] for person in people}),
+            "presences": people
+        }
+    
+    def flush(self, session_id: Optional[str] = None,
+              send: Optional[Callable[[List[Dict]], None]] = None) -> List[Dict]:
+        """Export presences changed since the last flush, for one session or all.
+
+        With send, the batch is handed to it first and only marked exported if
+        it returns; if it raises, the same presences are exported next time.
+        Closed presences are released once exported, and sessions idle past
+        the TTL are dropped.
+        """
+        with self._lock:
+            self._expire(time.time())
+            session_ids = [session_id] if session_id is not None else list(self._sessions)
+            pending: List[Tuple[Presence, int]] = []
+            records = []
+            for sid in session_ids:
+                session = self._sessions.get(sid)
+                if session is None:
+                    continue
+                for presence in session.closed + list(session.open.values()):
+                    if presence.exported != presence.revision:
+                        pending.append((presence, presence.revision))
+                        records.append(self._to_dict(sid, session, presence))
+        
+        if not records:
+            return records
+        if send is not None:
+            send(records)
+        
+        with self._lock:
+            for presence, revision in pending:
+                presence.exported = max(presence.exported, revision)
+            for sid in session_ids:
+                session = self._sessions.get(sid)
+                if session is not None:
+                    session.closed = [p for p in session.closed if p.exported != p.revision]
+        ATTENDANCE_RECORDS_FLUSHED.inc(len(records))
+        return records
+    
+    def start_flushing(self, url: str, interval: float):
+        """POST batched records to url every interval seconds, from the first sighting on.
+
+        The thread starts lazily so that a pre-fork master, which never
+        records sightings, does not start one its workers would not inherit.
+        """
+        self._flush_url = url
+        self._flush_interval = interval
+    
+    def _ensure_flusher(self):
+        if not self._flush_url or (self._flusher is not None and self._flusher.is_alive()):
+            return
+        with self._lock:
+            if self._flusher is not None and self._flusher.is_alive():
+                return
+            self._flusher = threading.Thread(target=self._run_flusher, name='attendance-flusher', daemon=True)
+            self._flusher.start()
+    
+    def _run_flusher(self):
+        while True:
+            time.sleep(self._flush_interval)
+            try:
+                self.flush(send=self._post)
+            except Exception as e:
+                print(f"Attendance flush failed, retrying next interval: {e}")
+    
+    def _post(self, records: List[Dict]):
+        body = json.dumps({"records": records}).encode()
+        request = urllib.request.Request(self._flush_url, data=body, method='POST',
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=10) as response:
+            response.read()
+    
+    def _expire_due(self, now: float):
+        """_expire at most once per window, for the request paths"""
+        if now - self._last_expired >= self.window_seconds:
+            self._expire(now)
+    
+    def _expire(self, now: float):
+        """Close presences past the window and drop sessions idle past the TTL"""
+        self._last_expired = now
+        for sid in list(self._sessions):
+            session = self._sessions[sid]
+            if now - session.last_activity > self.session_ttl_seconds:
+                del self._sessions[sid]
+                continue
+            for name, presence in list(session.open.items()):
+                if now - presence.last_seen > self.window_seconds:
+                    presence.close()
+                    session.closed.append(session.open.pop(name))
+    
+    def _to_dict(self, session_id: str, session: AttendanceSession, presence: Presence) -> Dict:
+        return {
+            "session_id": session_id,
+            "group": session.group,
+            "person_name": presence.person_name,
+            "first_seen": presence.first_seen,
+            "last_seen": presence.last_seen,
+            "best_confidence": presence.best_confidence,
+            "sightings": presence.sightings,
+            "open": session.open.get(presence.person_name) is presence
+        }
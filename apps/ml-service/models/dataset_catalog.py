@@ -0,0 +1,235 @@
+import bisect
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from .dataset_embedder import IMAGE_EXTENSIONS
+
+# Person folders statted per pool task, so a large dataset is not one future per folder
+SCAN_CHUNK_SIZE = 256
+
+# Per person: (image count, folder mtime in ns)
+CatalogEntry = Tuple[int, int]
+
+class DatasetCatalog:
+    """Sorted in-memory listing of a dataset folder: each person's image count.
+
+    The folder is walked once, with person folders scanned on a thread pool,
+    and then kept current by the gallery's own writes (update_person,
+    remove_person, rename_person). Changes made outside the service, or by
+    another worker process, are picked up by polling folder mtimes every
+    refresh_seconds in the background, so listing never waits on the
+    filesystem after the first build. page() walks the sorted names from a
+    cursor or prefix and stops once the page is full.
+    """
+    
+    def __init__(self, dataset_folder: str, workers: int = 16, refresh_seconds: float = 60):
+        self.dataset_folder = dataset_folder
+        self.workers = max(1, workers)
+        self.refresh_seconds = refresh_seconds
+        self._entries: Dict[str, CatalogEntry] = {}
+        self._names: List[str] = []
+        self._root_mtime: Optional[int] = None
+        self._built = False
+        self._refreshed_at = 0.0
+        self._refreshing = False
+        # People changed by the gallery while a scan was running; the scan's view of them is stale
+        self._touched: Optional[Set[str]] = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        self._ensure_built()
+        return len(self._names)
+    
+    def page(self, after: Optional[str] = None, limit: int = 100, prefix: Optional[str] = None,
+             search: Optional[str] = None,
+             predicate: Optional[Callable[[str], bool]] = None) -> Tuple[List[Tuple[str, int]], Optional[str]]:
+        """Up to limit (name, image count) pairs in name order, and the cursor for the next page.
+
+        after is the previous page's cursor. prefix narrows the walk to one
+        range of names; search (case-insensitive substring) and predicate
+        skip names within it.
+        """
+        self._ensure_built()
+        self._refresh_if_due()
+        search = search.lower() if search else None
+        items = []
+        with self._lock:
+            start = bisect.bisect_left(self._names, prefix) if prefix else 0
+            if after is not None:
+                start = max(start, bisect.bisect_right(self._names, after))
+            names = self._names
+            for position in range(start, len(names)):
+                name = names[position]
+                if prefix and not name.startswith(prefix):
+                    break
+                if search and search not in name.lower():
+                    continue
+                if predicate is not None and not predicate(name):
+                    continue
+                if len(items) == limit:
+                    return items, items[-1][0]
+                items.append((name, self._entries[name][0]))
+        return items, None
+    
+    def update_person(self, person_name: str):
+        """Rescan one person's folder after the gallery changed their images"""
+        entry = self._scan_person(person_name)
+        with self._lock:
+            self._touch(person_name)
+            if self._built:
+                self._set(person_name, entry)
+    
+    def remove_person(self, person_name: str):
+        with self._lock:
+            self._touch(person_name)
+            if self._built:
+                self._set(person_name, None)
+    
+    def rename_person(self, person_name: str, new_name: str):
+        entry = self._scan_person(new_name)
+        with self._lock:
+            self._touch(person_name)
+            self._touch(new_name)
+            if self._built:
+                self._set(person_name, None)
+                self._set(new_name, entry)
+    
+    def refresh(self):
+        """Pick up people and images changed on disk since the last build or refresh"""
+        with self._lock:
+            if not self._built:
+                return
+            self._touched = set()
+            known = dict(self._entries)
+            root_mtime = self._root_mtime
+        try:
+            current_root_mtime = self._mtime(self.dataset_folder)
+            names = self._list_people() if current_root_mtime != root_mtime else list(known)
+            # A folder's mtime changes when files are added, removed or renamed in it
+            mtimes = self._parallel(self._mtimes, names)
+            changed = [name for name in names if name not in known or mtimes[name] != known[name][1]]
+            scanned = self._parallel(self._scan_people, changed)
+            with self._lock:
+                touched = self._touched
+                updates = {name: None for name in set(known) - set(names)}
+                updates.update((name, scanned.get(name)) for name in changed)
+                size = len(self._entries)
+                for name, entry in updates.items():
+                    if name in touched:
+                        continue
+                    if entry is None:
+                        self._entries.pop(name, None)
+                    else:
+                        self._entries[name] = entry
+                # Re-sorting once beats inserting many names one by one
+                if len(self._entries) != size or any(name not in known for name in changed):
+                    self._names = sorted(self._entries)
+                self._root_mtime = current_root_mtime
+        finally:
+            with self._lock:
+                self._touched = None
+                self._refreshing = False
+                self._refreshed_at = time.monotonic()
+    
+    def _ensure_built(self):
+        if self._built:
+            return
+        with self._build_lock:
+            if self._built:
+                return
+            with self._lock:
+                self._touched = set()
+            try:
+                root_mtime = self._mtime(self.dataset_folder)
+                entries = self._parallel(self._scan_people, self._list_people())
+                with self._lock:
+                    for name in self._touched:
+                        entry = self._scan_person(name)
+                        if entry is None:
+                            entries.pop(name, None)
+                        else:
+                            entries[name] = entry
+                    self._entries = entries
+                    self._names = sorted(entries)
+                    self._root_mtime = root_mtime
+                    self._built = True
+                    self._refreshed_at = time.monotonic()
+            finally:
+                with self._lock:
+                    self._touched = None
+    
+    def _refresh_if_due(self):
+        """Start a background refresh when the last one is older than refresh_seconds"""
+        if not self.refresh_seconds:
+            return
+        with self._lock:
+            if self._refreshing or time.monotonic() - self._refreshed_at < self.refresh_seconds:
+                return
+            self._refreshing = True
+        threading.Thread(target=self.refresh, name='dataset-catalog-refresh', daemon=True).start()
+    
+    def _touch(self, person_name: str):
+        if self._touched is not None:
+            self._touched.add(person_name)
+    
+    def _set(self, person_name: str, entry: Optional[CatalogEntry]):
+        """Insert, update or (with None) remove one person, keeping names sorted"""
+        present = person_name in self._entries
+        if entry is None:
+            if present:
+                del self._entries[person_name]
+                del self._names[bisect.bisect_left(self._names, person_name)]
+            return
+        if not present:
+            bisect.insort(self._names, person_name)
+        self._entries[person_name] = entry
+    
+    def _parallel(self, scan: Callable[[List[str]], Dict], names: List[str]) -> Dict:
+        """Run scan over chunks of names on a thread pool and merge the results"""
+        chunks = [names[start:start + SCAN_CHUNK_SIZE] for start in range(0, len(names), SCAN_CHUNK_SIZE)]
+        if len(chunks) <= 1 or self.workers == 1:
+            return scan(names)
+        results = {}
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(chunks)), thread_name_prefix='dataset-scan') as executor:
+            for result in executor.map(scan, chunks):
+                results.update(result)
+        return results
+    
+    def _list_people(self) -> List[str]:
+        if not os.path.isdir(self.dataset_folder):
+            return []
+        with os.scandir(self.dataset_folder) as entries:
+            return [entry.name for entry in entries if entry.is_dir()]
+    
+    def _scan_people(self, names: List[str]) -> Dict[str, CatalogEntry]:
+        entries = {}
+        for name in names:
+            entry = self._scan_person(name)
+            if entry is not None:
+                entries[name] = entry
+        return entries
+    
+    def _mtimes(self, names: List[str]) -> Dict[str, Optional[int]]:
+        return {name: self._mtime(os.path.join(self.dataset_folder, name)) for name in names}
+    
+    def _scan_person(self, person_name: str) -> Optional[CatalogEntry]:
+        """Image count and folder mtime, or None if the folder is gone"""
+        person_folder = os.path.join(self.dataset_folder, person_name)
+        try:
+            mtime = os.stat(person_folder).st_mtime_ns
+            with os.scandir(person_folder) as entries:
+                count = sum(1 for entry in entries if entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file())
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        return count, mtime
+    
+    @staticmethod
+    def _mtime(path: str) -> Optional[int]:
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
@@ -0,0 +1,296 @@
+import multiprocessing
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import cv2
+import numpy as np
+
+from config import get_config
+from .face_quality import FaceQualityGate
+from .identity_templates import build_identity_templates, face_quality_weight
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+ProgressCallback = Callable[[int, int], None]
+
+# Per-image result: embedding of the enrolled face (or None) and its quality weight
+ImageEmbedding = Tuple[Optional[np.ndarray], float]
+
+# Face analysis model and quality gate owned by each pool worker process
+_worker_model = None
+_worker_gate = None
+
+def _init_worker(config_name: Optional[str]):
+    """Load a private face analysis model in a pool worker"""
+    global _worker_model, _worker_gate
+    from .session_pool import create_face_analysis
+    
+    config = get_config(config_name)
+    _worker_model = create_face_analysis(config)
+    _worker_gate = FaceQualityGate(config)
+
+def _embed_image(face_analysis_model, image_path: str, quality_gate: FaceQualityGate) -> ImageEmbedding:
+    """Embedding and quality weight of the largest face that passes the quality gate, or (None, 0.0).
+
+    Only the chosen face is embedded; the other faces in the photo are
+    detected but never reach the recognition model.
+    """
+    from insightface.app.common import Face
+    
+    try:
+        image = cv2.imread(image_path)
+        if image is None:
+            print(f"Debug: Failed to load image: {image_path}")
+            return None, 0.0
+        bboxes, kpss = face_analysis_model.det_model.detect(image, max_num=0, metric='default')
+        faces = [Face(bbox=bboxes[i, 0:4], kps=kpss[i] if kpss is not None else None, det_score=bboxes[i, 4])
+                 for i in range(bboxes.shape[0])]
+        reasons = quality_gate.assess(image, faces, 'enrollment')
+        good_faces = [face for face, reason in zip(faces, reasons) if reason is None]
+        if good_faces:
+            # The enrolled person is normally the largest face in their own photo
+            face = max(good_faces, key=lambda f: (f.bbox[2] - f.bbox[0]) * (f.bbox[3] - f.bbox[1]))
+            face_analysis_model.models['recognition'].get(image, face)
+            weight = face_quality_weight(face.bbox, getattr(face, 'det_score', None))
+            return np.asarray(face.embedding, dtype=np.float32), weight
+        if faces:
+            print(f"Debug: No usable face in {image_path}: {', '.join(reasons)}")
+    except Exception as e:
+        print(f"Error processing {image_path}: {e}")
+    return None, 0.0
+
+def _embed_chunk(image_paths: List[str]) -> List[Tuple[str, ImageEmbedding]]:
+    """Pool task: embed a chunk of images with the worker's model"""
+    return [(path, _embed_image(_worker_model, path, _worker_gate)) for path in image_paths]
+
+class EmbeddingCache:
+    """Per-image embeddings and quality weights keyed by dataset-relative path, validated by mtime and size"""
+    
+    def __init__(self, cache_file: str):
+        self.cache_file = cache_file
+        self._entries: Dict[str, Tuple[int, int, Optional[np.ndarray], float]] = {}
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def load(self):
+        """Load cached entries, starting empty if the file is missing or unreadable"""
+        if not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'rb') as f:
+                self._entries = pickle.load(f)
+        except Exception as e:
+            print(f"Error loading embedding cache: {e}")
+            self._entries = {}
+    
+    def save(self):
+        """Write the cache atomically"""
+        tmp_file = f"{self.cache_file}.tmp"
+        try:
+            with open(tmp_file, 'wb') as f:
+                pickle.dump(self._entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, self.cache_file)
+        except Exception as e:
+            print(f"Error saving embedding cache: {e}")
+    
+    def lookup(self, key: str, stat: os.stat_result) -> Tuple[bool, ImageEmbedding]:
+        """Return (hit, (embedding, weight)) for an image; a hit may carry a None embedding"""
+        entry = self._entries.get(key)
+        # Entries written before quality weights were cached are treated as misses
+        if entry is None or len(entry) != 4 or entry[0] != stat.st_mtime_ns or entry[1] != stat.st_size:
+            return False, (None, 0.0)
+        return True, (entry[2], entry[3])
+    
+    def store(self, key: str, stat: os.stat_result, result: ImageEmbedding):
+        embedding, weight = result
+        self._entries[key] = (stat.st_mtime_ns, stat.st_size, embedding, weight)
+    
+    def discard(self, key: str):
+        self._entries.pop(key, None)
+    
+    def rename(self, old_key: str, new_key: str):
+        entry = self._entries.pop(old_key, None)
+        if entry is not None:
+            self._entries[new_key] = entry
+    
+    def keys(self) -> Set[str]:
+        return set(self._entries.keys())
+    
+    def clear(self):
+        self._entries = {}
+
+class DatasetEmbedder:
+    """Incremental, optionally multi-process computation of dataset embeddings.
+
+    Each image's embedding is cached against its path, mtime and size, so a
+    recompute only runs the model on new or changed images and only
+    re-aggregates the people whose images changed. Uncached images are split
+    into chunks and embedded on a process pool when there are enough of them.
+    Each person becomes one quality-weighted centroid, or up to
+    IDENTITY_TEMPLATES templates (see build_identity_templates).
+    """
+    
+    def __init__(self, config_name=None, dataset_folder: Optional[str] = None, cache_file: Optional[str] = None):
+        self.config_name = config_name
+        self.config = get_config(config_name)
+        self.dataset_folder = dataset_folder or self.config.DATASET_FOLDER
+        self.cache = EmbeddingCache(cache_file or self.config.EMBEDDING_CACHE_FILE)
+        self.cache.load()
+        self.quality_gate = FaceQualityGate(self.config)
+    
+    def _worker_count(self) -> int:
+        return self.config.EMBEDDING_WORKERS or os.cpu_count() or 1
+    
+    def scan(self) -> Dict[str, Dict[str, os.stat_result]]:
+        """Map each person to their images (dataset-relative path -> stat)"""
+        people = {}
+        if not os.path.exists(self.dataset_folder):
+            return people
+        
+        with os.scandir(self.dataset_folder) as person_entries:
+            for person_entry in person_entries:
+                if person_entry.is_dir():
+                    people[person_entry.name] = self.scan_person(person_entry.name)
+        return people
+    
+    def scan_person(self, person_name: str) -> Dict[str, os.stat_result]:
+        """Map one person's images (dataset-relative path -> stat)"""
+        images = {}
+        person_folder = os.path.join(self.dataset_folder, person_name)
+        if not os.path.isdir(person_folder):
+            return images
+        with os.scandir(person_folder) as image_entries:
+            for image_entry in image_entries:
+                if image_entry.is_file() and image_entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    images[os.path.join(person_name, image_entry.name)] = image_entry.stat()
+        return images
+    
+    def image_embeddings(self, images: Dict[str, os.stat_result]) -> Tuple[np.ndarray, np.ndarray]:
+        """A person's cached image embeddings and quality weights, skipping images without a usable face"""
+        embeddings = []
+        weights = []
+        for key, stat in images.items():
+            _, (embedding, weight) = self.cache.lookup(key, stat)
+            if embedding is not None:
+                embeddings.append(embedding)
+                weights.append(weight)
+        return np.array(embeddings), np.array(weights)
+    
+    def aggregate(self, images: Dict[str, os.stat_result]) -> Optional[np.ndarray]:
+        """Combine a person's cached image embeddings into their centroid or templates"""
+        embeddings, weights = self.image_embeddings(images)
+        if not len(embeddings):
+            return None
+        return build_identity_templates(embeddings, weights, self.config.IDENTITY_TEMPLATES)
+    
+    def _matches_template_setting(self, embedding: np.ndarray, image_count: int) -> bool:
+        """False when a stored embedding was aggregated under a different IDENTITY_TEMPLATES setting"""
+        if self.config.IDENTITY_TEMPLATES <= 1:
+            return np.ndim(embedding) == 1
+        return np.ndim(embedding) == 2 or image_count <= 1
+    
+    def embed_files(self, face_analysis_model, image_paths: List[str],
+                    progress_callback: Optional[ProgressCallback] = None) -> List[Optional[np.ndarray]]:
+        """Embed specific dataset images in-process and record them in the cache"""
+        embeddings = []
+        for i, image_path in enumerate(image_paths):
+            result = _embed_image(face_analysis_model, image_path, self.quality_gate)
+            key = os.path.relpath(image_path, self.dataset_folder)
+            self.cache.store(key, os.stat(image_path), result)
+            embeddings.append(result[0])
+            if progress_callback:
+                progress_callback(i + 1, len(image_paths))
+        self.cache.save()
+        return embeddings
+    
+    def compute(self, face_analysis_model, previous: Optional[Dict[str, np.ndarray]] = None,
+                progress_callback: Optional[ProgressCallback] = None, force: bool = False) -> Dict[str, np.ndarray]:
+        """Compute per-person embeddings, reusing cached per-image results"""
+        previous = previous or {}
+        if force:
+            self.cache.clear()
+        
+        people = self.scan()
+        known_keys = self.cache.keys()
+        
+        pending = []
+        affected = set()
+        for person_name, images in people.items():
+            for key, stat in images.items():
+                hit, _ = self.cache.lookup(key, stat)
+                if not hit:
+                    pending.append(key)
+                    affected.add(person_name)
+            if person_name not in previous or not self._matches_template_setting(previous[person_name], len(images)):
+                affected.add(person_name)
+        
+        # People whose images were deleted since the last run also need re-averaging
+        current_keys = {key for images in people.values() for key in images}
+        for stale_key in known_keys - current_keys:
+            affected.add(stale_key.split(os.sep, 1)[0])
+            self.cache.discard(stale_key)
+        
+        print(f"Debug: {len(pending)} of {len(current_keys)} images need embedding, "
+              f"{len(affected)} people affected")
+        
+        results = self._embed_pending(face_analysis_model, pending, progress_callback)
+        for key, result in results:
+            person_name = key.split(os.sep, 1)[0]
+            self.cache.store(key, people[person_name][key], result)
+        self.cache.save()
+        
+        embeddings = {}
+        for person_name, images in people.items():
+            if person_name not in affected and person_name in previous:
+                embeddings[person_name] = previous[person_name]
+                continue
+            
+            person_embedding = self.aggregate(images)
+            if person_embedding is not None:
+                embeddings[person_name] = person_embedding
+                templates = 1 if person_embedding.ndim == 1 else len(person_embedding)
+                print(f"Computed embedding for {person_name} from {len(images)} images ({templates} templates)")
+            else:
+                print(f"Debug: No embeddings computed for {person_name}")
+        
+        print(f"Debug: Total embeddings computed: {len(embeddings)}")
+        return embeddings
+    
+    def _embed_pending(self, face_analysis_model, keys: List[str],
+                       progress_callback: Optional[ProgressCallback]) -> List[Tuple[str, ImageEmbedding]]:
+        """Embed uncached images, in-process or on a process pool"""
+        total = len(keys)
+        if progress_callback:
+            progress_callback(0, total)
+        if not keys:
+            return []
+        
+        paths = [os.path.abspath(os.path.join(self.dataset_folder, key)) for key in keys]
+        workers = min(self._worker_count(), max(1, total // self.config.EMBEDDING_CHUNK_SIZE))
+        
+        if workers <= 1 or total < self.config.EMBEDDING_POOL_MIN_IMAGES:
+            results = []
+            for i, (key, path) in enumerate(zip(keys, paths)):
+                results.append((key, _embed_image(face_analysis_model, path, self.quality_gate)))
+                if progress_callback:
+                    progress_callback(i + 1, total)
+            return results
+        
+        chunk_size = self.config.EMBEDDING_CHUNK_SIZE
+        key_of_path = dict(zip(paths, keys))
+        results = []
+        # Spawned workers avoid forking a process that holds ONNX Runtime threads
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_worker, initargs=(self.config_name,)) as executor:
+            futures = [executor.submit(_embed_chunk, paths[start:start + chunk_size])
+                       for start in range(0, total, chunk_size)]
+            for future in as_completed(futures):
+                for path, result in future.result():
+                    results.append((key_of_path[path], result))
+                if progress_callback:
+                    progress_callback(len(results), total)
+        return results
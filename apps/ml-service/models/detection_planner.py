@@ -0,0 +1,151 @@
+import numpy as np
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from .face_tracker import iou_matrix
+
+DETECTION_MODES = ('fixed', 'adaptive', 'two_pass')
+
+# (bboxes with scores as (N, 5), keypoints as (N, 5, 2) or None)
+Detections = Tuple[np.ndarray, Optional[np.ndarray]]
+
+def _round_up(value: float, step: int) -> int:
+    return max(step, int(np.ceil(value / step)) * step)
+
+def adaptive_input_size(width: int, height: int, min_face: int, min_face_input: int,
+                        min_input: int, max_input: int, step: int = 32) -> Tuple[int, int]:
+    """Detector input (width, height) at which a min_face-pixel face spans min_face_input pixels.
+
+    The input keeps the image's aspect ratio so no letterbox padding is run
+    through the detector, and is never larger than the image itself: small
+    images are not upscaled and large ones are only shrunk as far as the
+    smallest wanted face allows, within [min_input, max_input].
+    """
+    long_side = max(width, height)
+    target = long_side * min_face_input / max(min_face, 1)
+    target = min(max(target, min_input), max_input, long_side)
+    scale = target / long_side
+    return _round_up(width * scale, step), _round_up(height * scale, step)
+
+def non_max_suppression(bboxes: np.ndarray, iou_threshold: float = 0.4) -> List[int]:
+    """Indices of the boxes kept by greedy NMS, highest score first"""
+    order = np.argsort(-bboxes[:, 4])
+    overlaps = iou_matrix(bboxes[order, :4], bboxes[order, :4])
+    suppressed = np.zeros(len(order), dtype=bool)
+    keep = []
+    for position, index in enumerate(order):
+        if suppressed[position]:
+            continue
+        keep.append(int(index))
+        suppressed |= overlaps[position] > iou_threshold
+    return keep
+
+def merge_regions(regions: np.ndarray) -> np.ndarray:
+    """Union overlapping [x1, y1, x2, y2] regions until none overlap"""
+    regions = [region.copy() for region in regions]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regions)):
+            for j in range(len(regions) - 1, i, -1):
+                a, b = regions[i], regions[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    regions[i] = np.concatenate([np.minimum(a[:2], b[:2]), np.maximum(a[2:], b[2:])])
+                    del regions[j]
+                    merged = True
+    return np.array(regions).reshape(-1, 4)
+
+class DetectionPlanner:
+    """Chooses the detector input resolution for each image.
+
+    fixed     - one pass at Config.DETECTION_SIZE, as prepared on the model
+    adaptive  - one pass at a size derived from the image dimensions and
+                DETECTION_MIN_FACE_SIZE, so webcam crops run small and
+                large group photos run large enough for their smallest faces
+    two_pass  - a cheap pass at DETECTION_SIZE with a lowered threshold
+                finds candidate faces, then only the regions around them are
+                re-detected at the adaptive resolution
+
+    Non-fixed modes need a detector with a dynamic input shape, which the
+    buffalo_l SCRFD model has.
+    """
+    
+    def __init__(self, config):
+        if config.DETECTION_MODE not in DETECTION_MODES:
+            raise ValueError(f"DETECTION_MODE must be one of {', '.join(DETECTION_MODES)}")
+        self.mode = config.DETECTION_MODE
+        self.coarse_size = tuple(config.DETECTION_SIZE)
+        self.min_face = config.DETECTION_MIN_FACE_SIZE
+        self.min_face_input = config.DETECTION_MIN_FACE_INPUT
+        self.min_input = config.DETECTION_MIN_INPUT
+        self.max_input = config.DETECTION_MAX_INPUT
+        self.step = config.DETECTION_SIZE_STEP
+        self.coarse_threshold = config.DETECTION_COARSE_THRESHOLD
+        self.region_margin = config.DETECTION_REGION_MARGIN
+        self.region_max_fraction = config.DETECTION_REGION_MAX_FRACTION
+    
+    def input_size(self, width: int, height: int) -> Tuple[int, int]:
+        return adaptive_input_size(width, height, self.min_face, self.min_face_input,
+                                   self.min_input, self.max_input, self.step)
+    
+    def detect(self, det_model, image: np.ndarray) -> Detections:
+        """Run the detector on an image according to the configured mode"""
+        if self.mode == 'fixed':
+            return det_model.detect(image, max_num=0, metric='default')
+        
+        height, width = image.shape[:2]
+        fine_size = self.input_size(width, height)
+        if self.mode == 'adaptive' or max(fine_size) <= max(self.coarse_size):
+            return det_model.detect(image, input_size=fine_size, max_num=0, metric='default')
+        return self._detect_two_pass(det_model, image, fine_size)
+    
+    def _detect_two_pass(self, det_model, image: np.ndarray, fine_size: Tuple[int, int]) -> Detections:
+        height, width = image.shape[:2]
+        with self._threshold(det_model, self.coarse_threshold) as final_threshold:
+            bboxes, kpss = det_model.detect(image, input_size=self.coarse_size, max_num=0, metric='default')
+        if bboxes.shape[0] == 0:
+            return bboxes, kpss
+        
+        # Grow each candidate by a few face sizes; neighbours in a group photo sit about that far apart
+        sizes = np.maximum(bboxes[:, 2] - bboxes[:, 0], bboxes[:, 3] - bboxes[:, 1])[:, None] * self.region_margin
+        regions = np.concatenate([bboxes[:, :2] - sizes, bboxes[:, 2:4] + sizes], axis=1)
+        regions = np.clip(regions, 0, [width, height, width, height]).astype(int)
+        regions = merge_regions(regions)
+        
+        area = ((regions[:, 2] - regions[:, 0]) * (regions[:, 3] - regions[:, 1])).sum()
+        if area >= self.region_max_fraction * width * height:
+            return det_model.detect(image, input_size=fine_size, max_num=0, metric='default')
+        
+        scale = max(fine_size) / max(width, height)
+        found_boxes = [bboxes[bboxes[:, 4] >= final_threshold]]
+        found_kpss = [kpss[bboxes[:, 4] >= final_threshold]] if kpss is not None else None
+        for x1, y1, x2, y2 in regions:
+            crop = image[y1:y2, x1:x2]
+            region_size = (_round_up((x2 - x1) * scale, self.step), _round_up((y2 - y1) * scale, self.step))
+            region_boxes, region_kpss = det_model.detect(crop, input_size=region_size, max_num=0, metric='default')
+            region_boxes[:, :4] += [x1, y1, x1, y1]
+            found_boxes.append(region_boxes)
+            if found_kpss is not None and region_kpss is not None:
+                found_kpss.append(region_kpss + [x1, y1])
+        
+        bboxes = np.concatenate(found_boxes)
+        keep = non_max_suppression(bboxes)
+        kpss = np.concatenate(found_kpss)[keep] if found_kpss is not None else None
+        return bboxes[keep], kpss
+    
+    @contextmanager
+    def _threshold(self, det_model, threshold: float):
+        """Temporarily lower the detector's score threshold, yielding the usual one.
+
+        Sessions are used by one request at a time, so the change is not
+        visible to other requests.
+        """
+        original = getattr(det_model, 'det_thresh', None)
+        if original is None:
+            yield 0.0
+            return
+        det_model.det_thresh = min(original, threshold)
+        try:
+            yield original
+        finally:
+            det_model.det_thresh = original
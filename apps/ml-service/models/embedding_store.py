@@ -0,0 +1,317 @@
+import base64
+import json
+import os
+import threading
+import numpy as np
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development only
+    fcntl = None
+
+from .gallery_index import pack_embeddings, unpack_rows
+
+FORMAT_VERSION = 1
+
+class EmbeddingStore:
+    """Versioned on-disk embedding store.
+
+    A store directory holds:
+      index.json            - format version, generation, gallery version, dtype, dim, the row names
+                              and per-identity match thresholds
+      matrix-<gen>.npy      - contiguous (rows, dim) matrix of L2-normalized embeddings;
+                              a person with several templates owns consecutive rows
+      journal-<gen>.jsonl   - append-only log of puts, deletes, renames and threshold changes since the snapshot
+
+    The matrix is opened with np.load(mmap_mode='r'), so processes that load
+    the same generation share its pages through the OS page cache. Snapshots
+    are written to new generation-suffixed files and published by atomically
+    replacing index.json, so a crash never leaves a half-written store.
+
+    Several worker processes may share one store. Writers hold write_lock(),
+    and readers compare disk_state() with the state they last saw to notice
+    changes made by other processes.
+
+    The gallery version counts changes: the snapshot records the version it
+    was taken at and every journal entry adds one, so compacting the journal
+    into a new snapshot keeps the version. operations_since() returns the
+    journal entries after a version for replicas to replay.
+    """
+    
+    def __init__(self, store_dir: str, dtype: str = 'float32'):
+        if dtype not in ('float32', 'float16'):
+            raise ValueError(f"Unsupported embedding store dtype: {dtype}")
+        self.store_dir = store_dir
+        self.dtype = np.dtype(dtype)
+        self.index_file = os.path.join(store_dir, 'index.json')
+        self.generation = 0
+        self.base_version = 0
+        self.journal_entries = 0
+        # Per-identity thresholds recorded in the loaded snapshot
+        self.snapshot_thresholds: Dict[str, float] = {}
+        self._lock = threading.Lock()
+    
+    @property
+    def version(self) -> int:
+        """Gallery version of the loaded snapshot plus its journal"""
+        return self.base_version + self.journal_entries
+    
+    def exists(self) -> bool:
+        return os.path.exists(self.index_file)
+    
+    def _matrix_file(self, generation: int) -> str:
+        return os.path.join(self.store_dir, f"matrix-{generation}.npy")
+    
+    def _journal_file(self, generation: int) -> str:
+        return os.path.join(self.store_dir, f"journal-{generation}.jsonl")
+    
+    def disk_state(self) -> Optional[Tuple[int, int, int, int]]:
+        """Cheap fingerprint of the published snapshot and its journal, None if there is no store"""
+        try:
+            index = os.stat(self.index_file)
+        except FileNotFoundError:
+            return None
+        try:
+            journal_size = os.stat(self._journal_file(self.generation)).st_size
+        except FileNotFoundError:
+            journal_size = 0
+        return index.st_ino, index.st_mtime_ns, self.generation, journal_size
+    
+    @contextmanager
+    def write_lock(self) -> Iterator[None]:
+        """Exclusive lock on the store held across processes, for writes and journal reads"""
+        os.makedirs(self.store_dir, exist_ok=True)
+        with open(os.path.join(self.store_dir, '.lock'), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            # Closing the file releases the lock
+            yield
+    
+    def _read_index(self) -> Dict:
+        with open(self.index_file, 'r') as f:
+            index = json.load(f)
+        if index.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported embedding store version: {index.get('format_version')}")
+        return index
+    
+    def load_snapshot(self) -> Tuple[List[str], np.ndarray]:
+        """Memory-map the current snapshot and return its row names and matrix"""
+        index = self._read_index()
+        self.generation = index["generation"]
+        # Stores written before versioning start counting from their current journal
+        self.base_version = index.get("version", 0)
+        self.snapshot_thresholds = index.get("thresholds", {})
+        matrix = np.load(self._matrix_file(self.generation), mmap_mode='r')
+        if matrix.shape[0] != len(index["names"]):
+            raise ValueError("Embedding store index and matrix row counts differ")
+        return index["names"], matrix
+    
+    def read_journal(self) -> List[Dict]:
+        """Return journal operations for the loaded generation, truncating a torn final line"""
+        operations = []
+        journal_file = self._journal_file(self.generation)
+        if not os.path.exists(journal_file):
+            self.journal_entries = 0
+            return operations
+        
+        valid_length = 0
+        with open(journal_file, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError("missing newline")
+                    operation = json.loads(line)
+                except ValueError:
+                    print(f"Ignoring incomplete journal entry in {journal_file}")
+                    break
+                if operation.get("op") == "put":
+                    operation["vector"] = self.decode_vector(operation)
+                operations.append(operation)
+                valid_length += len(line)
+        
+        # Drop a partial write so later appends start on a clean line
+        if valid_length != os.path.getsize(journal_file):
+            with open(journal_file, 'r+b') as f:
+                f.truncate(valid_length)
+        
+        self.journal_entries = len(operations)
+        return operations
+    
+    def operations_since(self, version: int) -> Optional[List[Dict]]:
+        """Raw journal entries after version, each tagged with the version it produces.
+
+        None when version predates the loaded snapshot (its entries were
+        compacted away) or is ahead of the store. Call under write_lock()
+        after loading, so the journal matches journal_entries.
+        """
+        if version < self.base_version or version > self.version:
+            return None
+        operations = []
+        journal_file = self._journal_file(self.generation)
+        if version == self.version or not os.path.exists(journal_file):
+            return operations
+        with open(journal_file, 'rb') as f:
+            for position, line in enumerate(f, start=1):
+                if position > self.journal_entries:
+                    break
+                if self.base_version + position > version:
+                    operations.append({**json.loads(line), "version": self.base_version + position})
+        return operations
+    
+    @staticmethod
+    def decode_vector(operation: Dict) -> np.ndarray:
+        """The float32 embedding carried by a put entry"""
+        vector = np.frombuffer(base64.b64decode(operation["vector"]), dtype=operation["dtype"])
+        return vector.astype(np.float32).reshape(operation.get("shape", -1))
+    
+    def load(self) -> Dict[str, np.ndarray]:
+        """Load the snapshot and replay the journal into a name -> embedding dict"""
+        names, matrix = self.load_snapshot()
+        embeddings = unpack_rows(names, matrix)
+        self.replay(embeddings, self.read_journal())
+        return embeddings
+    
+    @staticmethod
+    def replay(embeddings: Dict[str, np.ndarray], operations: List[Dict],
+               thresholds: Optional[Dict[str, float]] = None):
+        """Apply journal operations to a name -> embedding dict, and optionally thresholds, in place"""
+        if thresholds is None:
+            thresholds = {}
+        for operation in operations:
+            name = operation["name"]
+            if operation["op"] == "put":
+                embeddings[name] = operation["vector"]
+                if "threshold" in operation:
+                    thresholds[name] = operation["threshold"]
+            elif operation["op"] == "delete":
+                embeddings.pop(name, None)
+                thresholds.pop(name, None)
+            elif operation["op"] == "rename":
+                if name in embeddings:
+                    embeddings[operation["new_name"]] = embeddings.pop(name)
+                if name in thresholds:
+                    thresholds[operation["new_name"]] = thresholds.pop(name)
+            elif operation["op"] == "threshold":
+                thresholds[name] = operation["threshold"]
+    
+    def save(self, embeddings: Dict[str, np.ndarray], version: Optional[int] = None,
+             thresholds: Optional[Dict[str, float]] = None):
+        """Write a new snapshot generation and publish it atomically.
+
+        The snapshot is recorded at version, by default the current one: a
+        compaction does not change the gallery. Callers saving a change pass
+        a later version.
+        """
+        names, matrix = pack_embeddings(embeddings)
+        if names:
+            matrix = matrix.astype(self.dtype, copy=False)
+        else:
+            matrix = np.empty((0, 0), dtype=self.dtype)
+        
+        with self._lock:
+            os.makedirs(self.store_dir, exist_ok=True)
+            with open(self._matrix_file(self.generation + 1), 'wb') as f:
+                np.save(f, matrix)
+                f.flush()
+                os.fsync(f.fileno())
+            self._publish(names, int(matrix.shape[1]) if names else 0, version, thresholds)
+    
+    def open_matrix(self, rows: int, dim: int) -> np.memmap:
+        """Create the next generation's matrix file as a writable memory map, to fill and pass to save_matrix()"""
+        os.makedirs(self.store_dir, exist_ok=True)
+        return np.lib.format.open_memmap(self._matrix_file(self.generation + 1), mode='w+',
+                                         dtype=self.dtype, shape=(rows, dim))
+    
+    def save_matrix(self, names: List[str], matrix: np.memmap, version: int,
+                    thresholds: Optional[Dict[str, float]] = None):
+        """Publish a matrix filled in through open_matrix() as the next snapshot generation"""
+        matrix.flush()
+        with self._lock:
+            self._publish(names, int(matrix.shape[1]) if names else 0, version, thresholds)
+    
+    def discard_matrix(self):
+        """Remove a next-generation matrix file that open_matrix() created but was never published"""
+        matrix_file = self._matrix_file(self.generation + 1)
+        if os.path.exists(matrix_file):
+            os.remove(matrix_file)
+    
+    def _publish(self, names: List[str], dim: int, version: Optional[int], thresholds: Optional[Dict[str, float]]):
+        """Point index.json at the next generation's matrix file, already written, and drop the previous generation; callers hold _lock"""
+        previous_generation = self.generation if self.exists() else None
+        generation = self.generation + 1
+        if version is None:
+            version = self.version
+        index = {
+            "format_version": FORMAT_VERSION,
+            "generation": generation,
+            "version": version,
+            "dtype": self.dtype.name,
+            "dim": dim,
+            "names": names,
+            "thresholds": {name: thresholds[name] for name in dict.fromkeys(names) if name in (thresholds or {})}
+        }
+        tmp_index_file = f"{self.index_file}.tmp"
+        with open(tmp_index_file, 'w') as f:
+            json.dump(index, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_index_file, self.index_file)
+        self._fsync_dir()
+        
+        self.generation = generation
+        self.base_version = version
+        self.journal_entries = 0
+        self.snapshot_thresholds = index["thresholds"]
+        
+        if previous_generation is not None:
+            for old_file in (self._matrix_file(previous_generation), self._journal_file(previous_generation)):
+                if os.path.exists(old_file):
+                    os.remove(old_file)
+    
+    def append(self, operation: Dict):
+        """Durably append one operation to the journal of the current generation"""
+        line = json.dumps(operation, separators=(',', ':')) + '\n'
+        with self._lock:
+            os.makedirs(self.store_dir, exist_ok=True)
+            with open(self._journal_file(self.generation), 'a') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self.journal_entries += 1
+    
+    def append_put(self, name: str, embedding: np.ndarray, threshold: Optional[float] = None):
+        vector = np.ascontiguousarray(embedding, dtype=np.float32)
+        operation = {
+            "op": "put",
+            "name": name,
+            "dtype": "float32",
+            "shape": list(vector.shape),
+            "vector": base64.b64encode(vector.tobytes()).decode('ascii')
+        }
+        if threshold is not None:
+            operation["threshold"] = threshold
+        self.append(operation)
+    
+    def append_delete(self, name: str):
+        self.append({"op": "delete", "name": name})
+    
+    def append_rename(self, name: str, new_name: str):
+        self.append({"op": "rename", "name": name, "new_name": new_name})
+    
+    def append_threshold(self, name: str, threshold: float):
+        self.append({"op": "threshold", "name": name, "threshold": threshold})
+    
+    def _fsync_dir(self):
+        """Persist the directory entry after a rename where the platform allows it"""
+        try:
+            fd = os.open(self.store_dir, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
@@ -1,162 +1,414 @@
 import cv2
 import numpy as np
 import os
-import pickle
-import insightface
-from scipy.spatial.distance import cdist
-from typing import Dict, List, Tuple, Optional
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, List, Tuple, Optional
 import base64
 from config import get_config
+from utils.metrics import GALLERY_SIZE, StageTimer
+
+if TYPE_CHECKING:
+    from insightface.app.common import Face
+from .dataset_embedder import ProgressCallback
+from .detection_planner import DetectionPlanner
+from .face_quality import FaceQualityGate
+from .gallery import Gallery, GalleryRegistry, group_folder
+from .gallery_snapshot import GallerySync
+from .micro_batcher import MicroBatcher
+from .response_profile import ResponseProfile
+from .result_cache import ResultCache
+from .session_pool import ModelSessionPool, create_face_analysis, resolve_thread_settings
 
 class FaceModel:
     
     def __init__(self, config_name=None):
+        self.config_name = config_name
         self.config = get_config(config_name)
-        self.dataset_folder = self.config.DATASET_FOLDER
-        self.embeddings_file = self.config.EMBEDDINGS_FILE
         self.face_analysis_model = None
-        self.dataset_embeddings = {}
+        self.session_pool = None
+        self.detection_planner = DetectionPlanner(self.config)
+        self.quality_gate = FaceQualityGate(self.config)
+        self.batcher = None
+        self.result_cache = None
+        self.load_status = 'pending'
+        self.load_progress = None
+        self.load_error = None
+        self._load_started = None
+        self._ready = threading.Event()
+        
+        if self.config.RESULT_CACHE_ENABLED:
+            self.result_cache = ResultCache(
+                'result',
+                max_bytes=self.config.RESULT_CACHE_MAX_BYTES,
+                ttl_seconds=self.config.RESULT_CACHE_TTL_SECONDS
+            )
+        self.galleries = GalleryRegistry(
+            self._create_gallery,
+            self._load_gallery,
+            memory_budget=self.config.GALLERY_MEMORY_BUDGET_BYTES
+        )
+        # Replicas copy galleries from a primary instead of embedding the dataset themselves
+        self.gallery_sync = (GallerySync(self.config.GALLERY_SYNC_SOURCE, self.config.GALLERY_SYNC_TOKEN)
+                             if self.config.GALLERY_SYNC_SOURCE else None)
         
-        os.makedirs(self.dataset_folder, exist_ok=True)
+        if self.config.MICRO_BATCHING_ENABLED:
+            # One batch worker per pooled session so batches run concurrently
+            pool_size, _, _ = resolve_thread_settings(self.config)
+            self.batcher = MicroBatcher(
+                self._recognize_submitted,
+                max_batch_size=self.config.BATCH_MAX_SIZE,
+                max_wait_ms=self.config.BATCH_MAX_WAIT_MS,
+                workers=pool_size
+            )
+        
+        # Read at scrape time so index swaps are always reflected
+        GALLERY_SIZE.set_function(self.get_dataset_size)
     
     def initialize_model(self):
-        """Initialize InsightFace face analysis model"""
+        """Initialize a pool of InsightFace face analysis models, warm them up and load the gallery"""
+        self._load_started = time.time()
         try:
-            self.face_analysis_model = insightface.app.FaceAnalysis(
-                providers=self.config.PROVIDERS,
-                allowed_modules=self.config.ALLOWED_MODULES
+            self._set_load_status('loading_model')
+            pool_size, intra_op_threads, inter_op_threads = resolve_thread_settings(self.config)
+            session_pool = ModelSessionPool(
+                lambda slot: create_face_analysis(self.config, slot),
+                pool_size
             )
-            self.face_analysis_model.prepare(ctx_id=self.config.CTX_ID, det_size=self.config.DETECTION_SIZE)
-            print("InsightFace models (detection and recognition) initialized successfully")
+            print(f"InsightFace models (detection and recognition) initialized successfully: "
+                  f"{pool_size} sessions x {intra_op_threads} intra-op / {inter_op_threads} inter-op threads")
+            
+            if self.config.MODEL_WARMUP:
+                self._set_load_status('warming_up')
+                self.warm_up(session_pool)
+            
+            self.session_pool = session_pool
+            self.face_analysis_model = session_pool.primary
             
+            self._set_load_status('loading_gallery')
             self.load_dataset_embeddings()
+            # A gallery preloaded by a pre-fork master may be older than its store
+            self.galleries.refresh()
+            if self.config.GALLERY_RELOAD_INTERVAL_SECONDS:
+                self.galleries.watch(self.config.GALLERY_RELOAD_INTERVAL_SECONDS)
+            if self.gallery_sync is not None and self.config.GALLERY_SYNC_INTERVAL_SECONDS:
+                self.gallery_sync.watch(self.galleries, self.config.GALLERY_SYNC_INTERVAL_SECONDS)
+            
+            self._set_load_status('ready')
+            self._ready.set()
+            print(f"Face model ready in {time.time() - self._load_started:.1f}s")
             return True
             
         except Exception as e:
+            self.load_error = str(e)
+            self._set_load_status('failed')
             print(f"Error initializing models: {e}")
             return False
     
+    def initialize_in_background(self) -> threading.Thread:
+        """Run initialize_model on a daemon thread so the server can start accepting probes"""
+        thread = threading.Thread(target=self.initialize_model, name='face-model-loader', daemon=True)
+        thread.start()
+        return thread
+    
+    def preload_gallery(self) -> bool:
+        """Load the stored default gallery without the models, so forked workers inherit it.
+
+        Returns False when nothing is stored yet; the gallery is then computed
+        once the models have loaded.
+        """
+        gallery = self._create_gallery(None)
+        if not gallery.load_stored() and not self._pull_gallery(gallery):
+            return False
+        self.galleries.add(gallery)
+        return True
+    
+    def warm_up(self, session_pool: ModelSessionPool):
+        """Run detection and recognition once per session so ONNX Runtime initializes before real traffic"""
+        rng = np.random.default_rng(0)
+        det_width, det_height = self.config.DETECTION_SIZE
+        image = rng.integers(0, 255, size=(det_height, det_width, 3), dtype=np.uint8)
+        for model in session_pool.instances:
+            model.det_model.detect(image, max_num=0, metric='default')
+            recognition_model = model.models.get('recognition')
+            if recognition_model is not None:
+                crop_size = recognition_model.input_size[0]
+                recognition_model.get_feat([image[:crop_size, :crop_size]])
+    
+    def _set_load_status(self, status: str):
+        self.load_status = status
+        self.load_progress = None
+    
+    def _report_load_progress(self, done: int, total: int):
+        self.load_progress = {"done": done, "total": total}
+    
+    def get_load_status(self) -> Dict:
+        """Startup stage, progress of the current stage and any load error"""
+        elapsed = time.time() - self._load_started if self._load_started else 0.0
+        return {
+            "status": self.load_status,
+            "progress": self.load_progress,
+            "elapsed_seconds": round(elapsed, 1),
+            "error": self.load_error
+        }
+    
     def is_model_loaded(self) -> bool:
         """Check if the face analysis model is loaded"""
         return self.face_analysis_model is not None
     
-    def get_dataset_size(self) -> int:
-        """Get the number of people in the dataset"""
-        return len(self.dataset_embeddings)
+    def is_ready(self) -> bool:
+        """Check if the models are warmed up and the gallery is loaded"""
+        return self._ready.is_set()
+    
+    def get_dataset_size(self, group: Optional[str] = None) -> int:
+        """Get the number of people in a loaded gallery, 0 if it is not loaded"""
+        gallery = self.galleries.peek(group)
+        return len(gallery.dataset_embeddings) if gallery is not None else 0
+    
+    def group_exists(self, group: Optional[str]) -> bool:
+        """True for the default gallery and for groups that have been enrolled into"""
+        return group is None or self.galleries.peek(group) is not None or os.path.isdir(group_folder(self.config, group))
     
     def load_dataset_embeddings(self):
-        """Load precomputed embeddings from pickle file or recompute if not exists"""
-        if os.path.exists(self.embeddings_file):
-            try:
-                with open(self.embeddings_file, 'rb') as f:
-                    self.dataset_embeddings = pickle.load(f)
-                print(f"Loaded {len(self.dataset_embeddings)} precomputed embeddings")
-                return
-            except Exception as e:
-                print(f"Error loading embeddings file: {e}")
-        
-        print("Recomputing dataset embeddings...")
-        self.dataset_embeddings = self.compute_dataset_embeddings()
-        self.save_dataset_embeddings()
+        """Load the default gallery; group galleries are loaded on first use"""
+        with self.galleries.use(None):
+            pass
     
-    def compute_dataset_embeddings(self) -> Dict[str, np.ndarray]:
-        """Compute and return embeddings for all faces in the dataset"""
-        embeddings = {}
-        
-        if not os.path.exists(self.dataset_folder) or self.face_analysis_model is None:
-            return embeddings
-        
-        print(f"Debug: Starting to process dataset folder: {self.dataset_folder}")
-        
-        for person_name in os.listdir(self.dataset_folder):
-            person_path = os.path.join(self.dataset_folder, person_name)
-            
-            if os.path.isdir(person_path):
-                person_embeddings = []
-                image_files = [f for f in os.listdir(person_path) 
-                              if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
-                print(f"Debug: Found {len(image_files)} image files for {person_name}")
-                
-                for image_file in image_files:
-                    image_path = os.path.join(person_path, image_file)
-                    try:
-                        image = cv2.imread(image_path)
-                        if image is not None:
-                            faces = self.face_analysis_model.get(image)
-                            if faces and len(faces) > 0:
-                                person_embeddings.append(faces[0].embedding)
-                                print(f"Debug: Added embedding for face in {image_file}")
-                        else:
-                            print(f"Debug: Failed to load image: {image_path}")
-                    except Exception as e:
-                        print(f"Error processing {image_path}: {e}")
-                
-                if person_embeddings:
-                    avg_embedding = np.mean(person_embeddings, axis=0)
-                    embeddings[person_name] = avg_embedding
-                    print(f"Computed embedding for {person_name} from {len(person_embeddings)} images")
-                else:
-                    print(f"Debug: No embeddings computed for {person_name}")
+    def _create_gallery(self, group: Optional[str]) -> Gallery:
+        return Gallery(self.config, self.config_name, group, self.result_cache)
+    
+    def _load_gallery(self, gallery: Gallery):
+        """Load a gallery from its embedding store, or compute it from its dataset folder"""
+        if gallery.load_stored() or self._pull_gallery(gallery):
+            return
         
-        print(f"Debug: Total embeddings computed: {len(embeddings)}")
-        return embeddings
+        print(f"Recomputing dataset embeddings{f' for group {gallery.group}' if gallery.group else ''}...")
+        # Only the default gallery loads during startup, where /health/ready reports progress
+        progress_callback = self._report_load_progress if gallery.group is None else None
+        gallery.replace(self._compute_embeddings(gallery, progress_callback))
     
-    def save_dataset_embeddings(self):
-        """Save computed embeddings to pickle file"""
+    def _pull_gallery(self, gallery: Gallery) -> bool:
+        """Import a gallery from the sync source, if one is configured; False if it is unreachable"""
+        if self.gallery_sync is None:
+            return False
         try:
-            with open(self.embeddings_file, 'wb') as f:
-                pickle.dump(self.dataset_embeddings, f)
-            print(f"Saved {len(self.dataset_embeddings)} embeddings to {self.embeddings_file}")
+            self.gallery_sync.pull(gallery)
+            return True
         except Exception as e:
-            print(f"Error saving embeddings: {e}")
+            print(f"Error pulling gallery{gallery._label()} from {self.gallery_sync.source}: {e}")
+            return False
+    
+    def compute_dataset_embeddings(self, progress_callback: Optional[ProgressCallback] = None,
+                                   force: bool = False, group: Optional[str] = None) -> Dict[str, np.ndarray]:
+        """Compute and return embeddings for all faces in a group's dataset, reusing cached per-image results"""
+        with self.galleries.use(group) as gallery:
+            return self._compute_embeddings(gallery, progress_callback, force)
     
-    def detect_faces(self, image: np.ndarray) -> List[Dict]:
-        """Detect faces in an image and return face data"""
+    def _compute_embeddings(self, gallery: Gallery, progress_callback: Optional[ProgressCallback] = None,
+                            force: bool = False) -> Dict[str, np.ndarray]:
+        if not os.path.exists(gallery.dataset_folder) or self.face_analysis_model is None:
+            return {}
+        
+        print(f"Debug: Starting to process dataset folder: {gallery.dataset_folder}")
+        with self.session_pool.acquire() as model:
+            return gallery.dataset_embedder.compute(
+                model,
+                previous=gallery.dataset_embeddings,
+                progress_callback=progress_callback,
+                force=force
+            )
+    
+    def detect_faces(self, image: np.ndarray, profile: Optional[ResponseProfile] = None) -> List[Dict]:
+        """Detect faces in an image and return the face data selected by the response profile.
+
+        Only the detection model runs. With a binary-crop profile the encoded
+        JPEG bytes are returned under "face_crop" for the caller to send as
+        separate parts instead of base64.
+        """
         if self.face_analysis_model is None:
             raise Exception("Face analysis model not loaded")
         
-        faces = self.face_analysis_model.get(image)
+        profile = profile or ResponseProfile()
+        timer = StageTimer()
+        with self.session_pool.acquire() as model:
+            with timer.stage('detection'):
+                faces = self._detect(model, image)
         detected_faces = []
         
         for i, face in enumerate(faces):
             bbox = face.bbox.astype(int)
             x1, y1, x2, y2 = bbox
             
-            aligned_face = self._align_face(image, face)
-            
-            face_crop_b64 = None
-            if aligned_face is not None:
-                _, buffer = cv2.imencode('.jpg', aligned_face)
-                face_crop_b64 = base64.b64encode(buffer).decode('utf-8')
-            
-            detected_faces.append({
+            face_data = {
                 "face_id": i,
                 "bbox": [int(x1), int(y1), int(x2), int(y2)],
-                "confidence": float(face.det_score) if hasattr(face, 'det_score') else 0.95,
-                "landmarks": face.kps.tolist() if hasattr(face, 'kps') else None,
-                "face_crop_base64": face_crop_b64
-            })
+                "confidence": float(face.det_score) if hasattr(face, 'det_score') else 0.95
+            }
+            
+            if profile.include_landmarks:
+                face_data["landmarks"] = face.kps.tolist() if face.kps is not None else None
+            
+            if profile.include_crops:
+                with timer.stage('crops'):
+                    aligned_face = self._align_face(image, face, profile.crop_size)
+                    
+                    encoded_crop = None
+                    if aligned_face is not None and aligned_face.size > 0:
+                        _, buffer = cv2.imencode('.jpg', aligned_face, [cv2.IMWRITE_JPEG_QUALITY, profile.crop_quality])
+                        encoded_crop = buffer.tobytes()
+                    
+                    if profile.binary_crops:
+                        face_data["face_crop"] = encoded_crop
+                    else:
+                        face_data["face_crop_base64"] = base64.b64encode(encoded_crop).decode('utf-8') if encoded_crop else None
+            
+            detected_faces.append(face_data)
         
+        timer.observe(len(detected_faces))
         return detected_faces
     
-    def recognize_faces(self, image: np.ndarray, threshold: float = 0.6) -> Tuple[List[Dict], List[Dict]]:
-        """Recognize faces in an image and return recognized faces and attendance records"""
+    def recognize_faces(self, image: np.ndarray, threshold: Optional[float] = None,
+                        group: Optional[str] = None) -> Tuple[List[Dict], List[Dict]]:
+        """Recognize faces in an image against a group's gallery and return recognized faces and attendance records.
+
+        threshold defaults to RECOGNITION_THRESHOLD; a different value shifts
+        every person's calibrated threshold by the same amount.
+        """
+        if self.face_analysis_model is None:
+            raise Exception("Face analysis model not loaded")
+        
+        # Concurrent single-image requests are merged into one pass by the batcher
+        if self.batcher is not None and threshold in (None, self.config.RECOGNITION_THRESHOLD):
+            return self.batcher.submit((image, group)).result()
+        
+        return self._recognize_images([image], threshold, [group])[0]
+    
+    def recognize_faces_batch(self, images: List[np.ndarray], threshold: Optional[float] = None,
+                              group: Optional[str] = None) -> List[Tuple[List[Dict], List[Dict]]]:
+        """Recognize faces in several images with one recognition and matching pass per chunk"""
+        if self.face_analysis_model is None:
+            raise Exception("Face analysis model not loaded")
+        
+        results = []
+        chunk_size = self.config.BATCH_MAX_SIZE
+        for start in range(0, len(images), chunk_size):
+            chunk = images[start:start + chunk_size]
+            results.extend(self._recognize_images(chunk, threshold, [group] * len(chunk)))
+        return results
+    
+    def _recognize_submitted(self, items: List[Tuple[np.ndarray, Optional[str]]]) -> List[Tuple[List[Dict], List[Dict]]]:
+        """Micro-batcher callback; the merged requests may each target a different group"""
+        images = [image for image, _ in items]
+        groups = [group for _, group in items]
+        return self._recognize_images(images, groups=groups)
+    
+    def _recognize_images(self, images: List[np.ndarray], threshold: Optional[float] = None,
+                          groups: Optional[List[Optional[str]]] = None) -> List[Tuple[List[Dict], List[Dict]]]:
+        """Detect per image, embed every face that passes the quality gate at once, then match per group"""
+        if threshold is None:
+            threshold = self.config.RECOGNITION_THRESHOLD
+        if groups is None:
+            groups = [None] * len(images)
+        
+        # Stage timings cover the whole pass, so 'faces' counts every face in the batch
+        timer = StageTimer()
+        with self.session_pool.acquire() as model:
+            with timer.stage('detection'):
+                faces_per_image = [self._detect(model, image) for image in images]
+            with timer.stage('quality'):
+                reasons_per_image = [self.quality_gate.assess(image, faces, 'recognition')
+                                     for image, faces in zip(images, faces_per_image)]
+            accepted_per_image = [[face for face, reason in zip(faces, reasons) if reason is None]
+                                  for faces, reasons in zip(faces_per_image, reasons_per_image)]
+            with timer.stage('embedding'):
+                self._embed_faces(model, images, accepted_per_image)
+        
+        matches_per_image = [[] for _ in images]
+        with timer.stage('matching'):
+            for group in dict.fromkeys(groups):
+                members = [i for i, image_group in enumerate(groups) if image_group == group]
+                group_faces = [face for i in members for face in accepted_per_image[i]]
+                image_ids = [i for i in members for _ in accepted_per_image[i]]
+                matches = iter(self._find_best_matches_batch([face.embedding for face in group_faces], threshold,
+                                                             group, image_ids))
+                # Rejected faces keep their place with no match
+                for i in members:
+                    matches_per_image[i] = [next(matches) if reason is None else None for reason in reasons_per_image[i]]
+        timer.observe(sum(len(faces) for faces in faces_per_image))
+        
+        return [self._build_recognition_result(faces, matches, reasons)
+                for faces, matches, reasons in zip(faces_per_image, matches_per_image, reasons_per_image)]
+    
+    def detect_face_objects(self, image: np.ndarray) -> List['Face']:
+        """Detect faces and return the raw Face objects (bbox, kps, det_score)"""
         if self.face_analysis_model is None:
             raise Exception("Face analysis model not loaded")
         
-        faces = self.face_analysis_model.get(image)
+        with self.session_pool.acquire() as model:
+            return self._detect(model, image)
+    
+    def match_faces(self, image: np.ndarray, faces: List['Face'], threshold: Optional[float] = None,
+                    group: Optional[str] = None) -> Tuple[List[Optional[Dict]], int]:
+        """Embed already-detected faces and match them against a group's gallery.
+
+        Returns a match per face, None for faces the quality gate rejected
+        or nobody matched, and how many faces passed the gate and were embedded.
+        """
+        if threshold is None:
+            threshold = self.config.RECOGNITION_THRESHOLD
+        reasons = self.quality_gate.assess(image, faces, 'stream')
+        accepted = [face for face, reason in zip(faces, reasons) if reason is None]
+        if not accepted:
+            return [None] * len(faces), 0
+        
+        with self.session_pool.acquire() as model:
+            self._embed_faces(model, [image], [accepted])
+        matches = iter(self._find_best_matches_batch([face.embedding for face in accepted], threshold, group))
+        return [next(matches) if reason is None else None for reason in reasons], len(accepted)
+    
+    def _detect(self, model, image: np.ndarray) -> List['Face']:
+        """Run only the detection model on an image, at the resolution the planner picks"""
+        from insightface.app.common import Face
+        
+        bboxes, kpss = self.detection_planner.detect(model.det_model, image)
+        faces = []
+        for i in range(bboxes.shape[0]):
+            faces.append(Face(
+                bbox=bboxes[i, 0:4],
+                kps=kpss[i] if kpss is not None else None,
+                det_score=bboxes[i, 4]
+            ))
+        return faces
+    
+    def _embed_faces(self, model, images: List[np.ndarray], faces_per_image: List[List['Face']]):
+        """Align every face and compute all embeddings in a single recognition call"""
+        from insightface.utils import face_align
         
-        if not faces:
-            return [], []
+        recognition_model = model.models['recognition']
+        crop_size = recognition_model.input_size[0]
         
-        face_embeddings = [face.embedding for face in faces]
+        crops = []
+        for image, faces in zip(images, faces_per_image):
+            for face in faces:
+                crops.append(face_align.norm_crop(image, landmark=face.kps, image_size=crop_size))
         
-        matches = self._find_best_matches_batch(face_embeddings, threshold)
+        if not crops:
+            return
         
+        embeddings = recognition_model.get_feat(crops)
+        index = 0
+        for faces in faces_per_image:
+            for face in faces:
+                face.embedding = embeddings[index].flatten()
+                index += 1
+    
+    def _build_recognition_result(self, faces: List['Face'], matches: List[Optional[Dict]],
+                                  reasons: List[Optional[str]]) -> Tuple[List[Dict], List[Dict]]:
+        """Turn faces and their matches into response dicts and attendance records"""
         recognized_faces = []
         attendance_records = []
         
-        for i, (face, match) in enumerate(zip(faces, matches)):
+        for i, (face, match, reason) in enumerate(zip(faces, matches, reasons)):
             face_data = {
                 "face_id": i,
                 "bbox": face.bbox.astype(int).tolist(),
@@ -166,8 +418,11 @@ class FaceModel:
             if match:
                 face_data.update({
                     "name": match["name"],
-                    "recognition_confidence": match["confidence"]
+                    "recognition_confidence": match["confidence"],
+                    "recognition_margin": match["margin"]
                 })
+                if "candidates" in match:
+                    face_data["candidates"] = match["candidates"]
                 recognized_faces.append(face_data)
                 
                 attendance_records.append({
@@ -179,112 +434,145 @@ class FaceModel:
             else:
                 face_data["name"] = "Unknown"
                 face_data["recognition_confidence"] = 0.0
+                if reason is not None:
+                    face_data["rejected_reason"] = reason
                 recognized_faces.append(face_data)
         
         return recognized_faces, attendance_records
     
-    def add_person_to_dataset(self, person_name: str, images: List) -> Tuple[List[str], bool]:
+    def add_person_to_dataset(self, person_name: str, images: List,
+                              group: Optional[str] = None) -> Tuple[List[str], bool]:
         """Add a person with images to the dataset"""
-        person_folder = os.path.join(self.dataset_folder, person_name)
-        os.makedirs(person_folder, exist_ok=True)
-        
-        uploaded_files = []
-        
-        for i, image_file in enumerate(images):
-            if image_file.filename:
-                filename = f"{person_name}_{i+1}.jpg"
-                filepath = os.path.join(person_folder, filename)
-                image_file.save(filepath)
-                uploaded_files.append(filename)
-        
-        # Recompute embeddings for this person
-        person_embeddings = []
-        for image_file in uploaded_files:
-            image_path = os.path.join(person_folder, image_file)
-            try:
-                image = cv2.imread(image_path)
-                if image is not None and self.face_analysis_model is not None:
-                    faces = self.face_analysis_model.get(image)
-                    if faces and len(faces) > 0:
-                        person_embeddings.append(faces[0].embedding)
-            except Exception as e:
-                print(f"Error processing {image_path}: {e}")
-        
-        embeddings_computed = False
-        if person_embeddings:
-            avg_embedding = np.mean(person_embeddings, axis=0)
-            self.dataset_embeddings[person_name] = avg_embedding
-            self.save_dataset_embeddings()
-            embeddings_computed = True
-        
+        uploaded_files = self.save_person_images(person_name, images, group)
+        embeddings_computed = self.compute_person_embedding(person_name, uploaded_files, group=group)
         return uploaded_files, embeddings_computed
     
-    def get_dataset_info(self) -> Dict:
-        """Get information about the dataset"""
-        dataset_info = []
-        
-        if os.path.exists(self.dataset_folder):
-            for person_name in os.listdir(self.dataset_folder):
-                person_path = os.path.join(self.dataset_folder, person_name)
-                if os.path.isdir(person_path):
-                    image_count = len([f for f in os.listdir(person_path) 
-                                     if f.lower().endswith(('.jpg', '.jpeg', '.png'))])
-                    has_embedding = person_name in self.dataset_embeddings
-                    dataset_info.append({
-                        "name": person_name,
-                        "image_count": image_count,
-                        "has_embedding": has_embedding
-                    })
+    def save_person_images(self, person_name: str, images: List, group: Optional[str] = None) -> List[str]:
+        """Write uploaded images into the person's dataset folder"""
+        with self.galleries.use(group) as gallery:
+            return gallery.save_person_images(person_name, images)
+    
+    def compute_person_embedding(self, person_name: str, filenames: List[str],
+                                 progress_callback: Optional[ProgressCallback] = None,
+                                 group: Optional[str] = None) -> bool:
+        """Embed a person's saved images and publish their re-aggregated embedding to the live gallery"""
+        if self.face_analysis_model is None:
+            return False
         
-        return {
-            "dataset": dataset_info,
-            "total_people": len(dataset_info),
-            "total_embeddings": len(self.dataset_embeddings)
-        }
+        with self.galleries.use(group) as gallery:
+            embedder = gallery.dataset_embedder
+            # Embed the new images plus any of the person's older images missing from the per-image cache
+            images = embedder.scan_person(person_name)
+            new_keys = {os.path.join(person_name, filename) for filename in filenames}
+            pending = [key for key, stat in images.items()
+                       if key in new_keys or not embedder.cache.lookup(key, stat)[0]]
+            embeddings = []
+            if pending:
+                image_paths = [os.path.join(gallery.dataset_folder, key) for key in pending]
+                with self.session_pool.acquire() as model:
+                    embeddings = embedder.embed_files(model, image_paths, progress_callback)
+            
+            gallery.publish_person_embedding(person_name)
+        return any(embedding is not None for embedding in embeddings)
     
-    def recompute_all_embeddings(self) -> int:
-        """Recompute all dataset embeddings"""
-        print("Recomputing all dataset embeddings...")
-        self.dataset_embeddings = self.compute_dataset_embeddings()
-        self.save_dataset_embeddings()
-        return len(self.dataset_embeddings)
+    def person_exists(self, person_name: str, group: Optional[str] = None) -> bool:
+        """True if the person has a dataset folder or a gallery embedding"""
+        with self.galleries.use(group) as gallery:
+            return gallery.person_exists(person_name)
     
-    def _align_face(self, image: np.ndarray, face) -> Optional[np.ndarray]:
-        """Align face using landmarks"""
-        try:
-            aligned_face = face.align()
-            return aligned_face
-        except:
-            # Fallback: crop using bounding box
-            bbox = face.bbox.astype(int)
-            x1, y1, x2, y2 = bbox
-            return image[y1:y2, x1:x2]
+    def image_exists(self, person_name: str, filename: str, group: Optional[str] = None) -> bool:
+        with self.galleries.use(group) as gallery:
+            return gallery.image_exists(person_name, filename)
     
-    def _find_best_matches_batch(self, face_embeddings: List[np.ndarray], threshold: float = 0.6) -> List[Optional[Dict]]:
-        """Find best matches for multiple face embeddings using batch processing"""
-        if not self.dataset_embeddings or not face_embeddings:
-            return [None] * len(face_embeddings)
-        
-        # Convert dataset embeddings to arrays
-        known_names = list(self.dataset_embeddings.keys())
-        known_embeddings = np.array([self.dataset_embeddings[name] for name in known_names])
-        
-        # Compute cosine similarities using cdist
-        query_embeddings = np.array(face_embeddings)
-        distances = cdist(query_embeddings, known_embeddings, metric='cosine')
-        similarities = 1 - distances  # Convert distance to similarity
-        
-        results = []
-        for i, face_similarities in enumerate(similarities):
-            best_idx = np.argmax(face_similarities)
-            best_similarity = face_similarities[best_idx]
+    def delete_person(self, person_name: str, group: Optional[str] = None) -> bool:
+        """Remove a person from the gallery, the embedding store and the dataset folder"""
+        with self.galleries.use(group) as gallery:
+            return gallery.delete_person(person_name)
+    
+    def remove_person_image(self, person_name: str, filename: str,
+                            progress_callback: Optional[ProgressCallback] = None,
+                            group: Optional[str] = None) -> bool:
+        """Delete one of a person's images and re-aggregate them from the rest"""
+        with self.galleries.use(group) as gallery:
+            if not gallery.delete_image(person_name, filename):
+                return False
+            self.compute_person_embedding(person_name, [], progress_callback, group)
+        return True
+    
+    def save_person_image(self, person_name: str, filename: str, image_file, group: Optional[str] = None):
+        """Atomically write an upload over one of a person's existing images"""
+        with self.galleries.use(group) as gallery:
+            gallery.save_person_image(person_name, filename, image_file)
+    
+    def rename_person(self, person_name: str, new_name: str, group: Optional[str] = None) -> bool:
+        """Rename a person's folder, cache entries and gallery rows without re-embedding"""
+        with self.galleries.use(group) as gallery:
+            return gallery.rename_person(person_name, new_name)
+    
+    def get_dataset_info(self, group: Optional[str] = None, **filters) -> Dict:
+        """Get one page of a group's dataset listing; filters are passed to Gallery.get_dataset_info"""
+        with self.galleries.use(group) as gallery:
+            return gallery.get_dataset_info(**filters)
+    
+    def get_gallery_version(self, group: Optional[str] = None) -> Dict:
+        with self.galleries.use(group) as gallery:
+            return {"group": group, "version": gallery.version, "people": len(gallery)}
+    
+    def export_gallery_snapshot(self, fileobj, group: Optional[str] = None) -> int:
+        """Write a group's gallery snapshot to fileobj; see Gallery.export_snapshot"""
+        with self.galleries.use(group) as gallery:
+            return gallery.export_snapshot(fileobj)
+    
+    def import_gallery_snapshot(self, fileobj, group: Optional[str] = None) -> Dict:
+        """Replace a group's gallery with a snapshot, without reading its dataset images"""
+        with self.galleries.use(group) as gallery:
+            return gallery.import_snapshot(fileobj)
+    
+    def export_gallery_delta(self, since: int, group: Optional[str] = None) -> Optional[Dict]:
+        with self.galleries.use(group) as gallery:
+            return gallery.export_delta(since)
+    
+    def apply_gallery_delta(self, delta: Dict, group: Optional[str] = None) -> Dict:
+        """Replay another instance's gallery changes; returns the changes applied and the new version"""
+        with self.galleries.use(group) as gallery:
+            applied = gallery.apply_delta(delta)
+            return {"applied": applied, "version": gallery.version}
+    
+    def recompute_all_embeddings(self, progress_callback: Optional[ProgressCallback] = None,
+                                 force: bool = False, group: Optional[str] = None) -> int:
+        """Recompute a group's dataset embeddings for new or changed images"""
+        print("Recomputing all dataset embeddings...")
+        with self.galleries.use(group) as gallery:
+            embeddings = self._compute_embeddings(gallery, progress_callback, force)
+            gallery.replace(embeddings)
+        return len(embeddings)
+    
+    def _align_face(self, image: np.ndarray, face, crop_size: Optional[int] = None) -> Optional[np.ndarray]:
+        """Align face using landmarks, or crop its bounding box when no size is requested"""
+        if crop_size and face.kps is not None:
+            from insightface.utils import face_align
             
-            if best_similarity > threshold:
-                results.append({
-                    "name": known_names[best_idx],
-                    "confidence": float(best_similarity)
-                })
-            else:
-                results.append(None)
+            # ArcFace alignment templates only scale to multiples of 112 or 128
+            align_size = crop_size if crop_size % 112 == 0 or crop_size % 128 == 0 else 112
+            aligned_face = face_align.norm_crop(image, landmark=face.kps, image_size=align_size)
+            if align_size != crop_size:
+                aligned_face = cv2.resize(aligned_face, (crop_size, crop_size), interpolation=cv2.INTER_AREA)
+            return aligned_face
         
-        return results 
\ No newline at end of file
+        height, width = image.shape[:2]
+        x1, y1, x2, y2 = face.bbox.astype(int)
+        x1, y1 = max(x1, 0), max(y1, 0)
+        x2, y2 = min(x2, width), min(y2, height)
+        crop = image[y1:y2, x1:x2]
+        if crop_size and crop.size > 0:
+            crop = cv2.resize(crop, (crop_size, crop_size), interpolation=cv2.INTER_AREA)
+        return crop
+    
+    def _find_best_matches_batch(self, face_embeddings: List[np.ndarray], threshold: Optional[float] = None,
+                                 group: Optional[str] = None,
+                                 image_ids: Optional[List[int]] = None) -> List[Optional[Dict]]:
+        """Match face embeddings in a group's gallery, each person at most once per image (see Gallery.find_matches)"""
+        if threshold is None:
+            threshold = self.config.RECOGNITION_THRESHOLD
+        with self.galleries.use(group) as gallery:
+            return gallery.find_matches(face_embeddings, threshold, image_ids)
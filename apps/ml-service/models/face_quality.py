@@ -0,0 +1,104 @@
+import cv2
+import numpy as np
+from collections import Counter
+from typing import TYPE_CHECKING, List, Optional
+
+from utils.metrics import FACE_QUALITY_CHECKS
+
+if TYPE_CHECKING:
+    from insightface.app.common import Face
+
+# Side of the grayscale crop sharpness is measured on, so the score does not depend on face size
+SHARPNESS_CROP_SIZE = 64
+
+class FaceQualityGate:
+    """Cheap checks that reject faces before the recognition model sees them.
+
+    Size and detector score come from the bounding boxes, measured on the
+    image as decoded: a JPEG downscaled on decode is embedded from that
+    smaller image, so its faces are gated at the resolution the recognition
+    model actually sees. Pose comes from the five landmarks: yaw is how far
+    the nose sits from the midpoint between the eyes, pitch how far it sits
+    from midway between the eye and mouth lines, both as a share of the
+    distance to the nearer extreme (0 is frontal).
+    Sharpness is the variance of the Laplacian over a fixed-size grayscale
+    crop. The cheaper checks run first, over every face at once; only faces
+    that pass them are cropped for the sharpness check.
+    """
+    
+    def __init__(self, config):
+        self.enabled = config.QUALITY_GATE_ENABLED
+        self.min_face_size = config.QUALITY_MIN_FACE_SIZE
+        self.min_det_score = config.QUALITY_MIN_DET_SCORE
+        self.min_sharpness = config.QUALITY_MIN_SHARPNESS
+        self.max_yaw = config.QUALITY_MAX_YAW
+        self.max_pitch = config.QUALITY_MAX_PITCH
+    
+    def assess(self, image: np.ndarray, faces: List['Face'], stage: str) -> List[Optional[str]]:
+        """Rejection reason per face ('too_small', 'low_score', 'pose' or 'blurry'), None for faces to embed"""
+        if not self.enabled or not faces:
+            return [None] * len(faces)
+        
+        bboxes = np.array([face.bbox[:4] for face in faces], dtype=np.float32).reshape(-1, 4)
+        scores = np.array([1.0 if face.det_score is None else face.det_score for face in faces], dtype=np.float32)
+        reasons = np.full(len(faces), None, dtype=object)
+        
+        short_side = np.minimum(bboxes[:, 2] - bboxes[:, 0], bboxes[:, 3] - bboxes[:, 1])
+        self._reject(reasons, short_side < self.min_face_size, 'too_small')
+        self._reject(reasons, scores < self.min_det_score, 'low_score')
+        
+        with_landmarks = np.array([face.kps is not None for face in faces])
+        candidates = np.nonzero(self._pending(reasons) & with_landmarks)[0]
+        if candidates.size:
+            yaw, pitch = self.pose(np.array([faces[i].kps for i in candidates], dtype=np.float32))
+            reasons[candidates[(yaw > self.max_yaw) | (pitch > self.max_pitch)]] = 'pose'
+        
+        candidates = np.nonzero(self._pending(reasons))[0]
+        if candidates.size and self.min_sharpness > 0:
+            sharpness = self.sharpness(image, bboxes[candidates])
+            reasons[candidates[sharpness < self.min_sharpness]] = 'blurry'
+        
+        for reason, count in Counter(reasons.tolist()).items():
+            FACE_QUALITY_CHECKS.labels(stage=stage, result=reason or 'accepted').inc(count)
+        return reasons.tolist()
+    
+    @staticmethod
+    def _pending(reasons: np.ndarray) -> np.ndarray:
+        return np.array([reason is None for reason in reasons], dtype=bool)
+    
+    def _reject(self, reasons: np.ndarray, mask: np.ndarray, reason: str):
+        """Set reason on faces in mask that no earlier check has rejected"""
+        reasons[mask & self._pending(reasons)] = reason
+    
+    @staticmethod
+    def pose(kpss: np.ndarray):
+        """Yaw and pitch proxies in [0, 1+] for (n, 5, 2) landmarks: eyes, nose, mouth corners"""
+        left_eye, right_eye, nose, mouth_left, mouth_right = kpss.transpose(1, 0, 2)
+        axis = right_eye - left_eye
+        eye_distance = np.maximum(np.linalg.norm(axis, axis=1), 1e-6)
+        # Nose position along the eye axis (0 at the left eye, 1 at the right) and across it
+        along = np.einsum('ij,ij->i', nose - left_eye, axis) / eye_distance ** 2
+        normal = np.stack([-axis[:, 1], axis[:, 0]], axis=1) / eye_distance[:, None]
+        eye_mid = (left_eye + right_eye) / 2
+        nose_depth = np.einsum('ij,ij->i', nose - eye_mid, normal)
+        mouth_depth = np.einsum('ij,ij->i', (mouth_left + mouth_right) / 2 - eye_mid, normal)
+        across = np.divide(nose_depth, mouth_depth, out=np.full_like(nose_depth, np.inf), where=mouth_depth != 0)
+        return np.abs(2 * along - 1), np.abs(2 * across - 1)
+    
+    @staticmethod
+    def sharpness(image: np.ndarray, bboxes: np.ndarray) -> np.ndarray:
+        """Variance of the 4-neighbour Laplacian over each face resized to a fixed grayscale square"""
+        height, width = image.shape[:2]
+        crops = np.zeros((len(bboxes), SHARPNESS_CROP_SIZE, SHARPNESS_CROP_SIZE), dtype=np.float32)
+        for i, (x1, y1, x2, y2) in enumerate(np.round(bboxes).astype(int)):
+            x1, y1 = max(x1, 0), max(y1, 0)
+            x2, y2 = min(x2, width), min(y2, height)
+            if x2 - x1 < 2 or y2 - y1 < 2:
+                continue
+            crop = cv2.resize(image[y1:y2, x1:x2], (SHARPNESS_CROP_SIZE, SHARPNESS_CROP_SIZE),
+                              interpolation=cv2.INTER_AREA)
+            crops[i] = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+        
+        laplacian = (crops[:, :-2, 1:-1] + crops[:, 2:, 1:-1] + crops[:, 1:-1, :-2] + crops[:, 1:-1, 2:]
+                     - 4 * crops[:, 1:-1, 1:-1])
+        return laplacian.reshape(len(bboxes), -1).var(axis=1)
@@ -0,0 +1,151 @@
+import numpy as np
+from typing import List, Optional, Tuple
+
+def iou_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU between two sets of [x1, y1, x2, y2] boxes"""
+    if boxes_a.size == 0 or boxes_b.size == 0:
+        return np.zeros((len(boxes_a), len(boxes_b)), dtype=np.float32)
+    
+    a = boxes_a[:, None, :]
+    b = boxes_b[None, :, :]
+    inter_w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    inter_h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    intersection = inter_w * inter_h
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    union = area_a + area_b - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-9), 0.0)
+
+class KalmanBoxFilter:
+    """Constant-velocity Kalman filter over a box's center, area and aspect ratio.
+
+    State is [cx, cy, area, aspect, vx, vy, varea]; aspect ratio is assumed
+    constant. This is the motion model used by SORT.
+    """
+    
+    _F = np.eye(7)
+    _F[0, 4] = _F[1, 5] = _F[2, 6] = 1.0
+    _H = np.eye(4, 7)
+    _Q = np.diag([1.0, 1.0, 1.0, 1.0, 0.01, 0.01, 0.0001])
+    _R = np.diag([1.0, 1.0, 10.0, 10.0])
+    
+    def __init__(self, bbox: np.ndarray):
+        self.x = np.zeros(7)
+        self.x[:4] = self._to_measurement(bbox)
+        self.P = np.diag([10.0, 10.0, 10.0, 10.0, 1000.0, 1000.0, 1000.0])
+    
+    @staticmethod
+    def _to_measurement(bbox: np.ndarray) -> np.ndarray:
+        width = bbox[2] - bbox[0]
+        height = bbox[3] - bbox[1]
+        return np.array([bbox[0] + width / 2.0, bbox[1] + height / 2.0, width * height, width / max(height, 1e-6)])
+    
+    def predict(self) -> np.ndarray:
+        if self.x[2] + self.x[6] <= 0:
+            self.x[6] = 0.0
+        self.x = self._F @ self.x
+        self.P = self._F @ self.P @ self._F.T + self._Q
+        return self.bbox
+    
+    def update(self, bbox: np.ndarray):
+        residual = self._to_measurement(bbox) - self._H @ self.x
+        S = self._H @ self.P @ self._H.T + self._R
+        K = self.P @ self._H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ residual
+        self.P = (np.eye(7) - K @ self._H) @ self.P
+    
+    @property
+    def bbox(self) -> np.ndarray:
+        area = max(self.x[2], 0.0)
+        width = np.sqrt(area * self.x[3]) if self.x[3] > 0 else 0.0
+        height = area / width if width > 0 else 0.0
+        return np.array([self.x[0] - width / 2.0, self.x[1] - height / 2.0,
+                         self.x[0] + width / 2.0, self.x[1] + height / 2.0])
+
+class Track:
+    """A face followed across frames, with the identity last assigned to it"""
+    
+    def __init__(self, track_id: int, bbox: np.ndarray, det_score: float, kps: Optional[np.ndarray]):
+        self.track_id = track_id
+        self.filter = KalmanBoxFilter(bbox)
+        self.bbox = np.asarray(bbox, dtype=np.float64)
+        self.det_score = det_score
+        self.kps = kps
+        self.hits = 1
+        self.frames_since_update = 0
+        self.name: Optional[str] = None
+        self.identity_confidence = 0.0
+        self.recognized = False
+        self.frames_since_recognition = 0
+    
+    def predict(self) -> np.ndarray:
+        self.frames_since_update += 1
+        self.bbox = self.filter.predict()
+        return self.bbox
+    
+    def update(self, bbox: np.ndarray, det_score: float, kps: Optional[np.ndarray]):
+        self.filter.update(bbox)
+        self.bbox = np.asarray(bbox, dtype=np.float64)
+        self.det_score = det_score
+        self.kps = kps
+        self.hits += 1
+        self.frames_since_update = 0
+    
+    def assign_identity(self, name: Optional[str], confidence: float):
+        self.name = name
+        self.identity_confidence = confidence
+        self.recognized = True
+        self.frames_since_recognition = 0
+    
+    def decay(self, factor: float):
+        """Lower identity confidence as frames pass without a fresh recognition"""
+        self.identity_confidence *= factor
+        self.frames_since_recognition += 1
+
+class FaceTracker:
+    """Associates detections with Kalman-predicted tracks by IoU"""
+    
+    def __init__(self, iou_threshold: float = 0.3, max_age: int = 30):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.tracks: List[Track] = []
+        self._next_id = 1
+    
+    @property
+    def tracks_created(self) -> int:
+        return self._next_id - 1
+    
+    def predict(self):
+        """Advance every track by one frame and drop those unseen for too long"""
+        for track in self.tracks:
+            track.predict()
+        self.tracks = [track for track in self.tracks if track.frames_since_update <= self.max_age]
+    
+    def update(self, bboxes: np.ndarray, scores: np.ndarray,
+               kpss: Optional[np.ndarray]) -> Tuple[List[Track], List[Track]]:
+        """Match detections to predicted tracks; returns (matched tracks, new tracks)"""
+        track_boxes = np.array([track.bbox for track in self.tracks]).reshape(-1, 4)
+        overlaps = iou_matrix(track_boxes, bboxes.reshape(-1, 4))
+        
+        matched_tracks = []
+        unmatched_detections = set(range(len(bboxes)))
+        if overlaps.size:
+            # Imported here so scipy only loads once a stream is processed
+            from scipy.optimize import linear_sum_assignment
+            track_rows, detection_cols = linear_sum_assignment(-overlaps)
+            for row, col in zip(track_rows, detection_cols):
+                if overlaps[row, col] < self.iou_threshold:
+                    continue
+                track = self.tracks[row]
+                track.update(bboxes[col], float(scores[col]), kpss[col] if kpss is not None else None)
+                matched_tracks.append(track)
+                unmatched_detections.discard(col)
+        
+        new_tracks = []
+        for col in sorted(unmatched_detections):
+            track = Track(self._next_id, bboxes[col], float(scores[col]), kpss[col] if kpss is not None else None)
+            self._next_id += 1
+            new_tracks.append(track)
+        self.tracks.extend(new_tracks)
+        
+        return matched_tracks, new_tracks
@@ -0,0 +1,656 @@
+import numpy as np
+import os
+import pickle
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+from utils.metrics import GALLERY_EVICTIONS, GALLERY_GROUPS_LOADED, GALLERY_MEMORY
+from .dataset_catalog import DatasetCatalog
+from .dataset_embedder import DatasetEmbedder
+from .embedding_store import EmbeddingStore
+from .gallery_index import create_gallery_index, normalize_embeddings, pack_embeddings, unpack_rows
+from .gallery_snapshot import SnapshotConflict, SnapshotError, build_delta, read_snapshot, verify_delta, write_snapshot
+from .open_set import IdentityCalibrator, OpenSetMatcher, ThresholdTable
+from .result_cache import EmbeddingMatchCache, ResultCache
+
+GROUP_NAME_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$')
+
+def validate_group(group: Optional[str]) -> Optional[str]:
+    """Normalize a group parameter, raising ValueError for names that are not safe folder names"""
+    if not group:
+        return None
+    if not GROUP_NAME_PATTERN.match(group) or group in ('.', '..'):
+        raise ValueError(f"Invalid group: {group!r}")
+    return group
+
+def group_folder(config, group: str) -> str:
+    return os.path.join(config.GROUPS_FOLDER, group)
+
+class Gallery:
+    """One group's enrolled people: dataset folder, embedding store, image cache and search index.
+
+    The default gallery (group None) keeps the top-level DATASET_FOLDER,
+    EMBEDDINGS_STORE_DIR and EMBEDDING_CACHE_FILE. Each named group keeps the
+    same layout under GROUPS_FOLDER/<group>/, so galleries never see each
+    other's people and a query only scans its own group.
+
+    Worker processes of a pre-fork server each hold their own Gallery over
+    the same store. Writes run under the store's cross-process lock after
+    first applying any changes other workers made, and refresh() picks up
+    those changes between writes.
+    """
+    
+    def __init__(self, config, config_name=None, group: Optional[str] = None,
+                 result_cache: Optional[ResultCache] = None):
+        self.config = config
+        self.group = group
+        if group is None:
+            self.dataset_folder = config.DATASET_FOLDER
+            self.embeddings_file = config.EMBEDDINGS_FILE
+            store_dir = config.EMBEDDINGS_STORE_DIR
+            cache_file = config.EMBEDDING_CACHE_FILE
+        else:
+            root = group_folder(config, group)
+            self.dataset_folder = os.path.join(root, 'dataset')
+            self.embeddings_file = None
+            store_dir = os.path.join(root, 'embeddings_store')
+            cache_file = os.path.join(root, 'embedding_cache.pkl')
+        
+        self.embedding_store = EmbeddingStore(store_dir, config.EMBEDDINGS_STORE_DTYPE)
+        self.dataset_embedder = DatasetEmbedder(config_name, self.dataset_folder, cache_file)
+        self.catalog = DatasetCatalog(
+            self.dataset_folder,
+            workers=config.DATASET_SCAN_WORKERS,
+            refresh_seconds=config.DATASET_CATALOG_REFRESH_SECONDS
+        )
+        self.dataset_embeddings: Dict[str, np.ndarray] = {}
+        # Calibrated match thresholds; people without one use RECOGNITION_THRESHOLD
+        self.thresholds: Dict[str, float] = {}
+        self.gallery_index = create_gallery_index(config)
+        self.calibrator = IdentityCalibrator(config)
+        self.matcher = OpenSetMatcher(config)
+        self.result_cache = result_cache
+        self.match_cache = None
+        self._threshold_table: Optional[ThresholdTable] = None
+        self.users = 0
+        self._store_state = None
+        self._lock = threading.Lock()
+        
+        if config.MATCH_CACHE_SIZE:
+            self.match_cache = EmbeddingMatchCache(
+                'match',
+                capacity=config.MATCH_CACHE_SIZE,
+                radius=config.MATCH_CACHE_RADIUS,
+                k=self.matcher.search_k
+            )
+        
+        os.makedirs(self.dataset_folder, exist_ok=True)
+    
+    def __len__(self) -> int:
+        return len(self.gallery_index)
+    
+    @property
+    def nbytes(self) -> int:
+        return self.gallery_index.nbytes
+    
+    @property
+    def version(self) -> int:
+        """Number of changes made to the gallery; see EmbeddingStore"""
+        return self.embedding_store.version
+    
+    def load_stored(self) -> bool:
+        """Load embeddings from the store or a legacy pickle; False if neither is usable"""
+        if self.embedding_store.exists():
+            try:
+                with self.embedding_store.write_lock():
+                    self._load_embedding_store()
+                print(f"Loaded {len(self.dataset_embeddings)} precomputed embeddings{self._label()}")
+                return True
+            except Exception as e:
+                print(f"Error loading embedding store: {e}")
+        elif self.embeddings_file and os.path.exists(self.embeddings_file):
+            try:
+                with open(self.embeddings_file, 'rb') as f:
+                    self.dataset_embeddings = pickle.load(f)
+                with self._store_write():
+                    self.rebuild_index()
+                    self.save()
+                print(f"Migrated {len(self.dataset_embeddings)} embeddings from {self.embeddings_file}")
+                return True
+            except Exception as e:
+                print(f"Error loading embeddings file: {e}")
+        return False
+    
+    def _load_embedding_store(self):
+        """Memory-map the store snapshot, replay its journal and index the result"""
+        names, matrix = self.embedding_store.load_snapshot()
+        operations = self.embedding_store.read_journal()
+        
+        embeddings = unpack_rows(names, matrix)
+        thresholds = dict(self.embedding_store.snapshot_thresholds)
+        self.embedding_store.replay(embeddings, operations, thresholds)
+        self.dataset_embeddings = embeddings
+        self.thresholds = thresholds
+        
+        if operations:
+            self.rebuild_index()
+        else:
+            # Search straight from the shared memory-mapped snapshot
+            gallery_index = create_gallery_index(self.config)
+            gallery_index.build_from_matrix(names, matrix)
+            self.gallery_index = gallery_index
+            self.invalidate_caches()
+        self._store_state = self.embedding_store.disk_state()
+    
+    def refresh(self) -> bool:
+        """Reload from the store if another process has written to it since we last read or wrote it"""
+        if self.embedding_store.disk_state() == self._store_state:
+            return False
+        with self.embedding_store.write_lock():
+            return self._reload_if_changed()
+    
+    def _reload_if_changed(self) -> bool:
+        if self.embedding_store.disk_state() in (None, self._store_state):
+            return False
+        self._load_embedding_store()
+        print(f"Reloaded {len(self.dataset_embeddings)} embeddings changed by another process{self._label()}")
+        return True
+    
+    @contextmanager
+    def _store_write(self) -> Iterator[None]:
+        """Hold the store's cross-process lock for a write, starting from its latest contents"""
+        with self.embedding_store.write_lock():
+            self._reload_if_changed()
+            try:
+                yield
+            finally:
+                self._store_state = self.embedding_store.disk_state()
+    
+    def save(self, version: Optional[int] = None):
+        """Save computed embeddings as a new embedding store snapshot, at a later version if given"""
+        try:
+            self.embedding_store.save(self.dataset_embeddings, version, self.thresholds)
+            print(f"Saved {len(self.dataset_embeddings)} embeddings to {self.embedding_store.store_dir}")
+        except Exception as e:
+            print(f"Error saving embeddings: {e}")
+    
+    def replace(self, embeddings: Dict[str, np.ndarray]):
+        """Swap in a freshly computed set of embeddings and snapshot it"""
+        gallery_index = create_gallery_index(self.config)
+        gallery_index.build(embeddings)
+        
+        # Only people whose embedding was recomputed are calibrated again; the rest keep their thresholds
+        previous = self.dataset_embeddings
+        thresholds = {name: threshold for name, threshold in self.thresholds.items() if name in embeddings}
+        changed = {name: embedding for name, embedding in embeddings.items() if previous.get(name) is not embedding}
+        thresholds.update(self.calibrator.calibrate(gallery_index, changed, thresholds, self._genuine_floors(changed)))
+        
+        # Swap the new gallery in at once so in-flight recognitions see old or new, never a mix
+        with self._store_write(), self._lock:
+            self.dataset_embeddings = embeddings
+            self.thresholds = thresholds
+            self.gallery_index = gallery_index
+            self.invalidate_caches()
+            self.save(self.version + 1)
+    
+    def rebuild_index(self):
+        """Build a fresh gallery index from dataset_embeddings and swap it in"""
+        gallery_index = create_gallery_index(self.config)
+        gallery_index.build(self.dataset_embeddings)
+        self.gallery_index = gallery_index
+        self.invalidate_caches()
+    
+    def invalidate_caches(self):
+        """Drop cached results after the gallery changes"""
+        self._threshold_table = None
+        if self.result_cache is not None:
+            self.result_cache.clear()
+        if self.match_cache is not None:
+            self.match_cache.clear()
+    
+    def _persist_embedding(self, person_name: str, embedding: np.ndarray, threshold: Optional[float] = None):
+        """Journal a single embedding change, with the person's calibrated threshold if they have one"""
+        self._journal(person_name, lambda: self.embedding_store.append_put(person_name, embedding, threshold))
+    
+    def _persist_threshold(self, person_name: str, threshold: float):
+        """Journal a threshold raised because someone similar was enrolled"""
+        self._journal(person_name, lambda: self.embedding_store.append_threshold(person_name, threshold))
+    
+    def _persist_delete(self, person_name: str):
+        """Journal the removal of a person"""
+        self._journal(person_name, lambda: self.embedding_store.append_delete(person_name))
+    
+    def _persist_rename(self, person_name: str, new_name: str):
+        """Journal a rename without rewriting the person's embedding"""
+        self._journal(person_name, lambda: self.embedding_store.append_rename(person_name, new_name))
+    
+    def _journal(self, person_name: str, append):
+        """Append one journal entry, compacting into a new snapshot when the journal grows"""
+        if not self.embedding_store.exists():
+            self.save(self.version + 1)
+            return
+        try:
+            append()
+        except Exception as e:
+            print(f"Error journaling change for {person_name}: {e}")
+            self.save(self.version + 1)
+            return
+        if self.embedding_store.journal_entries >= self.config.EMBEDDINGS_JOURNAL_COMPACT_THRESHOLD:
+            self.save()
+    
+    def export_snapshot(self, fileobj) -> int:
+        """Write a checksummed snapshot of the gallery to fileobj and return its version.
+
+        A gallery with nothing journaled since its store snapshot is written
+        straight from the store's memory-mapped matrix.
+        """
+        with self._store_write(), self._lock:
+            if self.embedding_store.exists() and not self.embedding_store.journal_entries:
+                names, matrix = self.embedding_store.load_snapshot()
+            else:
+                names, matrix = pack_embeddings(self.dataset_embeddings)
+            thresholds = dict(self.thresholds)
+            version = self.version
+        if matrix is None:
+            matrix = np.empty((0, 0), dtype=np.float32)
+        write_snapshot(fileobj, names, matrix, version, self.group, thresholds)
+        return version
+    
+    def import_snapshot(self, fileobj) -> Dict:
+        """Replace the gallery with a verified snapshot, taking over its version.
+
+        The matrix streams from fileobj into the store's next generation file;
+        the gallery lock is only taken to publish and load it.
+        """
+        with self._store_write():
+            try:
+                manifest, names, matrix, thresholds = read_snapshot(fileobj, self.embedding_store.open_matrix)
+            except Exception:
+                self.embedding_store.discard_matrix()
+                raise
+            with self._lock:
+                self.embedding_store.save_matrix(names, matrix, manifest["version"], thresholds)
+                # Serve from the store's memory-mapped copy like any other load
+                self._load_embedding_store()
+        print(f"Imported {len(self.dataset_embeddings)} embeddings at version {self.version}{self._label()}")
+        return {"version": self.version, "people": len(self.dataset_embeddings)}
+    
+    def export_delta(self, since: int) -> Optional[Dict]:
+        """Changes after version since, or None when the journal no longer holds them all"""
+        with self._store_write():
+            operations = self.embedding_store.operations_since(since)
+            version = self.version
+        if operations is None:
+            return None
+        return build_delta(operations, since, version, self.group)
+    
+    def apply_delta(self, delta: Dict) -> int:
+        """Replay a verified delta's changes that are newer than the gallery and return how many were applied.
+
+        Each change is journaled here too, so the gallery ends at the delta's
+        to_version. Raises SnapshotConflict unless the gallery's version lies
+        within the delta's range.
+        """
+        operations = verify_delta(delta)
+        applied = 0
+        with self._store_write(), self._lock:
+            if not delta["from_version"] <= self.version <= delta["to_version"]:
+                raise SnapshotConflict(f"Delta covers versions {delta['from_version']} to {delta['to_version']}, "
+                                       f"gallery is at {self.version}")
+            for operation in operations:
+                if operation["version"] <= self.version:
+                    continue
+                self._apply_operation(operation)
+                applied += 1
+            if applied:
+                self.invalidate_caches()
+        return applied
+    
+    def _apply_operation(self, operation: Dict):
+        """Apply one journal entry from another instance; it is journaled even if it changes nothing here"""
+        name = operation["name"]
+        if operation["op"] == "put":
+            embedding = EmbeddingStore.decode_vector(operation)
+            self.gallery_index.add(name, embedding)
+            self.dataset_embeddings[name] = embedding
+            if "threshold" in operation:
+                self.thresholds[name] = operation["threshold"]
+            self._persist_embedding(name, embedding, operation.get("threshold"))
+        elif operation["op"] == "delete":
+            self.gallery_index.remove(name)
+            self.dataset_embeddings.pop(name, None)
+            self.thresholds.pop(name, None)
+            self._persist_delete(name)
+        elif operation["op"] == "rename":
+            new_name = operation["new_name"]
+            embedding = self.dataset_embeddings.pop(name, None)
+            if embedding is not None:
+                self.gallery_index.remove(name)
+                self.gallery_index.add(new_name, embedding)
+                self.dataset_embeddings[new_name] = embedding
+            if name in self.thresholds:
+                self.thresholds[new_name] = self.thresholds.pop(name)
+            self._persist_rename(name, new_name)
+        elif operation["op"] == "threshold":
+            self.thresholds[name] = operation["threshold"]
+            self._persist_threshold(name, operation["threshold"])
+        else:
+            raise SnapshotError(f"Unknown delta operation: {operation['op']}")
+    
+    def publish_person_embedding(self, person_name: str):
+        """Re-aggregate a person over all their cached images, calibrate their threshold and update only their rows"""
+        person_embedding = self.dataset_embedder.aggregate(self.dataset_embedder.scan_person(person_name))
+        genuine_floors = self._genuine_floors({person_name: person_embedding}) if person_embedding is not None else {}
+        with self._store_write(), self._lock:
+            if person_embedding is not None:
+                self.gallery_index.add(person_name, person_embedding)
+                self.dataset_embeddings[person_name] = person_embedding
+                updates = self.calibrator.calibrate(self.gallery_index, {person_name: person_embedding},
+                                                    self.thresholds, genuine_floors)
+                self.thresholds.update(updates)
+                self._persist_embedding(person_name, person_embedding, self.thresholds.get(person_name))
+                for name, threshold in updates.items():
+                    if name != person_name:
+                        self._persist_threshold(name, threshold)
+            elif person_name in self.dataset_embeddings:
+                # No image of theirs has a usable face any more
+                self.gallery_index.remove(person_name)
+                del self.dataset_embeddings[person_name]
+                self.thresholds.pop(person_name, None)
+                self._persist_delete(person_name)
+            self.invalidate_caches()
+    
+    def _genuine_floors(self, people: Dict[str, np.ndarray]) -> Dict[str, Optional[float]]:
+        """Each person's weakest held-out enrollment image score, from the image cache"""
+        if not (self.calibrator.enabled and self.calibrator.lowering):
+            return {}
+        embedder = self.dataset_embedder
+        return {
+            name: self.calibrator.genuine_floor(*embedder.image_embeddings(embedder.scan_person(name)))
+            for name in people
+        }
+    
+    def save_person_images(self, person_name: str, images: List) -> List[str]:
+        """Write uploaded images into the person's dataset folder"""
+        person_folder = self._person_folder(person_name)
+        os.makedirs(person_folder, exist_ok=True)
+        
+        uploaded_files = []
+        # Number on from the person's highest existing photo so later uploads never overwrite earlier ones
+        numbered = re.compile(rf"{re.escape(person_name)}_(\d+)\.jpg")
+        number = max((int(match.group(1)) for match in map(numbered.fullmatch, os.listdir(person_folder)) if match),
+                     default=0)
+        
+        for image_file in images:
+            if image_file.filename:
+                while True:
+                    number += 1
+                    filename = f"{person_name}_{number}.jpg"
+                    try:
+                        # Exclusive create: a concurrent upload for the same person takes the next number
+                        with open(os.path.join(person_folder, filename), 'xb') as f:
+                            image_file.save(f)
+                        break
+                    except FileExistsError:
+                        continue
+                uploaded_files.append(filename)
+        
+        self.catalog.update_person(person_name)
+        return uploaded_files
+    
+    def person_exists(self, person_name: str) -> bool:
+        """True if the person has a dataset folder or a gallery embedding"""
+        return os.path.isdir(self._person_folder(person_name)) or person_name in self.dataset_embeddings
+    
+    def image_exists(self, person_name: str, filename: str) -> bool:
+        return os.path.isfile(self._image_path(person_name, filename))
+    
+    def delete_person(self, person_name: str) -> bool:
+        """Remove a person from the gallery, the embedding store and the dataset folder"""
+        person_folder = self._person_folder(person_name)
+        if not self.person_exists(person_name):
+            return False
+        
+        # Stale cache entries are dropped in memory; the next recompute prunes the cache file
+        for key in self.dataset_embedder.scan_person(person_name):
+            self.dataset_embedder.cache.discard(key)
+        with self._store_write(), self._lock:
+            self.gallery_index.remove(person_name)
+            self.thresholds.pop(person_name, None)
+            if self.dataset_embeddings.pop(person_name, None) is not None:
+                self._persist_delete(person_name)
+            self.invalidate_caches()
+        shutil.rmtree(person_folder, ignore_errors=True)
+        self.catalog.remove_person(person_name)
+        return True
+    
+    def delete_image(self, person_name: str, filename: str) -> bool:
+        """Delete one of a person's image files and its cached embedding"""
+        image_path = self._image_path(person_name, filename)
+        if not os.path.isfile(image_path):
+            return False
+        os.remove(image_path)
+        self.dataset_embedder.cache.discard(os.path.join(person_name, filename))
+        self.catalog.update_person(person_name)
+        return True
+    
+    def save_person_image(self, person_name: str, filename: str, image_file):
+        """Atomically write an upload over one of a person's existing images"""
+        image_path = self._image_path(person_name, filename)
+        tmp_path = f"{image_path}.tmp"
+        image_file.save(tmp_path)
+        os.replace(tmp_path, image_path)
+    
+    def rename_person(self, person_name: str, new_name: str) -> bool:
+        """Rename a person's folder, cache entries and gallery rows without re-embedding"""
+        person_folder = self._person_folder(person_name)
+        new_folder = self._person_folder(new_name)
+        if not self.person_exists(person_name):
+            return False
+        if self.person_exists(new_name):
+            raise ValueError(f"Person {new_name} already exists")
+        
+        if os.path.isdir(person_folder):
+            os.rename(person_folder, new_folder)
+            # File stats survive the rename, so cached image embeddings stay valid under the new keys
+            for key in self.dataset_embedder.scan_person(new_name):
+                old_key = os.path.join(person_name, os.path.basename(key))
+                self.dataset_embedder.cache.rename(old_key, key)
+            self.catalog.rename_person(person_name, new_name)
+        
+        with self._store_write(), self._lock:
+            embedding = self.dataset_embeddings.pop(person_name, None)
+            if embedding is not None:
+                self.gallery_index.remove(person_name)
+                self.gallery_index.add(new_name, embedding)
+                self.dataset_embeddings[new_name] = embedding
+                if person_name in self.thresholds:
+                    self.thresholds[new_name] = self.thresholds.pop(person_name)
+                self._persist_rename(person_name, new_name)
+            self.invalidate_caches()
+        return True
+    
+    def _person_folder(self, person_name: str) -> str:
+        """Dataset folder for a person, rejecting names that would escape the dataset folder"""
+        if not person_name or person_name in ('.', '..') or os.sep in person_name or (os.altsep and os.altsep in person_name):
+            raise ValueError(f"Invalid person name: {person_name!r}")
+        return os.path.join(self.dataset_folder, person_name)
+    
+    def _image_path(self, person_name: str, filename: str) -> str:
+        if not filename or filename in ('.', '..') or os.sep in filename or (os.altsep and os.altsep in filename):
+            raise ValueError(f"Invalid image name: {filename!r}")
+        return os.path.join(self._person_folder(person_name), filename)
+    
+    def get_dataset_info(self, after: Optional[str] = None, limit: int = 100, prefix: Optional[str] = None,
+                         search: Optional[str] = None, has_embedding: Optional[bool] = None) -> Dict:
+        """Get one page of the dataset listing, in name order, from the catalog"""
+        predicate = None
+        if has_embedding is not None:
+            predicate = lambda name: (name in self.dataset_embeddings) == has_embedding
+        people, next_cursor = self.catalog.page(after, limit, prefix, search, predicate)
+        
+        dataset_info = [{
+            "name": person_name,
+            "image_count": image_count,
+            "has_embedding": person_name in self.dataset_embeddings
+        } for person_name, image_count in people]
+        
+        return {
+            "dataset": dataset_info,
+            "total_people": len(self.catalog),
+            "total_embeddings": len(self.dataset_embeddings),
+            "next_cursor": next_cursor
+        }
+    
+    def find_matches(self, face_embeddings: List[np.ndarray], threshold: float,
+                     image_ids: Optional[List[int]] = None) -> List[Optional[Dict]]:
+        """Match face embeddings against the gallery; faces sharing an image id are matched one-to-one.
+
+        image_ids gives the image each face came from; None treats all the
+        faces as one image. See OpenSetMatcher for how matches are accepted.
+        """
+        match_cache = self.match_cache
+        # Read the generation before the index so a concurrent gallery swap discards our results
+        generation = match_cache.generation if match_cache is not None else None
+        gallery_index = self.gallery_index
+        if not len(gallery_index) or not face_embeddings:
+            return [None] * len(face_embeddings)
+        
+        queries = normalize_embeddings(np.array(face_embeddings))
+        k = self.matcher.search_k
+        if match_cache is not None:
+            # Near-duplicate queries reuse recent candidates, whatever the threshold
+            hits, names, scores = match_cache.lookup(queries)
+            misses = np.nonzero(~hits)[0]
+            if misses.size:
+                names[misses], scores[misses] = gallery_index.search_arrays(queries[misses], k)
+                match_cache.put(queries[misses], names[misses], scores[misses], generation)
+        else:
+            names, scores = gallery_index.search_arrays(queries, k)
+        return self.matcher.decide(names, scores, self._thresholds(), threshold, image_ids)
+    
+    def _thresholds(self) -> ThresholdTable:
+        """Lookup table of the calibrated thresholds, rebuilt after the gallery changes"""
+        table = self._threshold_table
+        if table is None:
+            # Built under the write lock so it never sees a half-applied change
+            with self._lock:
+                if self._threshold_table is None:
+                    self._threshold_table = ThresholdTable(self.thresholds, self.config.RECOGNITION_THRESHOLD)
+                table = self._threshold_table
+        return table
+    
+    def _label(self) -> str:
+        return f" for group {self.group}" if self.group else ""
+
+class GalleryRegistry:
+    """Loaded galleries by group, evicting the least recently used over a memory budget.
+
+    Galleries are loaded on first use through the load callback. The default
+    gallery is never evicted, nor is any gallery a request or job is still
+    using: callers hold it through use(), which pins it until they are done.
+    An evicted group's state is all on disk, so it simply reloads next time.
+    """
+    
+    def __init__(self, create: Callable[[Optional[str]], Gallery], load: Callable[[Gallery], None],
+                 memory_budget: Optional[int]):
+        self._create = create
+        self._load = load
+        self.memory_budget = memory_budget
+        self._galleries: "OrderedDict[Optional[str], Gallery]" = OrderedDict()
+        self._load_locks: Dict[Optional[str], threading.Lock] = {}
+        self._lock = threading.Lock()
+        
+        GALLERY_GROUPS_LOADED.set_function(lambda: len(self._galleries))
+        GALLERY_MEMORY.set_function(lambda: sum(gallery.nbytes for gallery in list(self._galleries.values())))
+    
+    @contextmanager
+    def use(self, group: Optional[str] = None) -> Iterator[Gallery]:
+        """Yield the group's gallery, loading it if needed, and keep it loaded until the block exits"""
+        gallery = self._acquire(group)
+        try:
+            yield gallery
+        finally:
+            with self._lock:
+                gallery.users -= 1
+                self._evict()
+    
+    def peek(self, group: Optional[str] = None) -> Optional[Gallery]:
+        """The group's gallery if it is loaded, without loading it or touching its recency"""
+        return self._galleries.get(group)
+    
+    def loaded_groups(self) -> List[Optional[str]]:
+        return list(self._galleries.keys())
+    
+    def add(self, gallery: Gallery):
+        """Register a gallery that was loaded outside the registry, such as one preloaded before fork"""
+        with self._lock:
+            self._galleries[gallery.group] = gallery
+            self._evict()
+    
+    def refresh(self):
+        """Reload every loaded gallery whose store another process has changed"""
+        for gallery in list(self._galleries.values()):
+            try:
+                gallery.refresh()
+            except Exception as e:
+                print(f"Error reloading gallery{gallery._label()}: {e}")
+    
+    def watch(self, interval: float) -> threading.Thread:
+        """Poll the loaded galleries' stores for changes on a daemon thread"""
+        def run():
+            while True:
+                time.sleep(interval)
+                self.refresh()
+        
+        thread = threading.Thread(target=run, name='gallery-watcher', daemon=True)
+        thread.start()
+        return thread
+    
+    def _acquire(self, group: Optional[str]) -> Gallery:
+        with self._lock:
+            gallery = self._pin(group)
+            if gallery is not None:
+                return gallery
+            load_lock = self._load_locks.setdefault(group, threading.Lock())
+        
+        # One loader per group; requests for other groups are not blocked meanwhile
+        with load_lock:
+            with self._lock:
+                gallery = self._pin(group)
+                if gallery is not None:
+                    return gallery
+            gallery = self._create(group)
+            self._load(gallery)
+            with self._lock:
+                gallery.users += 1
+                self._galleries[group] = gallery
+                self._evict()
+            return gallery
+    
+    def _pin(self, group: Optional[str]) -> Optional[Gallery]:
+        gallery = self._galleries.get(group)
+        if gallery is not None:
+            self._galleries.move_to_end(group)
+            gallery.users += 1
+        return gallery
+    
+    def _evict(self):
+        """Drop idle group galleries, least recently used first, until under the budget"""
+        if not self.memory_budget:
+            return
+        total = sum(gallery.nbytes for gallery in self._galleries.values())
+        for group, gallery in list(self._galleries.items()):
+            if total <= self.memory_budget:
+                break
+            if group is None or gallery.users:
+                continue
+            del self._galleries[group]
+            total -= gallery.nbytes
+            GALLERY_EVICTIONS.inc()
+            print(f"Evicted gallery for group {group} ({gallery.nbytes} bytes)")
@@ -0,0 +1,700 @@
+import copy
+import threading
+from abc import ABC, abstractmethod
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+from .quantization import CODECS, VectorCodec, create_codec
+
+SearchResult = List[List[Tuple[str, float]]]
+
+def normalize_embeddings(embeddings) -> np.ndarray:
+    """Return L2-normalized embeddings as a contiguous float32 matrix"""
+    matrix = np.array(embeddings, dtype=np.float32, ndmin=2, copy=True)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return np.ascontiguousarray(matrix)
+
+def pack_embeddings(embeddings: Dict[str, np.ndarray]) -> Tuple[List[str], Optional[np.ndarray]]:
+    """Flatten name -> embedding or (templates, dim) matrix into row names and one normalized matrix"""
+    row_names = []
+    blocks = []
+    for name, embedding in embeddings.items():
+        block = np.asarray(embedding, dtype=np.float32)
+        if block.ndim == 1:
+            block = block[None, :]
+        row_names.extend([name] * block.shape[0])
+        blocks.append(block)
+    if not blocks:
+        return [], None
+    return row_names, normalize_embeddings(np.vstack(blocks))
+
+def unpack_rows(row_names: List[str], matrix: np.ndarray) -> Dict[str, np.ndarray]:
+    """Group matrix rows by name: a vector for single-row names, a (templates, dim) view or copy otherwise"""
+    rows: Dict[str, List[int]] = {}
+    for row, name in enumerate(row_names):
+        rows.setdefault(name, []).append(row)
+    
+    embeddings = {}
+    for name, name_rows in rows.items():
+        if len(name_rows) == 1:
+            embeddings[name] = matrix[name_rows[0]]
+        elif name_rows[-1] - name_rows[0] == len(name_rows) - 1:
+            embeddings[name] = matrix[name_rows[0]:name_rows[-1] + 1]
+        else:
+            embeddings[name] = matrix[name_rows]
+    return embeddings
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores per row, sorted best first"""
+    k = min(k, scores.shape[1])
+    if k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(scores.shape[1]), scores.shape).copy()
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1)
+
+def candidate_arrays(results: SearchResult, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(queries, k) name and similarity arrays from search results, padded with '' and -inf"""
+    names = np.full((len(results), k), '', dtype=object)
+    scores = np.full((len(results), k), -np.inf, dtype=np.float32)
+    for row, matches in enumerate(results):
+        for column, (name, score) in enumerate(matches[:k]):
+            names[row, column] = name
+            scores[row, column] = score
+    return names, scores
+
+class GalleryIndex(ABC):
+    """Base class for identity galleries searched by cosine similarity"""
+    
+    def __init__(self):
+        self._lock = threading.RLock()
+    
+    @abstractmethod
+    def __len__(self) -> int:
+        """Number of identities"""
+    
+    @abstractmethod
+    def __contains__(self, name: str) -> bool:
+        """Whether an identity is indexed"""
+    
+    @abstractmethod
+    def names(self) -> List[str]:
+        """Indexed identity names"""
+    
+    @property
+    @abstractmethod
+    def nbytes(self) -> int:
+        """Approximate memory held by the index's vectors"""
+    
+    @abstractmethod
+    def add(self, name: str, embedding: np.ndarray):
+        """Add an identity, replacing its embedding if it already exists"""
+    
+    @abstractmethod
+    def remove(self, name: str) -> bool:
+        """Remove an identity, returning False if it was not present"""
+    
+    @abstractmethod
+    def search(self, queries, k: int = 1) -> SearchResult:
+        """Return the top-k (name, similarity) candidates for each query"""
+    
+    def search_arrays(self, queries, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """The top-k candidates as (queries, k) name and similarity arrays, padded with '' and -inf"""
+        return candidate_arrays(self.search(queries, k), k)
+    
+    @abstractmethod
+    def build(self, embeddings: Dict[str, np.ndarray]):
+        """Replace the contents of the index with the given embeddings"""
+    
+    def build_from_matrix(self, names: List[str], matrix: np.ndarray):
+        """Replace the contents of the index with pre-normalized rows"""
+        self.build(dict(zip(names, matrix)))
+
+class SearchView:
+    """What a search reads after releasing the index lock: row buffer, names and template groups.
+
+    A view is built under the lock after each mutation and never changed
+    afterwards; mutations that would overwrite rows a view can still see
+    write to a copy of the buffer instead.
+    """
+    
+    __slots__ = ('matrix', 'names', 'groups', 'codec', 'references')
+    
+    def __init__(self, matrix: np.ndarray, names: np.ndarray, groups=None, codec=None, references=None):
+        self.matrix = matrix
+        self.names = names
+        self.groups = groups
+        self.codec = codec
+        self.references = references
+
+class ExactGalleryIndex(GalleryIndex):
+    """Brute-force index over a pre-normalized contiguous float32 matrix.
+
+    Similarities for a batch of queries are one GEMM against the gallery
+    matrix. Rows live in a preallocated buffer that grows geometrically, and
+    removals move the last row into the freed slot, so adds and removes are
+    O(1) amortized. A read-only matrix (for example a shared memory-mapped
+    snapshot) can be adopted as-is and is only copied on the first mutation.
+
+    An identity may own several rows (templates). Their scores are combined
+    per identity with a max or mean reduceat over the score matrix, so the
+    GEMM still runs once over the whole packed matrix.
+
+    Searches hold the lock only to fetch the current SearchView; scoring
+    runs outside it, so concurrent searches proceed in parallel. Rows a
+    handed-out view covers are copy-on-write.
+    """
+    
+    def __init__(self, dim: Optional[int] = None, initial_capacity: int = 64, reduction: str = 'max'):
+        super().__init__()
+        if reduction not in ('max', 'mean'):
+            raise ValueError(f"Unknown template reduction: {reduction}")
+        self.dim = dim
+        self.reduction = reduction
+        self._capacity = initial_capacity
+        self._matrix = None if dim is None else self._allocate(initial_capacity)
+        self._row_names: List[str] = []
+        self._rows: Dict[str, List[int]] = {}
+        self._view: Optional[SearchView] = None
+        # Rows of the current buffer that handed-out views can see
+        self._shared_rows = 0
+    
+    def __len__(self) -> int:
+        return len(self._rows)
+    
+    def __contains__(self, name: str) -> bool:
+        return name in self._rows
+    
+    def names(self) -> List[str]:
+        return list(self._rows.keys())
+    
+    def row_names(self) -> List[str]:
+        """Identity of each matrix row"""
+        return list(self._row_names)
+    
+    @property
+    def row_count(self) -> int:
+        return len(self._row_names)
+    
+    @property
+    def nbytes(self) -> int:
+        return self._matrix.nbytes if self._matrix is not None else 0
+    
+    @property
+    def matrix(self) -> np.ndarray:
+        """View of the active rows of the gallery matrix"""
+        if self._matrix is None:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return self._matrix[:len(self._row_names)]
+    
+    def _allocate(self, capacity: int) -> np.ndarray:
+        """Empty row buffer for capacity rows"""
+        return np.empty((capacity, self.dim), dtype=np.float32)
+    
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Stored form of normalized rows"""
+        return vectors
+    
+    def _reserve(self, size: int, first_written: int):
+        """Make the buffer hold size rows and writable from row first_written on.
+
+        A read-only buffer is copied, and so is one where first_written falls
+        inside rows a search view may still be reading.
+        """
+        writable = self._matrix is not None and self._matrix.flags.writeable and first_written >= self._shared_rows
+        if writable and size <= self._capacity:
+            return
+        capacity = self._capacity if size <= self._capacity else max(size, self._capacity * 2)
+        matrix = self._allocate(capacity)
+        if self._matrix is not None:
+            matrix[:len(self._row_names)] = self._matrix[:len(self._row_names)]
+        self._set_matrix(matrix)
+    
+    def _set_matrix(self, matrix: np.ndarray):
+        self._matrix = matrix
+        self._capacity = matrix.shape[0]
+        self._shared_rows = 0
+    
+    def add(self, name: str, embedding: np.ndarray):
+        """Add an identity from one embedding or a (templates, dim) matrix, replacing any existing rows"""
+        vectors = normalize_embeddings(embedding)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            
+            self._view = None
+            rows = self._rows.get(name)
+            if rows is not None and len(rows) == len(vectors):
+                self._reserve(len(self._row_names), min(rows))
+                self._matrix[rows] = self._encode(vectors)
+                return
+            
+            if rows is not None:
+                self._remove_rows(name)
+            start = len(self._row_names)
+            self._reserve(start + len(vectors), start)
+            self._matrix[start:start + len(vectors)] = self._encode(vectors)
+            self._row_names.extend([name] * len(vectors))
+            self._rows[name] = list(range(start, start + len(vectors)))
+    
+    def remove(self, name: str) -> bool:
+        with self._lock:
+            if name not in self._rows:
+                return False
+            self._remove_rows(name)
+            return True
+    
+    def _remove_rows(self, name: str):
+        """Free every row of an identity by moving the last rows into the gaps"""
+        # Highest rows first, so the last row is never one still waiting to be removed
+        for row in sorted(self._rows.pop(name), reverse=True):
+            last = len(self._row_names) - 1
+            if row != last:
+                self._reserve(len(self._row_names), row)
+                last_name = self._row_names[last]
+                self._matrix[row] = self._matrix[last]
+                self._row_names[row] = last_name
+                owner_rows = self._rows[last_name]
+                owner_rows[owner_rows.index(last)] = row
+            self._row_names.pop()
+        self._view = None
+    
+    def _set_rows(self, row_names: List[str], matrix: Optional[np.ndarray]):
+        self._row_names = list(row_names)
+        self._rows = {}
+        for row, name in enumerate(self._row_names):
+            self._rows.setdefault(name, []).append(row)
+        self._view = None
+        if self._row_names:
+            self.dim = matrix.shape[1]
+            self._set_matrix(self._encode(matrix))
+    
+    def build(self, embeddings: Dict[str, np.ndarray]):
+        row_names, matrix = pack_embeddings(embeddings)
+        with self._lock:
+            self._set_rows(row_names, matrix)
+            if not row_names:
+                self._matrix = None if self.dim is None else self._allocate(self._capacity)
+                self._shared_rows = 0
+    
+    def build_from_matrix(self, names: List[str], matrix: np.ndarray):
+        if matrix.dtype != np.float32 or not matrix.flags.c_contiguous:
+            matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        with self._lock:
+            self._set_rows(names, matrix)
+            if not names:
+                self._matrix = None
+    
+    def search_view(self) -> Optional[SearchView]:
+        """The current SearchView, or None for an empty index"""
+        with self._lock:
+            if not self._row_names:
+                return None
+            if self._view is None:
+                self._view = self._build_view()
+                self._shared_rows = max(self._shared_rows, len(self._row_names))
+            return self._view
+    
+    def _build_view(self) -> SearchView:
+        matrix = self._matrix[:len(self._row_names)]
+        if len(self._row_names) == len(self._rows):
+            return SearchView(matrix, np.array(self._row_names, dtype=object))
+        
+        names = list(self._rows.keys())
+        order = np.fromiter((row for name in names for row in self._rows[name]),
+                            dtype=np.int64, count=len(self._row_names))
+        counts = np.array([len(self._rows[name]) for name in names])
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        # Built galleries are already grouped, so the column gather can usually be skipped
+        if np.array_equal(order, np.arange(len(order))):
+            order = None
+        return SearchView(matrix, np.array(names, dtype=object), (order, starts, counts))
+    
+    def score(self, queries: np.ndarray, view: SearchView) -> np.ndarray:
+        """Cosine similarities between normalized queries and every row of a view"""
+        return queries @ view.matrix.T
+    
+    def _identity_scores(self, queries: np.ndarray, view: SearchView) -> np.ndarray:
+        """Row scores combined into one score per identity, in view.names order"""
+        scores = self.score(queries, view)
+        if view.groups is None:
+            return scores
+        order, starts, counts = view.groups
+        grouped = scores if order is None else scores[:, order]
+        if self.reduction == 'mean':
+            return np.add.reduceat(grouped, starts, axis=1) / counts
+        return np.maximum.reduceat(grouped, starts, axis=1)
+    
+    def search(self, queries, k: int = 1) -> SearchResult:
+        queries = normalize_embeddings(queries)
+        view = self.search_view()
+        if view is None:
+            return [[] for _ in range(queries.shape[0])]
+        scores = self._identity_scores(queries, view)
+        indices = top_k_indices(scores, k)
+        top_scores = np.take_along_axis(scores, indices, axis=1)
+        return [
+            list(zip(row_names, row_scores))
+            for row_names, row_scores in zip(view.names[indices].tolist(), top_scores.tolist())
+        ]
+    
+    def search_arrays(self, queries, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        queries = normalize_embeddings(queries)
+        names = np.full((queries.shape[0], k), '', dtype=object)
+        top_scores = np.full((queries.shape[0], k), -np.inf, dtype=np.float32)
+        view = self.search_view()
+        if view is None:
+            return names, top_scores
+        scores = self._identity_scores(queries, view)
+        indices = top_k_indices(scores, k)
+        names[:, :indices.shape[1]] = view.names[indices]
+        top_scores[:, :indices.shape[1]] = np.take_along_axis(scores, indices, axis=1)
+        return names, top_scores
+
+def reference_rows(embedding) -> np.ndarray:
+    """The embedding itself when it is already unit-norm floats (e.g. a store view), else a normalized copy"""
+    rows = np.asarray(embedding)
+    if rows.dtype in (np.float32, np.float16):
+        norms = np.linalg.norm(np.atleast_2d(rows).astype(np.float32), axis=1)
+        if np.all(np.abs(norms - 1.0) < 1e-2):
+            return rows
+    return normalize_embeddings(embedding)
+
+class QuantizedGalleryIndex(ExactGalleryIndex):
+    """Exact-scan index over compact codes with a float32 re-rank.
+
+    Every row is scored from its float16, int8 or PQ code (see
+    models.quantization), then the best `rerank` identities per query are
+    re-scored against their full-precision reference rows, so the reported
+    similarities stay comparable with the float32 index and its thresholds.
+    References are the embeddings the index was built from: normally views
+    into the memory-mapped embedding store, paged in only for re-ranked rows.
+    A product quantizer is retrained as the gallery doubles, until it has
+    been trained on a full sample; each retrain fits a fresh copy of the
+    codec, so views keep scoring their codes with the codebooks that made them.
+    """
+    
+    def __init__(self, codec: VectorCodec, rerank: int = 32, dim: Optional[int] = None,
+                 initial_capacity: int = 64, reduction: str = 'max'):
+        self.codec = codec
+        self.rerank = rerank
+        self._reference: Dict[str, np.ndarray] = {}
+        self._references_shared = False
+        self._trained_rows = 0
+        super().__init__(dim, initial_capacity, reduction)
+    
+    @property
+    def nbytes(self) -> int:
+        """Codes and codebooks, plus reference rows held on the heap rather than mapped"""
+        heap = sum(rows.nbytes for rows in self._reference.values() if not isinstance(rows, np.memmap))
+        return super().nbytes + self.codec.nbytes + heap
+    
+    def _allocate(self, capacity: int) -> np.ndarray:
+        return self.codec.allocate(capacity, self.dim)
+    
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        return self.codec.encode(vectors)
+    
+    def _train(self, matrix: np.ndarray):
+        codec = copy.copy(self.codec)
+        codec.train(matrix)
+        self.codec = codec
+        self._trained_rows = matrix.shape[0]
+        self._view = None
+    
+    def _retrain(self):
+        """Retrain the codec on every reference row and re-encode the gallery"""
+        matrix = np.empty((len(self._row_names), self.dim), dtype=np.float32)
+        for name, rows in self._rows.items():
+            matrix[rows] = self._reference[name]
+        self._train(matrix)
+        self._set_matrix(self._encode(matrix))
+    
+    def add(self, name: str, embedding: np.ndarray):
+        vectors = normalize_embeddings(embedding)
+        with self._lock:
+            if self.codec.trainable and not self._trained_rows:
+                self._train(vectors)
+            super().add(name, vectors)
+            # Views only look up their own names, so a replaced entry just gives them the newer rows
+            self._reference[name] = vectors
+            if self.codec.needs_training(len(self._row_names), self._trained_rows):
+                self._retrain()
+    
+    def remove(self, name: str) -> bool:
+        with self._lock:
+            if self._references_shared:
+                # A view may still re-rank this name
+                self._reference = dict(self._reference)
+                self._references_shared = False
+            self._reference.pop(name, None)
+            return super().remove(name)
+    
+    def _set_rows(self, row_names: List[str], matrix: Optional[np.ndarray]):
+        if row_names and self.codec.trainable:
+            self._train(matrix)
+        super()._set_rows(row_names, matrix)
+    
+    def build(self, embeddings: Dict[str, np.ndarray]):
+        # The packed matrix is only needed for encoding; re-ranking reads the caller's arrays
+        with self._lock:
+            super().build(embeddings)
+            self._reference = {name: reference_rows(embedding) for name, embedding in embeddings.items()}
+    
+    def build_from_matrix(self, names: List[str], matrix: np.ndarray):
+        # Codes are encoded a block at a time, so a mapped snapshot is never copied whole
+        with self._lock:
+            self._set_rows(names, matrix)
+            self._reference = unpack_rows(names, matrix) if names else {}
+            if not names:
+                self._matrix = None
+    
+    def _build_view(self) -> SearchView:
+        view = super()._build_view()
+        view.codec = self.codec
+        view.references = self._reference
+        self._references_shared = True
+        return view
+    
+    def score(self, queries: np.ndarray, view: SearchView) -> np.ndarray:
+        """Approximate cosine similarities from the codes"""
+        return view.codec.score(queries, view.matrix)
+    
+    def _exact_scores(self, query: np.ndarray, names: List[str], references: Dict[str, np.ndarray]) -> np.ndarray:
+        """Full-precision, template-reduced scores of one query against the named identities"""
+        blocks = [np.atleast_2d(references[name]) for name in names]
+        scores = np.vstack(blocks).astype(np.float32, copy=False) @ query
+        starts = np.concatenate(([0], np.cumsum([len(block) for block in blocks])[:-1]))
+        if self.reduction == 'mean':
+            return np.add.reduceat(scores, starts) / [len(block) for block in blocks]
+        return np.maximum.reduceat(scores, starts)
+    
+    def search(self, queries, k: int = 1) -> SearchResult:
+        if not self.rerank:
+            return super().search(queries, k)
+        
+        queries = normalize_embeddings(queries)
+        view = self.search_view()
+        if view is None:
+            return [[] for _ in range(queries.shape[0])]
+        scores = self._identity_scores(queries, view)
+        
+        results = []
+        for query, candidates in zip(queries, top_k_indices(scores, max(k, self.rerank))):
+            candidate_names = [view.names[j] for j in candidates]
+            exact = self._exact_scores(query, candidate_names, view.references)
+            order = np.argsort(-exact, kind='stable')[:k]
+            results.append([(candidate_names[j], float(exact[j])) for j in order])
+        return results
+    
+    def search_arrays(self, queries, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        if not self.rerank:
+            return super().search_arrays(queries, k)
+        return candidate_arrays(self.search(queries, k), k)
+
+class IVFGalleryIndex(GalleryIndex):
+    """Approximate inverted-file index built from pure NumPy.
+
+    A spherical k-means coarse quantizer splits the gallery into nlist
+    cells, each held as a small ExactGalleryIndex. A query is only scored
+    against the nprobe cells whose centroids are closest to it. Until the
+    gallery reaches min_train_size the index behaves like an exact scan.
+    All templates of an identity go to the cell nearest their mean.
+    """
+    
+    def __init__(self, nlist: int = 1024, nprobe: int = 16, min_train_size: int = 10000,
+                 train_iterations: int = 10, seed: int = 0, reduction: str = 'max'):
+        super().__init__()
+        self.reduction = reduction
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.train_iterations = train_iterations
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self._cells: List[ExactGalleryIndex] = [self._new_cell()]
+        self._cell_of: Dict[str, int] = {}
+    
+    def __len__(self) -> int:
+        return len(self._cell_of)
+    
+    def __contains__(self, name: str) -> bool:
+        return name in self._cell_of
+    
+    def names(self) -> List[str]:
+        return list(self._cell_of.keys())
+    
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+    
+    @property
+    def nbytes(self) -> int:
+        centroids = self.centroids.nbytes if self.centroids is not None else 0
+        return centroids + sum(cell.nbytes for cell in self._cells)
+    
+    def _new_cell(self) -> ExactGalleryIndex:
+        return ExactGalleryIndex(reduction=self.reduction)
+    
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        """Nearest centroid for each normalized vector"""
+        if self.centroids is None:
+            return np.zeros(vectors.shape[0], dtype=np.int64)
+        return np.argmax(vectors @ self.centroids.T, axis=1)
+    
+    def add(self, name: str, embedding: np.ndarray):
+        vectors = normalize_embeddings(embedding)
+        with self._lock:
+            cell = int(self._assign(normalize_embeddings(vectors.mean(axis=0)))[0])
+            previous = self._cell_of.get(name)
+            if previous is not None and previous != cell:
+                self._cells[previous].remove(name)
+            self._cells[cell].add(name, vectors)
+            self._cell_of[name] = cell
+            
+            if not self.is_trained and len(self._cell_of) >= self.min_train_size:
+                self.train()
+    
+    def remove(self, name: str) -> bool:
+        with self._lock:
+            cell = self._cell_of.pop(name, None)
+            if cell is None:
+                return False
+            self._cells[cell].remove(name)
+            return True
+    
+    def build(self, embeddings: Dict[str, np.ndarray]):
+        row_names, matrix = pack_embeddings(embeddings)
+        with self._lock:
+            self.centroids = None
+            self._load(row_names, matrix)
+            if len(embeddings) >= self.min_train_size:
+                self.train()
+    
+    def _load(self, row_names: List[str], matrix: Optional[np.ndarray]):
+        """Distribute normalized rows into cells using the current centroids"""
+        cell_count = 1 if self.centroids is None else self.centroids.shape[0]
+        self._cells = [self._new_cell() for _ in range(cell_count)]
+        self._cell_of = {}
+        if not row_names:
+            return
+        
+        # Assign whole identities, placing multi-template identities by their mean
+        identity_of_row = {}
+        row_identities = np.fromiter((identity_of_row.setdefault(name, len(identity_of_row)) for name in row_names),
+                                     dtype=np.int64, count=len(row_names))
+        if len(identity_of_row) == len(row_names):
+            anchors = matrix
+        else:
+            sums = np.zeros((len(identity_of_row), matrix.shape[1]), dtype=np.float32)
+            np.add.at(sums, row_identities, matrix)
+            anchors = normalize_embeddings(sums)
+        assignments = self._assign(anchors)[row_identities]
+        
+        order = np.argsort(assignments, kind='stable')
+        boundaries = np.searchsorted(assignments[order], np.arange(cell_count + 1))
+        for cell in range(cell_count):
+            rows = order[boundaries[cell]:boundaries[cell + 1]]
+            if rows.size == 0:
+                continue
+            cell_names = [row_names[i] for i in rows]
+            self._cells[cell].build_from_matrix(cell_names, matrix[rows])
+            for cell_name in cell_names:
+                self._cell_of[cell_name] = cell
+    
+    def _all_rows(self) -> Tuple[List[str], np.ndarray]:
+        """Gather every stored row name and normalized row"""
+        names = []
+        blocks = []
+        for cell in self._cells:
+            if len(cell):
+                names.extend(cell.row_names())
+                blocks.append(cell.matrix)
+        if not blocks:
+            return [], np.empty((0, 0), dtype=np.float32)
+        return names, np.vstack(blocks)
+    
+    def train(self):
+        """Fit the coarse quantizer with spherical k-means and redistribute the gallery"""
+        with self._lock:
+            names, matrix = self._all_rows()
+            if not names:
+                return
+            
+            # 4*sqrt(n) exceeds n below 16 rows, and centroids are drawn from distinct rows
+            nlist = int(min(self.nlist, len(names), max(1, 4 * np.sqrt(len(names)))))
+            rng = np.random.default_rng(self.seed)
+            sample_size = min(len(names), nlist * 256)
+            sample = matrix[rng.choice(len(names), size=sample_size, replace=False)]
+            centroids = sample[rng.choice(sample_size, size=nlist, replace=False)].copy()
+            
+            for _ in range(self.train_iterations):
+                assignments = np.argmax(sample @ centroids.T, axis=1)
+                order = np.argsort(assignments, kind='stable')
+                counts = np.bincount(assignments, minlength=nlist)
+                starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+                
+                sums = np.empty_like(centroids)
+                occupied = counts > 0
+                sums[occupied] = np.add.reduceat(sample[order], starts[occupied], axis=0)
+                # Re-seed empty cells from random samples
+                sums[~occupied] = sample[rng.choice(sample_size, size=int((~occupied).sum()))]
+                centroids = normalize_embeddings(sums)
+            
+            self.centroids = centroids
+            self._load(names, matrix)
+    
+    def search(self, queries, k: int = 1) -> SearchResult:
+        queries = normalize_embeddings(queries)
+        # Training swaps in new centroids and cells rather than editing them, so the pair is
+        # taken together and the cells, which have their own views, are searched unlocked
+        with self._lock:
+            if not self._cell_of:
+                return [[] for _ in range(queries.shape[0])]
+            centroids, cells = self.centroids, self._cells
+        
+        if centroids is None:
+            return cells[0].search(queries, k)
+        
+        nprobe = min(self.nprobe, centroids.shape[0])
+        probes = top_k_indices(queries @ centroids.T, nprobe)
+        
+        # Score each probed cell once for all the queries that probe it
+        candidates: List[List[Tuple[str, float]]] = [[] for _ in range(queries.shape[0])]
+        for cell in np.unique(probes):
+            cell_index = cells[cell]
+            if not len(cell_index):
+                continue
+            query_rows = np.nonzero((probes == cell).any(axis=1))[0]
+            for row, matches in zip(query_rows, cell_index.search(queries[query_rows], k)):
+                candidates[row].extend(matches)
+        
+        return [sorted(matches, key=lambda m: m[1], reverse=True)[:k] for matches in candidates]
+
+def create_gallery_index(config) -> GalleryIndex:
+    """Create the gallery index selected by GALLERY_INDEX_MODE and GALLERY_INDEX_DTYPE"""
+    mode = config.GALLERY_INDEX_MODE
+    dtype = config.GALLERY_INDEX_DTYPE
+    if dtype != 'float32' and dtype not in CODECS:
+        raise ValueError(f"GALLERY_INDEX_DTYPE must be 'float32' or one of {', '.join(CODECS)}")
+    if mode == 'exact' and dtype == 'float32':
+        return ExactGalleryIndex(reduction=config.TEMPLATE_REDUCTION)
+    if mode == 'exact':
+        return QuantizedGalleryIndex(
+            create_codec(dtype, pq_subspaces=config.PQ_SUBSPACES),
+            rerank=config.GALLERY_RERANK_CANDIDATES,
+            reduction=config.TEMPLATE_REDUCTION
+        )
+    if mode == 'ivf' and dtype != 'float32':
+        raise ValueError("A quantized GALLERY_INDEX_DTYPE needs GALLERY_INDEX_MODE = 'exact'")
+    if mode == 'ivf':
+        return IVFGalleryIndex(
+            nlist=config.IVF_NLIST,
+            nprobe=config.IVF_NPROBE,
+            min_train_size=config.IVF_MIN_TRAIN_SIZE,
+            reduction=config.TEMPLATE_REDUCTION
+        )
+    raise ValueError(f"Unknown gallery index mode: {mode}")
@@ -0,0 +1,300 @@
+import hashlib
+import io
+import json
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import IO, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+SNAPSHOT_FORMAT = 'facemark-gallery-snapshot'
+DELTA_FORMAT = 'facemark-gallery-delta'
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_MEMBERS = ('manifest.json', 'names.json', 'thresholds.json', 'matrix.npy')
+SNAPSHOT_DTYPES = ('float32', 'float16')
+MAX_MANIFEST_BYTES = 1024 * 1024
+# Allowance per row for names.json and thresholds.json, on top of MAX_MANIFEST_BYTES
+MAX_JSON_BYTES_PER_ROW = 1024
+# Room for the .npy header in front of the rows x dim matrix the manifest declares
+MAX_NPY_HEADER_BYTES = 4096
+COPY_CHUNK_BYTES = 4 * 1024 * 1024
+
+class SnapshotError(ValueError):
+    """Raised for a snapshot or delta that is malformed or fails its checksum"""
+
+class SnapshotConflict(Exception):
+    """Raised when a delta does not start at or before the gallery's version"""
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def _add_member(archive: tarfile.TarFile, name: str, stream: IO[bytes], size: int):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(time.time())
+    archive.addfile(info, stream)
+
+class _MatrixMember(io.RawIOBase):
+    """matrix.npy read straight from the matrix's buffer, so a memory-mapped matrix is never copied whole"""
+    
+    def __init__(self, matrix: np.ndarray):
+        header = io.BytesIO()
+        np.lib.format.write_array_header_1_0(header, np.lib.format.header_data_from_array_1_0(matrix))
+        self.header = header.getvalue()
+        self.data = memoryview(matrix.reshape(-1)).cast('B') if matrix.size else memoryview(b'')
+        self.size = len(self.header) + len(self.data)
+        self.position = 0
+    
+    def readable(self) -> bool:
+        return True
+    
+    def readinto(self, buffer) -> int:
+        # tarfile treats a short read as the end of the member, so fill the buffer across the header boundary
+        filled = 0
+        while filled < len(buffer) and self.position < self.size:
+            if self.position < len(self.header):
+                chunk = self.header[self.position:self.position + len(buffer) - filled]
+            else:
+                start = self.position - len(self.header)
+                chunk = self.data[start:start + len(buffer) - filled]
+            buffer[filled:filled + len(chunk)] = chunk
+            filled += len(chunk)
+            self.position += len(chunk)
+        return filled
+    
+    def sha256(self) -> str:
+        digest = hashlib.sha256(self.header)
+        for start in range(0, len(self.data), COPY_CHUNK_BYTES):
+            digest.update(self.data[start:start + COPY_CHUNK_BYTES])
+        return digest.hexdigest()
+
+class _HashingReader:
+    """Wraps a tar member, hashing what is read from it"""
+    
+    def __init__(self, stream: IO[bytes]):
+        self.stream = stream
+        self.digest = hashlib.sha256()
+        self.consumed = 0
+    
+    def read(self, size: int = -1) -> bytes:
+        data = self.stream.read(size)
+        self.digest.update(data)
+        self.consumed += len(data)
+        return data
+
+def write_snapshot(fileobj: IO[bytes], names: List[str], matrix: np.ndarray, version: int,
+                   group: Optional[str] = None, thresholds: Optional[Dict[str, float]] = None):
+    """Write a gallery as an uncompressed tar of manifest.json, names.json, thresholds.json and matrix.npy.
+
+    The manifest carries the gallery version and a SHA-256 of each of the
+    other members; it comes first so readers can verify as they stream.
+    matrix.npy is hashed and written from the matrix in place, so a
+    memory-mapped store matrix is exported without a copy.
+    """
+    names_data = json.dumps(names).encode()
+    thresholds_data = json.dumps(thresholds or {}).encode()
+    matrix_member = _MatrixMember(np.ascontiguousarray(matrix))
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "group": group,
+        "version": version,
+        "rows": len(names),
+        "people": len(set(names)),
+        "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+        "dtype": matrix.dtype.name,
+        "created_at": time.time(),
+        "sha256": {
+            "names.json": _digest(names_data),
+            "thresholds.json": _digest(thresholds_data),
+            "matrix.npy": matrix_member.sha256()
+        }
+    }
+    manifest_data = json.dumps(manifest, indent=2).encode()
+    with tarfile.open(fileobj=fileobj, mode='w|') as archive:
+        _add_member(archive, 'manifest.json', io.BytesIO(manifest_data), len(manifest_data))
+        _add_member(archive, 'names.json', io.BytesIO(names_data), len(names_data))
+        _add_member(archive, 'thresholds.json', io.BytesIO(thresholds_data), len(thresholds_data))
+        _add_member(archive, 'matrix.npy', matrix_member, matrix_member.size)
+
+def _read_manifest(data: bytes) -> Dict:
+    manifest = json.loads(data)
+    if manifest.get("format") != SNAPSHOT_FORMAT or manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot format: {manifest.get('format')} {manifest.get('format_version')}")
+    if manifest.get("dtype") not in SNAPSHOT_DTYPES:
+        raise SnapshotError(f"Unsupported snapshot dtype: {manifest.get('dtype')}")
+    rows, dim = manifest.get("rows"), manifest.get("dim")
+    if not isinstance(rows, int) or not isinstance(dim, int) or rows < 0 or dim < 0 or (rows and not dim):
+        raise SnapshotError(f"Invalid snapshot shape: {rows} x {dim}")
+    if not isinstance(manifest.get("sha256"), dict) or not {'names.json', 'matrix.npy'} <= manifest["sha256"].keys():
+        raise SnapshotError("Snapshot manifest has no checksums")
+    return manifest
+
+def _read_matrix(reader: _HashingReader, size: int, manifest: Dict,
+                 open_matrix: Callable[[int, int], np.ndarray]) -> np.ndarray:
+    """Copy matrix.npy chunk by chunk into the array open_matrix(rows, dim) returns"""
+    rows, dim, dtype = manifest["rows"], manifest["dim"], np.dtype(manifest["dtype"])
+    row_bytes = dim * dtype.itemsize
+    if size > MAX_NPY_HEADER_BYTES + rows * row_bytes:
+        raise SnapshotError(f"matrix.npy is larger than the {rows} x {dim} {dtype.name} matrix in the manifest")
+    try:
+        version = np.lib.format.read_magic(reader)
+        if version == (1, 0):
+            shape, fortran_order, header_dtype = np.lib.format.read_array_header_1_0(reader)
+        else:
+            shape, fortran_order, header_dtype = np.lib.format.read_array_header_2_0(reader)
+    except ValueError as e:
+        raise SnapshotError(f"matrix.npy is not a .npy array: {e}")
+    if tuple(shape) != (rows, dim) or fortran_order or header_dtype != dtype:
+        raise SnapshotError(f"matrix.npy holds a {shape} {header_dtype} array, the manifest declares {rows} x {dim} {dtype.name}")
+    if size != reader.consumed + rows * row_bytes:
+        raise SnapshotError("matrix.npy size does not match its header")
+    
+    matrix = open_matrix(rows, dim)
+    chunk_rows = max(1, COPY_CHUNK_BYTES // max(row_bytes, 1))
+    for start in range(0, rows, chunk_rows):
+        count = min(chunk_rows, rows - start)
+        data = reader.read(count * row_bytes)
+        if len(data) != count * row_bytes:
+            raise SnapshotError("matrix.npy is truncated")
+        matrix[start:start + count] = np.frombuffer(data, dtype=dtype).reshape(count, dim)
+    return matrix
+
+def read_snapshot(fileobj: IO[bytes],
+                  open_matrix: Callable[[int, int], np.ndarray]) -> Tuple[Dict, List[str], np.ndarray, Dict[str, float]]:
+    """Read and verify a snapshot written by write_snapshot; returns (manifest, row names, matrix, thresholds).
+
+    The matrix is streamed into the (rows, dim) array open_matrix returns,
+    typically a store's memory-mapped next generation, while it is hashed.
+    Members larger than the manifest allows are rejected before they are
+    read. On error the array may hold a partial matrix.
+    """
+    manifest = None
+    members = {}
+    digests = {}
+    matrix = None
+    try:
+        with tarfile.open(fileobj=fileobj, mode='r|') as archive:
+            for member in archive:
+                if not member.isfile() or member.name not in SNAPSHOT_MEMBERS:
+                    continue
+                if member.name == 'manifest.json':
+                    if member.size > MAX_MANIFEST_BYTES:
+                        raise SnapshotError("Snapshot manifest is too large")
+                    manifest = _read_manifest(archive.extractfile(member).read())
+                    continue
+                if manifest is None:
+                    raise SnapshotError("Snapshot manifest must come first")
+                
+                reader = _HashingReader(archive.extractfile(member))
+                if member.name == 'matrix.npy':
+                    matrix = _read_matrix(reader, member.size, manifest, open_matrix)
+                else:
+                    if member.size > MAX_MANIFEST_BYTES + manifest["rows"] * MAX_JSON_BYTES_PER_ROW:
+                        raise SnapshotError(f"Snapshot {member.name} is too large for {manifest['rows']} rows")
+                    members[member.name] = reader.read()
+                digests[member.name] = reader.digest.hexdigest()
+    except tarfile.TarError as e:
+        raise SnapshotError(f"Not a gallery snapshot: {e}")
+    if manifest is None:
+        raise SnapshotError("Snapshot has no manifest")
+    
+    for member, checksum in manifest["sha256"].items():
+        if digests.get(member) != checksum:
+            raise SnapshotError(f"Snapshot checksum mismatch for {member}")
+    if matrix is None or 'names.json' not in members:
+        raise SnapshotError("Snapshot has no matrix or names")
+    
+    names = json.loads(members['names.json'])
+    thresholds = json.loads(members.get('thresholds.json', b'{}'))
+    if matrix.shape[0] != len(names):
+        raise SnapshotError("Snapshot names and matrix row counts differ")
+    return manifest, names, matrix, thresholds
+
+def build_delta(operations: List[Dict], from_version: int, to_version: int, group: Optional[str] = None) -> Dict:
+    """Wrap journal entries between two versions with a checksum of their canonical JSON"""
+    return {
+        "format": DELTA_FORMAT,
+        "group": group,
+        "from_version": from_version,
+        "to_version": to_version,
+        "operations": operations,
+        "sha256": _digest(json.dumps(operations, sort_keys=True, separators=(',', ':')).encode())
+    }
+
+def verify_delta(delta: Dict) -> List[Dict]:
+    """The delta's operations, after checking its format and checksum"""
+    if not isinstance(delta, dict) or delta.get("format") != DELTA_FORMAT:
+        raise SnapshotError("Not a gallery delta")
+    operations = delta.get("operations")
+    if not isinstance(operations, list):
+        raise SnapshotError("Delta has no operations")
+    if _digest(json.dumps(operations, sort_keys=True, separators=(',', ':')).encode()) != delta.get("sha256"):
+        raise SnapshotError("Delta checksum mismatch")
+    return operations
+
+class GallerySync:
+    """Keeps galleries in step with a primary instance over its /gallery endpoints.
+
+    pull() asks the primary for the delta since the gallery's version and
+    replays it; when the primary no longer has those changes in its journal,
+    or the gallery has nothing stored yet, the full snapshot is imported
+    instead. Neither path reads dataset images or runs the model.
+    """
+    
+    def __init__(self, source: str, token: Optional[str] = None, timeout: float = 60):
+        self.source = source.rstrip('/')
+        self.token = token
+        self.timeout = timeout
+    
+    def pull(self, gallery) -> str:
+        """Bring one gallery up to the primary's version; returns 'snapshot', 'delta' or 'current'"""
+        if gallery.embedding_store.exists():
+            try:
+                with self._get('/gallery/delta', gallery.group, since=gallery.version) as response:
+                    delta = json.load(response)
+                return 'delta' if gallery.apply_delta(delta) else 'current'
+            except urllib.error.HTTPError as e:
+                # 410: the primary compacted those changes away; 409: this replica is ahead of it
+                if e.code not in (409, 410):
+                    raise
+            except SnapshotConflict:
+                pass
+        
+        with self._get('/gallery/snapshot', gallery.group) as response, tempfile.TemporaryFile() as download:
+            shutil.copyfileobj(response, download)
+            download.seek(0)
+            gallery.import_snapshot(download)
+        return 'snapshot'
+    
+    def watch(self, registry, interval: float) -> threading.Thread:
+        """Pull every loaded gallery from the primary on a daemon thread"""
+        def run():
+            while True:
+                time.sleep(interval)
+                for group in registry.loaded_groups():
+                    gallery = registry.peek(group)
+                    if gallery is None:
+                        continue
+                    try:
+                        self.pull(gallery)
+                    except Exception as e:
+                        print(f"Error syncing gallery{gallery._label()} from {self.source}: {e}")
+        
+        thread = threading.Thread(target=run, name='gallery-sync', daemon=True)
+        thread.start()
+        return thread
+    
+    def _get(self, path: str, group: Optional[str], **params):
+        if group:
+            params["group"] = group
+        query = f"?{urllib.parse.urlencode(params)}" if params else ""
+        headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+        request = urllib.request.Request(f"{self.source}{path}{query}", headers=headers)
+        return urllib.request.urlopen(request, timeout=self.timeout)
@@ -0,0 +1,68 @@
+import numpy as np
+from typing import List, Optional
+
+from .gallery_index import normalize_embeddings
+
+def face_quality_weight(bbox, det_score: Optional[float], reference_size: int = 112) -> float:
+    """Weight an enrollment face by detector confidence and size.
+
+    Faces smaller than the recognition input are upscaled before embedding,
+    so their weight falls off linearly below reference_size pixels.
+    """
+    x1, y1, x2, y2 = [float(v) for v in bbox[:4]]
+    short_side = max(0.0, min(x2 - x1, y2 - y1))
+    score = float(det_score) if det_score is not None else 1.0
+    return max(score, 0.0) * min(1.0, short_side / reference_size)
+
+def select_medoids(similarities: np.ndarray, weights: np.ndarray, k: int, iterations: int = 10) -> List[int]:
+    """Weighted k-medoids over a cosine similarity matrix, seeded by farthest-point selection"""
+    medoids = [int(np.argmax(similarities @ weights))]
+    while len(medoids) < k:
+        distance = 1.0 - similarities[:, medoids].max(axis=1)
+        medoids.append(int(np.argmax(distance * weights)))
+    
+    for _ in range(iterations):
+        assignments = np.argmax(similarities[:, medoids], axis=1)
+        updated = []
+        for cluster, medoid in enumerate(medoids):
+            members = np.nonzero(assignments == cluster)[0]
+            if members.size == 0:
+                updated.append(medoid)
+                continue
+            # The member with the highest weighted similarity to the rest of its cluster
+            cohesion = similarities[np.ix_(members, members)] @ weights[members]
+            updated.append(int(members[np.argmax(cohesion)]))
+        if updated == medoids:
+            break
+        medoids = updated
+    return medoids
+
+def build_identity_templates(embeddings: np.ndarray, weights: Optional[np.ndarray] = None,
+                             max_templates: int = 1) -> np.ndarray:
+    """Aggregate a person's image embeddings into one centroid or up to max_templates templates.
+
+    Embeddings are L2-normalized first so no image dominates by norm. With
+    max_templates == 1 the result is the quality-weighted mean direction, a
+    (dim,) vector. Otherwise images are grouped around weighted medoids and
+    each group contributes its weighted mean, giving a (templates, dim)
+    matrix that keeps distinct appearances (lighting, pose, glasses) apart.
+    """
+    vectors = normalize_embeddings(embeddings)
+    if weights is None or not np.any(np.asarray(weights) > 0):
+        weights = np.ones(len(vectors), dtype=np.float32)
+    weights = np.asarray(weights, dtype=np.float32)
+    
+    if max_templates <= 1 or len(vectors) == 1:
+        return normalize_embeddings(weights @ vectors)[0]
+    if len(vectors) <= max_templates:
+        return vectors
+    
+    similarities = vectors @ vectors.T
+    medoids = select_medoids(similarities, weights, max_templates)
+    assignments = np.argmax(similarities[:, medoids], axis=1)
+    templates = []
+    for cluster in range(len(medoids)):
+        members = assignments == cluster
+        if members.any():
+            templates.append(weights[members] @ vectors[members])
+    return normalize_embeddings(templates)
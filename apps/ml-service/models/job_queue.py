@@ -0,0 +1,141 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+class JobQueueFull(Exception):
+    """Raised when the queue already holds the maximum number of pending jobs"""
+
+class Job:
+    """State of one background job, safe to read from request threads"""
+    
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = 'queued'
+        self.progress_done = 0
+        self.progress_total = 0
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+    
+    def set_progress(self, done: int, total: int):
+        """Progress callback handed to the job function"""
+        self.progress_done = done
+        self.progress_total = total
+    
+    @property
+    def finished(self) -> bool:
+        return self.status in ('succeeded', 'failed')
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": {
+                "done": self.progress_done,
+                "total": self.progress_total
+            },
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+class JobReservation:
+    """A pending slot held while a job's inputs are written; submit() it, or leave the block to release it"""
+    
+    def __init__(self, queue: 'JobQueue'):
+        self._queue = queue
+        self._held = True
+    
+    def __enter__(self) -> 'JobReservation':
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.release()
+    
+    def submit(self, kind: str, fn: Callable[[Job], Any]) -> Job:
+        """Queue fn(job) in the reserved slot"""
+        if not self._held:
+            raise RuntimeError("Job reservation already used")
+        self._held = False
+        return self._queue._start(kind, fn)
+    
+    def release(self):
+        if self._held:
+            self._held = False
+            self._queue._release()
+
+class JobQueue:
+    """Bounded background executor for long-running dataset work.
+
+    At most max_pending jobs may be queued or running at once; further
+    submissions raise JobQueueFull so callers can shed load. Callers that
+    write files for a job first take a slot with reserve(), so a full queue
+    is reported before anything is written. Finished jobs are kept for
+    status queries until max_history newer ones replace them.
+    """
+    
+    def __init__(self, max_workers: int = 1, max_pending: int = 16, max_history: int = 100):
+        self.max_pending = max_pending
+        self.max_history = max_history
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._pending = 0
+        self._lock = threading.Lock()
+    
+    def submit(self, kind: str, fn: Callable[[Job], Any]) -> Job:
+        """Queue fn(job) and return the job immediately"""
+        return self.reserve().submit(kind, fn)
+    
+    def reserve(self) -> JobReservation:
+        """Take a pending slot for a job submitted later, raising JobQueueFull if there is none"""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise JobQueueFull(f"Too many pending jobs ({self.max_pending})")
+            self._pending += 1
+        return JobReservation(self)
+    
+    def _start(self, kind: str, fn: Callable[[Job], Any]) -> Job:
+        job = Job(kind)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune_history()
+        
+        self._executor.submit(self._run, job, fn)
+        return job
+    
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+    
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+    
+    def _run(self, job: Job, fn: Callable[[Job], Any]):
+        job.status = 'running'
+        job.started_at = time.time()
+        try:
+            job.result = fn(job)
+            job.status = 'succeeded'
+        except Exception as e:
+            print(f"Job {job.id} ({job.kind}) failed: {e}")
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished_at = time.time()
+            self._release()
+    
+    def _prune_history(self):
+        """Drop the oldest finished jobs beyond max_history"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_history)]:
+            del self._jobs[job_id]
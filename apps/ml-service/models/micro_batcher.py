@@ -0,0 +1,75 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Tuple
+
+class MicroBatcher:
+    """Merge concurrent single-item requests into batched calls.
+
+    Items submitted from request threads are queued; a background worker
+    collects up to max_batch_size of them, waiting at most max_wait_ms after
+    the first one arrives, and hands the whole batch to process_batch. Each
+    caller gets its own result back through a Future. Several workers may
+    drain the queue so independent batches run concurrently.
+    """
+    
+    def __init__(self, process_batch: Callable[[List[Any]], List[Any]], max_batch_size: int = 8,
+                 max_wait_ms: float = 5.0, workers: int = 1):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.worker_count = max(1, workers)
+        self._queue: "queue.Queue[Tuple[Any, Future]]" = queue.Queue()
+        self._workers: List[threading.Thread] = []
+        self._lock = threading.Lock()
+    
+    def submit(self, item: Any) -> Future:
+        """Queue an item for the next batch and return a Future for its result"""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+    
+    def _ensure_worker(self):
+        """Start the worker threads on first use"""
+        if self._workers:
+            return
+        with self._lock:
+            if not self._workers:
+                for i in range(self.worker_count):
+                    worker = threading.Thread(target=self._run, name=f'micro-batcher-{i}', daemon=True)
+                    worker.start()
+                    self._workers.append(worker)
+    
+    def _collect_batch(self) -> List[Tuple[Any, Future]]:
+        """Block for the first item, then gather more until the batch is full or the wait expires"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        
+        return batch
+    
+    def _run(self):
+        """Worker loop processing one batch at a time"""
+        while True:
+            batch = self._collect_batch()
+            items = [item for item, _ in batch]
+            
+            try:
+                results = self.process_batch(items)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
@@ -0,0 +1,216 @@
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+from .gallery_index import GalleryIndex, normalize_embeddings
+from .identity_templates import build_identity_templates
+
+# Per face: (name, similarity) candidates, best first
+Candidates = List[Tuple[str, float]]
+
+# Query rows searched per gallery index call while calibrating many identities
+CALIBRATION_CHUNK_SIZE = 1024
+
+class IdentityCalibrator:
+    """Per-identity match thresholds, set when a person is enrolled.
+
+    A person's threshold starts at RECOGNITION_THRESHOLD and is raised to
+    IDENTITY_IMPOSTOR_MARGIN above the similarity of their nearest other
+    identity, so a lookalike cannot pass as them. Enrolling someone also
+    raises the thresholds of existing neighbours they now sit close to.
+
+    With IDENTITY_THRESHOLD_LOWERING, a threshold is instead lowered to the
+    person's weakest enrollment photo when that scores below it (not below
+    IDENTITY_MIN_THRESHOLD or the impostor bound). Each photo is scored
+    leave-one-out, against templates built without it, since templates
+    score close to 1.0 against the photos they were built from.
+    """
+    
+    def __init__(self, config):
+        self.enabled = config.IDENTITY_CALIBRATION_ENABLED
+        self.lowering = config.IDENTITY_THRESHOLD_LOWERING
+        self.max_templates = config.IDENTITY_TEMPLATES
+        self.base_threshold = config.RECOGNITION_THRESHOLD
+        self.impostor_margin = config.IDENTITY_IMPOSTOR_MARGIN
+        self.min_threshold = config.IDENTITY_MIN_THRESHOLD
+        self.max_threshold = config.IDENTITY_MAX_THRESHOLD
+        self.neighbours = config.IDENTITY_CALIBRATION_NEIGHBOURS
+    
+    def threshold(self, impostor: float, genuine_floor: Optional[float] = None) -> float:
+        """Threshold for an identity whose nearest impostor scores impostor"""
+        impostor_bound = impostor + self.impostor_margin
+        threshold = max(self.base_threshold, impostor_bound)
+        if self.lowering and genuine_floor is not None and genuine_floor < threshold:
+            threshold = max(genuine_floor, impostor_bound, self.min_threshold)
+        return float(min(threshold, self.max_threshold))
+    
+    def genuine_floor(self, image_embeddings: np.ndarray, weights: np.ndarray) -> Optional[float]:
+        """Lowest similarity of a person's enrollment images to templates built from their other images.
+
+        None for fewer than two images. Builds one set of templates per image,
+        which is cheap for the handful of photos a person is enrolled with.
+        """
+        if len(image_embeddings) < 2:
+            return None
+        vectors = normalize_embeddings(image_embeddings)
+        held_out = np.ones(len(vectors), dtype=bool)
+        scores = []
+        for i in range(len(vectors)):
+            held_out[i] = False
+            templates = build_identity_templates(vectors[held_out], weights[held_out], self.max_templates)
+            scores.append(float((np.atleast_2d(templates) @ vectors[i]).max()))
+            held_out[i] = True
+        return min(scores)
+    
+    def calibrate(self, gallery_index: GalleryIndex, people: Dict[str, np.ndarray],
+                  thresholds: Dict[str, float],
+                  genuine_floors: Optional[Dict[str, Optional[float]]] = None) -> Dict[str, float]:
+        """New thresholds for people (name -> templates, already in gallery_index) and their neighbours.
+
+        thresholds holds the current per-identity thresholds and is not
+        modified; the returned dict has only the identities whose threshold
+        changes. Each person's template rows are searched against the whole
+        index in chunks, so the cost grows with people x gallery size.
+        """
+        if not self.enabled or not people or not len(gallery_index):
+            return {}
+        genuine_floors = genuine_floors or {}
+        names = list(people)
+        blocks = [np.atleast_2d(people[name]) for name in names]
+        owners = np.repeat(np.arange(len(names)), [len(block) for block in blocks])
+        rows = np.vstack(blocks)
+        
+        impostors = np.full(len(names), -1.0)
+        raised: Dict[str, float] = {}
+        for start in range(0, len(rows), CALIBRATION_CHUNK_SIZE):
+            results = gallery_index.search(rows[start:start + CALIBRATION_CHUNK_SIZE], k=self.neighbours + 1)
+            for owner, row_candidates in zip(owners[start:start + CALIBRATION_CHUNK_SIZE], results):
+                person_name = names[owner]
+                for name, similarity in row_candidates:
+                    if name == person_name:
+                        continue
+                    impostors[owner] = max(impostors[owner], similarity)
+                    if name not in people:
+                        raised[name] = max(raised.get(name, -1.0), similarity)
+        
+        updates = {}
+        for owner, person_name in enumerate(names):
+            threshold = self.threshold(float(impostors[owner]), genuine_floors.get(person_name))
+            # People at the default threshold are not recorded, so they follow RECOGNITION_THRESHOLD
+            if thresholds.get(person_name, self.base_threshold) != threshold:
+                updates[person_name] = threshold
+        for name, similarity in raised.items():
+            current = thresholds.get(name, self.base_threshold)
+            threshold = float(min(similarity + self.impostor_margin, self.max_threshold))
+            if threshold > current:
+                updates[name] = threshold
+        return updates
+
+class ThresholdTable:
+    """Per-identity thresholds as sorted arrays, so a whole candidate array is looked up at once"""
+    
+    def __init__(self, thresholds: Dict[str, float], default: float):
+        names = sorted(thresholds)
+        self.names = np.array(names, dtype=object)
+        self.values = np.array([thresholds[name] for name in names], dtype=np.float64)
+        self.default = default
+    
+    def lookup(self, names: np.ndarray) -> np.ndarray:
+        """Threshold for each name in an array; names without one get the default"""
+        if not len(self.names):
+            return np.full(names.shape, self.default)
+        positions = np.minimum(np.searchsorted(self.names, names.ravel()), len(self.names) - 1).reshape(names.shape)
+        return np.where(self.names[positions] == names, self.values[positions], self.default)
+
+class OpenSetMatcher:
+    """Turns per-face gallery candidates into matches, or None for faces of unknown people.
+
+    A candidate is acceptable when its similarity clears the identity's
+    threshold (see IdentityCalibrator; the request threshold shifts every
+    identity by its offset from RECOGNITION_THRESHOLD) and the face's top
+    two candidates are at least MATCH_MIN_MARGIN apart. Faces from the same
+    image are then assigned one-to-one, maximizing total similarity with
+    the Hungarian algorithm, so a person is matched at most once per image.
+    Only images where two faces share a best candidate go through the
+    assignment; everything else is decided on whole candidate arrays.
+    """
+    
+    def __init__(self, config):
+        self.base_threshold = config.RECOGNITION_THRESHOLD
+        self.min_margin = config.MATCH_MIN_MARGIN
+        self.top_k = config.MATCH_TOP_K
+        self.one_to_one = config.MATCH_ONE_TO_ONE
+        # Enough candidates for a margin, and alternatives for faces that lose their best one
+        self.search_k = max(self.top_k, config.MATCH_ASSIGNMENT_CANDIDATES, 2)
+    
+    def decide(self, names: np.ndarray, scores: np.ndarray, thresholds: ThresholdTable, threshold: float,
+               image_ids: Optional[List[int]] = None) -> List[Optional[Dict]]:
+        """Match per face from (faces, k) candidate arrays (see GalleryIndex.search_arrays).
+
+        Faces sharing an image id (all faces when None) are assigned one-to-one.
+        """
+        if not len(names):
+            return []
+        identity_thresholds = thresholds.lookup(names) + (threshold - self.base_threshold)
+        # Missing candidates count as similarity 0, so a lone candidate's margin is its similarity
+        finite = np.where(np.isfinite(scores), scores, 0.0)
+        margins = finite[:, 0] - finite[:, 1]
+        acceptable = (scores > identity_thresholds) & (margins >= self.min_margin)[:, None]
+        
+        image_ids = np.zeros(len(names), dtype=np.int64) if image_ids is None else np.asarray(image_ids)
+        chosen = np.where(acceptable[:, 0], 0, -1)
+        if self.one_to_one:
+            for image_id in self._contested_images(names, chosen, image_ids):
+                faces = np.nonzero(image_ids == image_id)[0]
+                self._assign(faces, names, scores, finite, acceptable, chosen, margins)
+        
+        matched = np.nonzero(chosen >= 0)[0]
+        columns = chosen[matched]
+        results: List[Optional[Dict]] = [None] * len(names)
+        fields = zip(matched.tolist(), names[matched, columns].tolist(), scores[matched, columns].tolist(),
+                     margins[matched].tolist(), identity_thresholds[matched, columns].tolist())
+        for face, name, confidence, margin, identity_threshold in fields:
+            results[face] = {"name": name, "confidence": confidence, "margin": margin, "threshold": identity_threshold}
+        if self.top_k > 1:
+            top_names = names[matched, :self.top_k].tolist()
+            top_scores = scores[matched, :self.top_k].tolist()
+            for face, row_names, row_scores in zip(matched.tolist(), top_names, top_scores):
+                results[face]["candidates"] = [
+                    {"name": name, "confidence": score} for name, score in zip(row_names, row_scores) if name
+                ]
+        return results
+    
+    @staticmethod
+    def _contested_images(names: np.ndarray, chosen: np.ndarray, image_ids: np.ndarray) -> np.ndarray:
+        """Images in which two accepted faces share their best candidate"""
+        accepted = np.nonzero(chosen >= 0)[0]
+        if accepted.size < 2:
+            return accepted[:0]
+        _, identities = np.unique(names[accepted, 0], return_inverse=True)
+        _, keys = np.unique(np.stack([image_ids[accepted], identities.ravel()], axis=1), axis=0, return_inverse=True)
+        counts = np.bincount(keys.ravel())
+        return np.unique(image_ids[accepted][counts[keys.ravel()] > 1])
+    
+    @staticmethod
+    def _assign(faces: np.ndarray, names: np.ndarray, scores: np.ndarray, finite: np.ndarray,
+                acceptable: np.ndarray, chosen: np.ndarray, margins: np.ndarray):
+        """Reassign one image's faces so no name is used twice, updating the margins of moved faces"""
+        from scipy.optimize import linear_sum_assignment
+        face_rows, columns = np.nonzero(acceptable[faces])
+        identities, identity_columns = np.unique(names[faces][face_rows, columns].astype(str), return_inverse=True)
+        # Unacceptable pairs get a weight no acceptable assignment would trade for
+        weights = np.full((len(faces), len(identities)), -1e6)
+        weights[face_rows, identity_columns] = scores[faces][face_rows, columns]
+        column_of = np.full((len(faces), len(identities)), -1)
+        column_of[face_rows, identity_columns] = columns
+        
+        assigned_rows, assigned_identities = linear_sum_assignment(-weights)
+        chosen[faces] = -1
+        keep = column_of[assigned_rows, assigned_identities] >= 0
+        chosen[faces[assigned_rows[keep]]] = column_of[assigned_rows[keep], assigned_identities[keep]]
+        
+        # A moved face competes only with the candidates no other face in the image took
+        moved = faces[chosen[faces] > 0]
+        if moved.size:
+            taken = identities[assigned_identities[keep]].astype(object)
+            rivals = np.where(np.isin(names[moved], taken), 0.0, finite[moved]).max(axis=1)
+            margins[moved] = scores[moved, chosen[moved]] - rivals
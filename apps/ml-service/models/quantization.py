@@ -0,0 +1,186 @@
+from abc import ABC, abstractmethod
+import numpy as np
+from typing import Optional
+
+CODECS = ('float16', 'int8', 'pq')
+
+class VectorCodec(ABC):
+    """Compact row encoding for normalized embeddings.
+
+    Rows are scored block by block: each block is widened to float32 just
+    before its GEMM, so search never holds a float32 copy of the gallery and
+    reads a half, a quarter or less of the bytes the float32 scan reads.
+    """
+    
+    trainable = False
+    block_rows = 4096
+    
+    @abstractmethod
+    def allocate(self, capacity: int, dim: int) -> np.ndarray:
+        """Empty storage for capacity encoded rows"""
+    
+    @abstractmethod
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Encode normalized (n, dim) rows, converting to float32 a block at a time"""
+    
+    @abstractmethod
+    def score(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Approximate (queries, rows) cosine similarities"""
+    
+    def train(self, vectors: np.ndarray):
+        pass
+    
+    def needs_training(self, rows: int, trained_rows: int) -> bool:
+        """Whether a gallery of rows, last trained at trained_rows, should be retrained"""
+        return False
+    
+    @property
+    def nbytes(self) -> int:
+        return 0
+
+class Float16Codec(VectorCodec):
+    """Half-precision rows: 2 bytes per dimension, ~1e-3 similarity error"""
+    
+    def allocate(self, capacity: int, dim: int) -> np.ndarray:
+        return np.empty((capacity, dim), dtype=np.float16)
+    
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.asarray(vectors, dtype=np.float16)
+    
+    def score(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        scores = np.empty((queries.shape[0], codes.shape[0]), dtype=np.float32)
+        for start in range(0, codes.shape[0], self.block_rows):
+            block = codes[start:start + self.block_rows].astype(np.float32)
+            scores[:, start:start + len(block)] = queries @ block.T
+        return scores
+
+class Int8Codec(VectorCodec):
+    """Symmetric int8 rows with one float32 scale per row: 1 byte per dimension"""
+    
+    def allocate(self, capacity: int, dim: int) -> np.ndarray:
+        return np.empty(capacity, dtype=self._row_dtype(dim))
+    
+    @staticmethod
+    def _row_dtype(dim: int) -> np.dtype:
+        return np.dtype([('code', np.int8, (dim,)), ('scale', np.float32)])
+    
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.empty(vectors.shape[0], dtype=self._row_dtype(vectors.shape[1]))
+        for start in range(0, vectors.shape[0], self.block_rows * 16):
+            block = np.asarray(vectors[start:start + self.block_rows * 16], dtype=np.float32)
+            scale = np.abs(block).max(axis=1) / 127.0
+            scale[scale == 0] = 1.0
+            codes['code'][start:start + len(block)] = np.rint(block / scale[:, None])
+            codes['scale'][start:start + len(block)] = scale
+        return codes
+    
+    def score(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        scores = np.empty((queries.shape[0], codes.shape[0]), dtype=np.float32)
+        for start in range(0, codes.shape[0], self.block_rows):
+            block = codes[start:start + self.block_rows]
+            scores[:, start:start + len(block)] = (queries @ block['code'].astype(np.float32).T) * block['scale']
+        return scores
+
+class ProductQuantizer(VectorCodec):
+    """Product quantization: each row is `subspaces` one-byte centroid ids.
+
+    The embedding is split into equal sub-vectors, each quantized against
+    its own k-means codebook of up to 256 centroids. A query is scored by
+    asymmetric distance computation: one lookup table of sub-vector dot
+    products per query, then one table lookup per code byte.
+    """
+    
+    trainable = True
+    
+    def __init__(self, subspaces: int = 64, iterations: int = 10, sample_size: int = 16384, seed: int = 0):
+        self.subspaces = subspaces
+        self.iterations = iterations
+        self.sample_size = sample_size
+        self.seed = seed
+        self.codebooks: Optional[np.ndarray] = None  # (subspaces, centroids, sub_dim)
+    
+    @property
+    def is_trained(self) -> bool:
+        return self.codebooks is not None
+    
+    @property
+    def nbytes(self) -> int:
+        return self.codebooks.nbytes if self.codebooks is not None else 0
+    
+    def needs_training(self, rows: int, trained_rows: int) -> bool:
+        # Doubling keeps retraining amortized O(1) per add; past a full sample the codebooks are settled
+        return not self.is_trained or (trained_rows < self.sample_size and rows >= 2 * trained_rows)
+    
+    def allocate(self, capacity: int, dim: int) -> np.ndarray:
+        return np.empty((capacity, self.subspaces), dtype=np.uint8)
+    
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        """(n, dim) -> (n, subspaces, sub_dim) float32"""
+        n, dim = vectors.shape
+        if dim % self.subspaces:
+            raise ValueError(f"Embedding size {dim} is not divisible into {self.subspaces} PQ subspaces")
+        return np.asarray(vectors, dtype=np.float32).reshape(n, self.subspaces, dim // self.subspaces)
+    
+    def train(self, vectors: np.ndarray):
+        """Fit one k-means codebook per subspace on a sample of the rows"""
+        rng = np.random.default_rng(self.seed)
+        n = vectors.shape[0]
+        sample = vectors if n <= self.sample_size else vectors[np.sort(rng.choice(n, self.sample_size, replace=False))]
+        parts = self._split(sample)
+        centroids = min(256, parts.shape[0])
+        
+        codebooks = parts[rng.choice(parts.shape[0], centroids, replace=False)].transpose(1, 0, 2).copy()
+        for _ in range(self.iterations):
+            assignments = self._assign_blocks(parts, codebooks)
+            for m in range(self.subspaces):
+                order = np.argsort(assignments[:, m], kind='stable')
+                counts = np.bincount(assignments[:, m], minlength=centroids)
+                occupied = counts > 0
+                starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[occupied]
+                # Empty centroids keep their previous position
+                codebooks[m, occupied] = np.add.reduceat(parts[order, m], starts, axis=0) / counts[occupied, None]
+        self.codebooks = codebooks
+    
+    def _assign_blocks(self, parts: np.ndarray, codebooks: np.ndarray) -> np.ndarray:
+        """Nearest centroid per subspace, the argmax of x.c - |c|^2 / 2, a block of rows at a time"""
+        by_subspace = np.ascontiguousarray(parts.transpose(1, 0, 2))
+        centroids_t = np.ascontiguousarray(codebooks.transpose(0, 2, 1))
+        half_norms = 0.5 * (codebooks ** 2).sum(axis=2)[:, None, :]
+        block_rows = max(1, self.block_rows // 4)
+        codes = np.empty(parts.shape[:2], dtype=np.uint8)
+        for start in range(0, parts.shape[0], block_rows):
+            # (subspaces, block, sub_dim) @ (subspaces, sub_dim, centroids) as one batched GEMM
+            dots = np.matmul(by_subspace[:, start:start + block_rows], centroids_t)
+            dots -= half_norms
+            codes[start:start + block_rows] = np.argmax(dots, axis=2).T
+        return codes
+    
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.empty((vectors.shape[0], self.subspaces), dtype=np.uint8)
+        for start in range(0, vectors.shape[0], self.block_rows):
+            codes[start:start + self.block_rows] = self._assign_blocks(
+                self._split(vectors[start:start + self.block_rows]), self.codebooks
+            )
+        return codes
+    
+    def score(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        # (queries, subspaces * centroids) table of sub-vector dot products
+        centroids = self.codebooks.shape[1]
+        tables = np.matmul(self._split(queries).transpose(1, 0, 2), self.codebooks.transpose(0, 2, 1))
+        tables = tables.transpose(1, 0, 2).reshape(queries.shape[0], -1)
+        offsets = (np.arange(self.subspaces) * centroids)[None, :]
+        
+        scores = np.empty((queries.shape[0], codes.shape[0]), dtype=np.float32)
+        for start in range(0, codes.shape[0], self.block_rows):
+            block = codes[start:start + self.block_rows].astype(np.intp) + offsets
+            scores[:, start:start + len(block)] = tables[:, block].sum(axis=2)
+        return scores
+
+def create_codec(name: str, pq_subspaces: int = 64) -> VectorCodec:
+    if name == 'float16':
+        return Float16Codec()
+    if name == 'int8':
+        return Int8Codec()
+    if name == 'pq':
+        return ProductQuantizer(subspaces=pq_subspaces)
+    raise ValueError(f"Unknown gallery codec: {name}")
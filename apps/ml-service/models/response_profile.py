@@ -0,0 +1,64 @@
+from typing import Mapping, Optional
+
+PROFILES = ('bbox', 'landmarks', 'crops')
+CROP_FORMATS = ('base64', 'multipart')
+
+class ResponseProfile:
+    """Which per-face fields a detection response should compute.
+
+    bbox       - bounding box and detection score only
+    landmarks  - bbox plus the five facial landmarks
+    crops      - landmarks plus a JPEG face crop, either base64 in the JSON
+                 or as separate binary parts of a multipart response
+
+    Work for fields that are not requested is skipped entirely.
+    """
+    
+    def __init__(self, profile: str = 'crops', crop_size: Optional[int] = None,
+                 crop_quality: int = 95, crop_format: str = 'base64'):
+        self.profile = profile
+        self.crop_size = crop_size
+        self.crop_quality = crop_quality
+        self.crop_format = crop_format
+    
+    @property
+    def include_landmarks(self) -> bool:
+        return self.profile in ('landmarks', 'crops')
+    
+    @property
+    def include_crops(self) -> bool:
+        return self.profile == 'crops'
+    
+    @property
+    def binary_crops(self) -> bool:
+        return self.include_crops and self.crop_format == 'multipart'
+    
+    @classmethod
+    def from_params(cls, params: Mapping[str, str], config) -> "ResponseProfile":
+        """Build a profile from request parameters, raising ValueError on invalid values"""
+        profile = params.get('profile', 'crops')
+        if profile not in PROFILES:
+            raise ValueError(f"profile must be one of {', '.join(PROFILES)}")
+        
+        crop_format = params.get('crop_format', 'base64')
+        if crop_format not in CROP_FORMATS:
+            raise ValueError(f"crop_format must be one of {', '.join(CROP_FORMATS)}")
+        
+        crop_size = params.get('crop_size')
+        if crop_size is not None:
+            try:
+                crop_size = int(crop_size)
+            except ValueError:
+                raise ValueError("crop_size must be an integer")
+            if not 16 <= crop_size <= config.MAX_CROP_SIZE:
+                raise ValueError(f"crop_size must be between 16 and {config.MAX_CROP_SIZE}")
+        
+        crop_quality = params.get('crop_quality', config.CROP_JPEG_QUALITY)
+        try:
+            crop_quality = int(crop_quality)
+        except ValueError:
+            raise ValueError("crop_quality must be an integer")
+        if not 1 <= crop_quality <= 100:
+            raise ValueError("crop_quality must be between 1 and 100")
+        
+        return cls(profile, crop_size, crop_quality, crop_format)
@@ -0,0 +1,126 @@
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from typing import Any, Optional, Tuple
+
+from utils.metrics import CACHE_REQUESTS
+
+class ResultCache:
+    """Byte-bounded LRU cache with a per-entry TTL.
+
+    Entries are invalidated wholesale with clear(). Each clear starts a new
+    generation; put() drops values computed under an older generation so a
+    result that raced with a gallery change is never cached.
+    """
+    
+    def __init__(self, name: str, max_bytes: int, ttl_seconds: float):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.generation = 0
+        self._entries: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                CACHE_REQUESTS.labels(cache=self.name, result='miss').inc()
+                return None
+            self._entries.move_to_end(key)
+        CACHE_REQUESTS.labels(cache=self.name, result='hit').inc()
+        return entry[2]
+    
+    def put(self, key: str, value: Any, size: int, generation: int):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, size, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.generation += 1
+    
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+class EmbeddingMatchCache:
+    """Reuses gallery candidates for query embeddings close to a recent query.
+
+    The most recent `capacity` normalized query embeddings and their k
+    candidate names and similarities are kept in ring buffers; a new query
+    whose cosine distance to one of them is within `radius` gets that
+    query's candidates without a gallery search.
+    """
+    
+    def __init__(self, name: str, capacity: int, radius: float, k: int):
+        self.name = name
+        self.capacity = capacity
+        self.min_similarity = 1.0 - radius
+        self.k = k
+        self.generation = 0
+        self._embeddings: Optional[np.ndarray] = None
+        self._names = np.full((capacity, k), '', dtype=object)
+        self._scores = np.full((capacity, k), -np.inf, dtype=np.float32)
+        self._filled = 0
+        self._next = 0
+        self._lock = threading.Lock()
+    
+    def lookup(self, queries: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Hit mask per normalized query row, with cached (queries, k) names and similarities for the hits"""
+        names = np.full((len(queries), self.k), '', dtype=object)
+        scores = np.full((len(queries), self.k), -np.inf, dtype=np.float32)
+        hits = np.zeros(len(queries), dtype=bool)
+        with self._lock:
+            if self._filled:
+                similarities = queries @ self._embeddings[:self._filled].T
+                best = np.argmax(similarities, axis=1)
+                hits = similarities[np.arange(len(queries)), best] >= self.min_similarity
+                names[hits] = self._names[best[hits]]
+                scores[hits] = self._scores[best[hits]]
+        
+        hit_count = int(hits.sum())
+        if hit_count:
+            CACHE_REQUESTS.labels(cache=self.name, result='hit').inc(hit_count)
+        if len(queries) - hit_count:
+            CACHE_REQUESTS.labels(cache=self.name, result='miss').inc(len(queries) - hit_count)
+        return hits, names, scores
+    
+    def put(self, queries: np.ndarray, names: np.ndarray, scores: np.ndarray, generation: int):
+        # Only the newest capacity rows would survive the ring anyway
+        queries, names, scores = queries[-self.capacity:], names[-self.capacity:], scores[-self.capacity:]
+        with self._lock:
+            if generation != self.generation:
+                return
+            if self._embeddings is None:
+                self._embeddings = np.empty((self.capacity, queries.shape[1]), dtype=np.float32)
+            slots = (self._next + np.arange(len(queries))) % self.capacity
+            self._embeddings[slots] = queries
+            self._names[slots] = names
+            self._scores[slots] = scores
+            self._next = (self._next + len(queries)) % self.capacity
+            self._filled = min(self._filled + len(queries), self.capacity)
+    
+    def clear(self):
+        with self._lock:
+            self._filled = 0
+            self._next = 0
+            self.generation += 1
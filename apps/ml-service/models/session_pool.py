@@ -0,0 +1,120 @@
+import os
+import queue
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional
+
+def server_workers(config) -> int:
+    """Server processes sharing the machine: WEB_CONCURRENCY (set by gunicorn.conf.py) or SERVER_WORKERS"""
+    return max(1, int(os.environ.get('WEB_CONCURRENCY') or config.SERVER_WORKERS or 1))
+
+def process_cores(config) -> int:
+    """This process's share of the cores when they are split evenly across the server's workers"""
+    return max(1, (os.cpu_count() or 1) // server_workers(config))
+
+def resolve_thread_settings(config) -> tuple:
+    """Return (pool_size, intra_op_threads, inter_op_threads) sized to this process's cores.
+
+    Unset values are derived so pool_size * intra_op_threads does not exceed
+    the process's share of the cores, which keeps concurrent sessions, and
+    concurrent worker processes, from oversubscribing.
+    """
+    cores = process_cores(config)
+    intra_op_threads = config.ORT_INTRA_OP_THREADS
+    pool_size = config.MODEL_POOL_SIZE
+    
+    if intra_op_threads is None and pool_size is None:
+        intra_op_threads = min(2, cores)
+    if intra_op_threads is None:
+        intra_op_threads = max(1, cores // pool_size)
+    if pool_size is None:
+        pool_size = max(1, cores // intra_op_threads)
+    
+    inter_op_threads = config.ORT_INTER_OP_THREADS or 1
+    return pool_size, intra_op_threads, inter_op_threads
+
+def _session_options(intra_op_threads: int, inter_op_threads: int, pinned_cores: Optional[List[int]]):
+    """Build ONNX Runtime session options for one pool slot"""
+    import onnxruntime
+    
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = intra_op_threads
+    options.inter_op_num_threads = inter_op_threads
+    options.execution_mode = (onnxruntime.ExecutionMode.ORT_PARALLEL if inter_op_threads > 1
+                              else onnxruntime.ExecutionMode.ORT_SEQUENTIAL)
+    
+    if pinned_cores:
+        # Spinning threads pinned to dedicated cores only burn CPU that others cannot use
+        options.add_session_config_entry('session.intra_op.allow_spinning', '0')
+        if len(pinned_cores) > 1:
+            # One entry per intra-op worker thread (the calling thread is not pinned); ids are 1-based
+            affinities = ';'.join(str(core + 1) for core in pinned_cores[1:])
+            options.add_session_config_entry('session.intra_op_thread_affinities', affinities)
+    
+    return options
+
+def create_face_analysis(config, slot: int = 0):
+    """Create a prepared FaceAnalysis whose ONNX sessions use the configured thread settings"""
+    import insightface
+    import onnxruntime
+    
+    face_analysis_model = insightface.app.FaceAnalysis(
+        providers=config.PROVIDERS,
+        allowed_modules=config.ALLOWED_MODULES
+    )
+    face_analysis_model.prepare(ctx_id=config.CTX_ID, det_size=config.DETECTION_SIZE)
+    
+    _, intra_op_threads, inter_op_threads = resolve_thread_settings(config)
+    pinned_cores = None
+    # Workers do not know their index, so pinning would stack every worker on the same cores
+    if config.ORT_SESSION_PINNING and server_workers(config) == 1:
+        cores = os.cpu_count() or 1
+        first = (slot * intra_op_threads) % cores
+        pinned_cores = [(first + i) % cores for i in range(intra_op_threads)]
+    options = _session_options(intra_op_threads, inter_op_threads, pinned_cores)
+    
+    # insightface does not expose session options, so rebuild each model's session with them
+    for model in face_analysis_model.models.values():
+        model_file = getattr(model, 'model_file', None)
+        if model_file and hasattr(model, 'session'):
+            model.session = onnxruntime.InferenceSession(model_file, sess_options=options, providers=config.PROVIDERS)
+    
+    return face_analysis_model
+
+class ModelSessionPool:
+    """Fixed set of independent model instances checked out one request at a time.
+
+    Each instance owns its ONNX Runtime sessions, so concurrent requests run
+    in parallel on different instances instead of sharing one.
+    """
+    
+    def __init__(self, factory: Callable[[int], object], size: int):
+        self.size = size
+        self._models = [factory(slot) for slot in range(size)]
+        self._available: "queue.Queue[object]" = queue.Queue()
+        for model in self._models:
+            self._available.put(model)
+    
+    def __len__(self) -> int:
+        return self.size
+    
+    @property
+    def instances(self) -> List[object]:
+        """All instances, for one-off work such as warm-up before the pool serves traffic"""
+        return list(self._models)
+    
+    @property
+    def primary(self):
+        """First instance, for reading static attributes shared by all instances"""
+        return self._models[0]
+    
+    @contextmanager
+    def acquire(self, timeout: Optional[float] = None) -> Iterator[object]:
+        """Check out a model instance, blocking until one is free"""
+        try:
+            model = self._available.get(timeout=timeout)
+        except queue.Empty:
+            raise Exception("Timed out waiting for a free model session")
+        try:
+            yield model
+        finally:
+            self._available.put(model)
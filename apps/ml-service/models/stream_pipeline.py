@@ -0,0 +1,147 @@
+import time
+import cv2
+import numpy as np
+from typing import Dict, Iterator, List, Optional
+
+from .face_tracker import FaceTracker, Track
+
+class StreamRecognizer:
+    """Attendance recognition over a video file or stream.
+
+    Detection runs every `stride` frames; in between, faces are carried
+    forward by a Kalman/IoU tracker. A track is sent for recognition when it
+    first appears, when its identity confidence has decayed below
+    min_track_confidence, or (for unknown faces) every unknown_retry_frames.
+    Each person produces at most one attendance event per cooldown window.
+    """
+    
+    def __init__(self, face_model, config, stride: Optional[int] = None, group: Optional[str] = None):
+        self.face_model = face_model
+        self.config = config
+        self.group = group
+        self.stride = max(1, stride or config.STREAM_DETECTION_STRIDE)
+        self.tracker = FaceTracker(
+            iou_threshold=config.STREAM_IOU_THRESHOLD,
+            max_age=config.STREAM_MAX_TRACK_AGE
+        )
+        self.frames_processed = 0
+        self.detections_run = 0
+        self.recognitions_run = 0
+        self.frames_failed = 0
+        self._last_event_time: Dict[str, float] = {}
+    
+    def stats(self) -> Dict:
+        return {
+            "frames_processed": self.frames_processed,
+            "detections_run": self.detections_run,
+            "faces_recognized": self.recognitions_run,
+            "tracks_created": self.tracker.tracks_created,
+            "frames_failed": self.frames_failed
+        }
+    
+    def run(self, source: str, max_frames: Optional[int] = None,
+            heartbeat_seconds: Optional[float] = None,
+            max_seconds: Optional[float] = None) -> Iterator[Optional[Dict]]:
+        """Read frames from source and yield deduplicated attendance events.
+
+        With heartbeat_seconds, None is yielded whenever that long has passed
+        without an event, so a streaming caller can report progress. With
+        max_seconds, reading stops once that much wall time has passed. A
+        frame that fails to process is counted in frames_failed and skipped.
+        """
+        capture = cv2.VideoCapture(source)
+        if not capture.isOpened():
+            raise Exception(f"Could not open video source: {source}")
+        
+        fps = capture.get(cv2.CAP_PROP_FPS) or 0.0
+        started_at = time.time()
+        last_yield = started_at
+        try:
+            while max_frames is None or self.frames_processed < max_frames:
+                if max_seconds is not None and time.time() - started_at >= max_seconds:
+                    break
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                
+                frame_index = self.frames_processed
+                self.frames_processed += 1
+                # File sources report their own position; live streams fall back to wall time
+                timestamp = frame_index / fps if fps > 0 else time.time() - started_at
+                
+                try:
+                    events = self.process_frame(frame, frame_index, timestamp)
+                except Exception as e:
+                    self.frames_failed += 1
+                    print(f"Skipping frame {frame_index}: {e}")
+                    events = []
+                
+                if events:
+                    last_yield = time.time()
+                    yield from events
+                elif heartbeat_seconds and time.time() - last_yield >= heartbeat_seconds:
+                    last_yield = time.time()
+                    yield None
+        finally:
+            capture.release()
+    
+    def process_frame(self, frame: np.ndarray, frame_index: int, timestamp: float) -> List[Dict]:
+        """Advance the tracker by one frame and return any new attendance events"""
+        self.tracker.predict()
+        for track in self.tracker.tracks:
+            if track.recognized:
+                track.decay(self.config.STREAM_CONFIDENCE_DECAY)
+        
+        if frame_index % self.stride != 0:
+            return []
+        
+        faces = self.face_model.detect_face_objects(frame)
+        self.detections_run += 1
+        bboxes = np.array([face.bbox for face in faces], dtype=np.float64).reshape(-1, 4)
+        scores = np.array([face.det_score for face in faces], dtype=np.float64)
+        kpss = np.array([face.kps for face in faces]) if faces else None
+        matched_tracks, new_tracks = self.tracker.update(bboxes, scores, kpss)
+        
+        pending = new_tracks + [track for track in matched_tracks if self._needs_recognition(track)]
+        if not pending:
+            return []
+        
+        return self._recognize_tracks(frame, pending, frame_index, timestamp)
+    
+    def _needs_recognition(self, track: Track) -> bool:
+        if not track.recognized:
+            return True
+        if track.name is None:
+            return track.frames_since_recognition >= self.config.STREAM_UNKNOWN_RETRY_FRAMES
+        return track.identity_confidence < self.config.STREAM_MIN_TRACK_CONFIDENCE
+    
+    def _recognize_tracks(self, frame: np.ndarray, tracks: List[Track], frame_index: int, timestamp: float) -> List[Dict]:
+        """Embed and match the given tracks' latest detections, emitting events for known people"""
+        from insightface.app.common import Face
+        
+        faces = [Face(bbox=track.bbox.astype(np.float32), kps=track.kps, det_score=track.det_score) for track in tracks]
+        matches, embedded = self.face_model.match_faces(frame, faces, group=self.group)
+        # Faces the quality gate rejected never reach the recognition model
+        self.recognitions_run += embedded
+        
+        events = []
+        for track, match in zip(tracks, matches):
+            if match is None:
+                track.assign_identity(None, 0.0)
+                continue
+            
+            track.assign_identity(match["name"], match["confidence"])
+            last_event_time = self._last_event_time.get(match["name"])
+            if last_event_time is not None and timestamp - last_event_time < self.config.STREAM_EVENT_COOLDOWN_SECONDS:
+                continue
+            
+            self._last_event_time[match["name"]] = timestamp
+            events.append({
+                "person_name": match["name"],
+                "confidence": match["confidence"],
+                "timestamp": timestamp,
+                "frame": frame_index,
+                "track_id": track.track_id,
+                "bbox": track.bbox.astype(int).tolist()
+            })
+        return events
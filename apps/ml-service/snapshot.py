@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Gallery snapshot tool: move a gallery between instances without running
+the models, so a new replica starts from a primary's embeddings.
+
+Run from apps/ml-service:
+    python snapshot.py export gallery.tar [--group <id>]
+    python snapshot.py import gallery.tar [--group <id>]
+    python snapshot.py delta <since> delta.json [--group <id>]
+    python snapshot.py apply delta.json [--group <id>]
+    python snapshot.py pull --source http://primary:5001 [--token <secret>] [--group <id>]
+
+Works on the local embedding store; running workers pick the change up on
+their next store poll (GALLERY_RELOAD_INTERVAL_SECONDS).
+"""
+
+import argparse
+import json
+import sys
+
+from config import get_config
+from models.gallery import Gallery, validate_group
+from models.gallery_snapshot import GallerySync
+
+def load_gallery(config, group):
+    gallery = Gallery(config, None, validate_group(group))
+    gallery.load_stored()
+    return gallery
+
+def main():
+    parser = argparse.ArgumentParser(description="Export, import and sync gallery snapshots")
+    parser.add_argument('--group', help="Gallery group; the default gallery if omitted")
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export', help="Write the gallery snapshot to a file")
+    export_parser.add_argument('path')
+    import_parser = commands.add_parser('import', help="Replace the gallery with a snapshot file")
+    import_parser.add_argument('path')
+    delta_parser = commands.add_parser('delta', help="Write the changes after a version to a file")
+    delta_parser.add_argument('since', type=int)
+    delta_parser.add_argument('path')
+    apply_parser = commands.add_parser('apply', help="Apply a delta file")
+    apply_parser.add_argument('path')
+    pull_parser = commands.add_parser('pull', help="Catch up with a primary instance")
+    pull_parser.add_argument('--source', required=True, help="Base URL of the primary")
+    pull_parser.add_argument('--token', help="The primary's GALLERY_SYNC_TOKEN; defaults to this instance's")
+    args = parser.parse_args()
+    
+    config = get_config()
+    gallery = load_gallery(config, args.group)
+    if args.command == 'export':
+        with open(args.path, 'wb') as f:
+            version = gallery.export_snapshot(f)
+        print(f"Exported {len(gallery)} people at version {version} to {args.path}")
+    elif args.command == 'import':
+        with open(args.path, 'rb') as f:
+            result = gallery.import_snapshot(f)
+        print(f"Imported {result['people']} people at version {result['version']}")
+    elif args.command == 'delta':
+        delta = gallery.export_delta(args.since)
+        if delta is None:
+            print(f"Changes since version {args.since} are no longer available; export a snapshot instead")
+            return 1
+        with open(args.path, 'w') as f:
+            json.dump(delta, f)
+        print(f"Exported {len(delta['operations'])} changes up to version {delta['to_version']}")
+    elif args.command == 'apply':
+        with open(args.path) as f:
+            applied = gallery.apply_delta(json.load(f))
+        print(f"Applied {applied} changes, gallery is at version {gallery.version}")
+    elif args.command == 'pull':
+        method = GallerySync(args.source, args.token or config.GALLERY_SYNC_TOKEN).pull(gallery)
+        print(f"Pulled gallery by {method}, now at version {gallery.version}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
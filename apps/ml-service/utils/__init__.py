@@ -0,0 +1,7 @@
+from .image_io import decode_image, read_jpeg_size
+from .metrics import StageTimer
+from .profiling import RequestProfiler
+from .streaming import requested_stream_format, streaming_response
+
+__all__ = ['decode_image', 'read_jpeg_size', 'StageTimer', 'RequestProfiler',
+           'requested_stream_format', 'streaming_response']
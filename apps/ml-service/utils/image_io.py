@@ -0,0 +1,68 @@
+import cv2
+import numpy as np
+from typing import Optional, Tuple
+
+# Reduced decode flags supported by libjpeg, keyed by downscale factor
+_REDUCED_DECODE_FLAGS = {
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+}
+
+# JPEG start-of-frame markers that carry the image dimensions
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+def read_jpeg_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """Return (width, height) from a JPEG header without decoding pixels"""
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    
+    offset = 2
+    length = len(data)
+    while offset + 4 <= length:
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        # Padding bytes and standalone markers have no length field
+        if marker == 0xFF:
+            offset += 1
+            continue
+        if marker in (0x01,) or 0xD0 <= marker <= 0xD7:
+            offset += 2
+            continue
+        segment_length = (data[offset + 2] << 8) | data[offset + 3]
+        if marker in _JPEG_SOF_MARKERS:
+            if offset + 9 > length:
+                return None
+            height = (data[offset + 5] << 8) | data[offset + 6]
+            width = (data[offset + 7] << 8) | data[offset + 8]
+            return width, height
+        offset += 2 + segment_length
+    
+    return None
+
+def decode_image(data: bytes, max_dimension: Optional[int] = None) -> Tuple[Optional[np.ndarray], int]:
+    """Decode an encoded image buffer into a BGR array.
+
+    When max_dimension is set and the buffer is a JPEG whose longest side
+    exceeds it, libjpeg's DCT scaling is used so only a 1/2, 1/4 or 1/8
+    resolution image is decoded. Returns the image and the downscale factor
+    so callers can map coordinates back to the original resolution.
+    """
+    if not data:
+        return None, 1
+    
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    
+    if max_dimension:
+        size = read_jpeg_size(data)
+        if size is not None:
+            longest_side = max(size)
+            for factor, flag in _REDUCED_DECODE_FLAGS.items():
+                if longest_side // factor >= max_dimension:
+                    image = cv2.imdecode(buffer, flag)
+                    if image is not None:
+                        return image, factor
+                    break
+    
+    return cv2.imdecode(buffer, cv2.IMREAD_COLOR), 1
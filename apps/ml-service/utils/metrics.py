@@ -0,0 +1,87 @@
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict
+from prometheus_client import Counter, Gauge, Histogram
+
+# Module-level so each metric is registered once per process
+CACHE_REQUESTS = Counter(
+    'result_cache_requests_total',
+    'Result cache lookups by cache and outcome',
+    ['cache', 'result']
+)
+
+STAGE_DURATION = Histogram(
+    'pipeline_stage_duration_seconds',
+    'Time spent in each request pipeline stage',
+    ['stage', 'faces'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+
+GALLERY_SIZE = Gauge('gallery_size', 'Identities in the live gallery index')
+
+GALLERY_GROUPS_LOADED = Gauge('gallery_groups_loaded', 'Group galleries currently held in memory')
+
+GALLERY_MEMORY = Gauge('gallery_memory_bytes', 'Approximate memory held by loaded gallery indexes')
+
+GALLERY_EVICTIONS = Counter('gallery_evictions_total', 'Group galleries evicted to stay under the memory budget')
+
+# Every result other than 'accepted' is a recognition model call the quality gate avoided
+FACE_QUALITY_CHECKS = Counter(
+    'face_quality_checks_total',
+    'Faces checked by the quality gate before embedding, by stage and result',
+    ['stage', 'result']
+)
+
+ATTENDANCE_SIGHTINGS = Counter('attendance_sightings_total', 'Attendance records merged into session presences')
+
+ATTENDANCE_RECORDS_FLUSHED = Counter('attendance_records_flushed_total', 'Presence records exported by attendance flushes')
+
+PROCESS_RSS = Gauge('process_rss_bytes', 'Resident set size of the service process')
+
+def face_count_bucket(faces: int) -> str:
+    """Bucket a face count so the 'faces' label stays low-cardinality"""
+    if faces <= 1:
+        return str(max(faces, 0))
+    if faces <= 4:
+        return '2-4'
+    if faces <= 16:
+        return '5-16'
+    return '17+'
+
+def current_rss_bytes() -> int:
+    """Current resident set size, or the peak where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is KiB on Linux and bytes on macOS
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+PROCESS_RSS.set_function(current_rss_bytes)
+
+class StageTimer:
+    """Accumulates per-stage durations and records them once the face count is known"""
+    
+    def __init__(self):
+        self.durations: Dict[str, float] = {}
+    
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+    
+    def record(self, name: str, duration: float):
+        self.durations[name] = self.durations.get(name, 0.0) + duration
+    
+    def observe(self, faces: int):
+        bucket = face_count_bucket(faces)
+        for name, duration in self.durations.items():
+            STAGE_DURATION.labels(stage=name, faces=bucket).observe(duration)
+        self.durations.clear()
@@ -0,0 +1,66 @@
+import cProfile
+import itertools
+import os
+import time
+from typing import Any, Optional
+
+try:
+    from pyinstrument import Profiler as PyinstrumentProfiler
+except ImportError:
+    PyinstrumentProfiler = None
+
+class RequestProfiler:
+    """Opt-in sampling profiler that writes one report per profiled request.
+
+    A request is profiled when it is the Nth since the last sample
+    (sample_every > 0) or, if header_enabled, when it carries 'X-Profile: 1'.
+    Reports use pyinstrument (HTML) when installed and cProfile (.prof) otherwise.
+    Only the request thread is profiled; work handed to the micro-batcher or
+    job queue shows up as time spent waiting.
+    """
+    
+    HEADER = 'X-Profile'
+    
+    def __init__(self, sample_every: int, header_enabled: bool, output_dir: str):
+        self.sample_every = sample_every
+        self.header_enabled = header_enabled
+        self.output_dir = output_dir
+        self._requests = itertools.count(1)
+    
+    @property
+    def enabled(self) -> bool:
+        return self.sample_every > 0 or self.header_enabled
+    
+    def should_profile(self, headers) -> bool:
+        if self.header_enabled and headers.get(self.HEADER, '').lower() in ('1', 'true', 'yes'):
+            return True
+        return self.sample_every > 0 and next(self._requests) % self.sample_every == 0
+    
+    def start(self) -> Any:
+        """Start profiling the current thread and return the session"""
+        if PyinstrumentProfiler is not None:
+            session = PyinstrumentProfiler()
+            session.start()
+        else:
+            session = cProfile.Profile()
+            session.enable()
+        return session
+    
+    def finish(self, session: Any, name: str) -> Optional[str]:
+        """Stop a session and write its report, returning the report path"""
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            stem = os.path.join(self.output_dir, f"{int(time.time() * 1000)}-{os.getpid()}-{name}")
+            if isinstance(session, cProfile.Profile):
+                session.disable()
+                path = f"{stem}.prof"
+                session.dump_stats(path)
+            else:
+                session.stop()
+                path = f"{stem}.html"
+                with open(path, 'w') as f:
+                    f.write(session.output_html())
+            return path
+        except Exception as e:
+            print(f"Error writing profile report: {e}")
+            return None
@@ -0,0 +1,48 @@
+import json
+from typing import Dict, Iterable, Iterator, Optional
+
+from flask import Response, stream_with_context
+
+# Streaming response formats and their content types
+STREAM_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'sse': 'text/event-stream',
+}
+
+def requested_stream_format(value: Optional[str], accept_mimetypes) -> Optional[str]:
+    """Streaming format asked for by a 'stream' parameter or the Accept header; None for one JSON document"""
+    if value:
+        if value not in STREAM_FORMATS:
+            raise ValueError(f"stream must be one of {', '.join(STREAM_FORMATS)}")
+        return value
+    # Only an explicit Accept entry counts; '*/*' keeps the JSON document
+    accepted = set(accept_mimetypes.values())
+    for stream_format, mimetype in STREAM_FORMATS.items():
+        if mimetype in accepted:
+            return stream_format
+    return None
+
+def encode_record(record: Dict, stream_format: str) -> bytes:
+    """One NDJSON line, or one server-sent event named after the record's type"""
+    data = json.dumps(record, separators=(',', ':'))
+    if stream_format == 'sse':
+        return f"event: {record.get('type', 'message')}\ndata: {data}\n\n".encode()
+    return f"{data}\n".encode()
+
+def streaming_response(records: Iterable[Dict], stream_format: str) -> Response:
+    """Send records as they are produced.
+
+    WSGI servers pull the next chunk only after writing the previous one to
+    the socket, so a slow client holds the producer back instead of results
+    piling up in memory. Flask closes uploaded files when the view returns,
+    so producers must take over any upload streams they still need.
+    """
+    def generate() -> Iterator[bytes]:
+        for record in records:
+            yield encode_record(record, stream_format)
+    
+    response = Response(stream_with_context(generate()), mimetype=STREAM_FORMATS[stream_format])
+    response.headers['Cache-Control'] = 'no-cache'
+    # Reverse proxies such as nginx would otherwise buffer the whole response
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
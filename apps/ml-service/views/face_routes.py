@@ -1,25 +1,75 @@
-from flask import Flask, jsonify
+import os
+import time
+from flask import Flask, Response, g, jsonify, request
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from prometheus_client import generate_latest
 from controllers.face_controller import FaceController
 from models.face_model import FaceModel
 from config import get_config
+from utils import RequestProfiler
+from utils.metrics import STAGE_DURATION, face_count_bucket
 
-def create_app(config_name=None):
-    """Application factory pattern"""
+class TimedJSONProvider(DefaultJSONProvider):
+    """JSON provider that records response serialization as a pipeline stage"""
+    
+    def response(self, *args, **kwargs):
+        start = time.perf_counter()
+        response = super().response(*args, **kwargs)
+        payload = args[0] if len(args) == 1 else kwargs
+        faces = payload.get("total_faces", payload.get("faces_detected", 0)) if isinstance(payload, dict) else 0
+        STAGE_DURATION.labels(stage='serialization', faces=face_count_bucket(faces)).observe(time.perf_counter() - start)
+        return response
+
+def start_model_loading(face_model: FaceModel, config):
+    """Initialize the face analysis model, in the background unless configured otherwise"""
+    if config.BACKGROUND_MODEL_LOADING:
+        face_model.initialize_in_background()
+    elif not face_model.initialize_model():
+        print("Warning: Face model initialization failed")
+
+def create_app(config_name=None, defer_model_loading=False):
+    """Application factory pattern.
+
+    With defer_model_loading the models are not loaded here; the caller
+    starts loading later, e.g. in each worker after a pre-fork server forks.
+    """
     config = get_config(config_name)
     
     app = Flask(__name__)
     app.config.from_object(config)
+    app.json = TimedJSONProvider(app)
     CORS(app)
     
+    # Optional sampling profiler; reports are written per profiled request
+    request_profiler = RequestProfiler(
+        sample_every=config.PROFILING_SAMPLE_EVERY,
+        header_enabled=config.PROFILING_HEADER_ENABLED,
+        output_dir=config.PROFILING_OUTPUT_DIR
+    )
+    
+    @app.before_request
+    def start_profiler():
+        if request_profiler.enabled and request.path != '/metrics' and request_profiler.should_profile(request.headers):
+            g.profile_session = request_profiler.start()
+    
+    @app.after_request
+    def finish_profiler(response):
+        session = g.pop('profile_session', None)
+        if session is not None:
+            path = request_profiler.finish(session, request.endpoint or 'request')
+            if path:
+                response.headers['X-Profile-Report'] = os.path.basename(path)
+        return response
+    
     # Initialize model and controller
     face_model = FaceModel(config_name)
     face_controller = FaceController(face_model, config_name)
     
-    # Initialize the face analysis model
-    if not face_model.initialize_model():
-        print("Warning: Face model initialization failed")
+    app.extensions['face_model'] = face_model
+    
+    if not defer_model_loading:
+        start_model_loading(face_model, config)
     
     # Health check route
     @app.route('/health', methods=['GET'])
@@ -27,10 +77,25 @@ def create_app(config_name=None):
         result = face_controller.health_check()
         return jsonify(result)
     
+    @app.route('/health/live', methods=['GET'])
+    def liveness():
+        result = face_controller.liveness()
+        return jsonify(result)
+    
+    @app.route('/health/ready', methods=['GET'])
+    def readiness():
+        result = face_controller.readiness()
+        if isinstance(result, tuple):
+            data, status_code = result
+            return jsonify(data), status_code
+        return jsonify(result)
+    
     # Face detection route
     @app.route('/detect_faces', methods=['POST'])
     def detect_faces():
         result = face_controller.detect_faces()
+        if isinstance(result, Response):
+            return result
         if isinstance(result, tuple):
             data, status_code = result
             return jsonify(data), status_code
@@ -45,6 +110,45 @@ def create_app(config_name=None):
             return jsonify(data), status_code
         return jsonify(result)
     
+    # Batch face recognition route
+    @app.route('/recognize_faces/batch', methods=['POST'])
+    def recognize_faces_batch():
+        result = face_controller.recognize_faces_batch()
+        if isinstance(result, Response):
+            return result
+        if isinstance(result, tuple):
+            data, status_code = result
+            return jsonify(data), status_code
+        return jsonify(result)
+    
+    # Video stream recognition route
+    @app.route('/stream/recognize', methods=['POST'])
+    def recognize_stream():
+        result = face_controller.recognize_stream()
+        if isinstance(result, Response):
+            return result
+        if isinstance(result, tuple):
+            data, status_code = result
+            return jsonify(data), status_code
+        return jsonify(result)
+    
+    # Attendance session routes
+    @app.route('/attendance/<session_id>', methods=['GET'])
+    def get_attendance(session_id):
+        result = face_controller.get_attendance(session_id)
+        if isinstance(result, tuple):
+            data, status_code = result
+            return jsonify(data), status_code
+        return jsonify(result)
+    
+    @app.route('/attendance/flush', methods=['POST'])
+    def flush_attendance():
+        result = face_controller.flush_attendance()
+        if isinstance(result, tuple):
+            data, status_code = result
+            return jsonify(data), status_code
+        return jsonify(result)
+    
     # Dataset management routes
     @app.route('/dataset/add', methods=['POST'])
     def add_to_dataset():
@@ -54,6 +158,38 @@ def create_app(config_name=None):
             return jsonify(data), status_code
         return jsonify(result)
     
+    @app.route('/dataset/<person_name>', methods=['DELETE'])
+    def delete_person(person_name):
+        result = face_controller.delete_person(person_name)
+        if isinstance(result, tuple):
+            data, status_code = result
+            return jsonify(data), status_code
+        return jsonify(result)
+    
+    @app.route('/dataset/<person_name>/images/<filename>', methods=['DELETE'])
+    def remove_person_image(person_name, filename):
+        result = face_controller.remove_person_image(person_name, filename)
+        if isinstance(result, tuple):
+            data, status_code = result
+            return jsonify(data), status_code
+        return jsonify(result)
+    
+    @app.route('/dataset/<person_name>/images/<filename>', methods=['PUT'])
+    def replace_person_image(person_name, filename):
+        result = face_controller.replace_person_image(person_name, filename)
+        if isinstance(result, tuple):
+            data, status_code = result
+            return jsonify(data), status_code
+        return jsonify(result)
+    
+    @app.route('/dataset/<person_name>/rename', methods=['POST'])
+    def rename_person(person_name):
+        result = face_controller.rename_person(person_name)
+        if isinstance(result, tuple):
+            data, status_code = result
+            return jsonify(data), status_code
+        return jsonify(result)
+    
     @app.route('/dataset/list', methods=['GET'])
     def list_dataset():
         result = face_controller.list_dataset()
@@ -70,10 +206,61 @@ def create_app(config_name=None):
             return jsonify(data), status_code
         return jsonify(result)
     
+    # Gallery replication routes
+    @app.route('/gallery/version', methods=['GET'])
+    def gallery_version():
+        result = face_controller.gallery_version()
+        if isinstance(result, tuple):
+            data, status_code = result
+            return jsonify(data), status_code
+        return jsonify(result)
+    
+    @app.route('/gallery/snapshot', methods=['GET'])
+    def export_gallery_snapshot():
+        result = face_controller.export_gallery_snapshot()
+        if isinstance(result, Response):
+            return result
+        if isinstance(result, tuple):
+            data, status_code = result
+            return jsonify(data), status_code
+        return jsonify(result)
+    
+    @app.route('/gallery/snapshot', methods=['POST'])
+    def import_gallery_snapshot():
+        result = face_controller.import_gallery_snapshot()
+        if isinstance(result, tuple):
+            data, status_code = result
+            return jsonify(data), status_code
+        return jsonify(result)
+    
+    @app.route('/gallery/delta', methods=['GET'])
+    def export_gallery_delta():
+        result = face_controller.export_gallery_delta()
+        if isinstance(result, tuple):
+            data, status_code = result
+            return jsonify(data), status_code
+        return jsonify(result)
+    
+    @app.route('/gallery/delta', methods=['POST'])
+    def apply_gallery_delta():
+        result = face_controller.apply_gallery_delta()
+        if isinstance(result, tuple):
+            data, status_code = result
+            return jsonify(data), status_code
+        return jsonify(result)
+    
+    # Background job status route
+    @app.route('/jobs/<job_id>', methods=['GET'])
+    def get_job(job_id):
+        result = face_controller.get_job(job_id)
+        if isinstance(result, tuple):
+            data, status_code = result
+            return jsonify(data), status_code
+        return jsonify(result)
+    
     # Prometheus metrics route
     @app.route('/metrics', methods=['GET'])
     def metrics():
-        from flask import Response
         return Response(generate_latest(), mimetype='text/plain')
     
     return app 
\ No newline at end of file
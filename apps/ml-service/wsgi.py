@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Face Recognition Service - production WSGI entry point
+Served by gunicorn with the settings in gunicorn.conf.py:
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+With SERVER_PRELOAD the master imports the libraries, builds the app and
+loads the default gallery once, and workers share those pages copy-on-write
+after fork. The embedding matrix is memory-mapped, so workers share it
+through the page cache either way. ONNX Runtime sessions own thread pools
+that do not survive fork, so each worker creates its own in start_worker().
+"""
+
+import os
+
+import cv2
+
+from config import get_config
+from models.session_pool import process_cores
+from views import create_app
+from views.face_routes import start_model_loading
+
+config_name = os.environ.get('FLASK_ENV', 'production')
+app = create_app(config_name, defer_model_loading=True)
+face_model = app.extensions['face_model']
+face_model.preload_gallery()
+
+def start_worker():
+    """Finish loading in a worker process: size OpenCV's thread pool and create the model sessions"""
+    config = get_config(config_name)
+    cv2.setNumThreads(process_cores(config))
+    start_model_loading(face_model, config)